@@ -0,0 +1,341 @@
+"""
+Audio decoding helpers that work on in-memory bytes.
+
+Whisper expects mono 16 kHz float32 samples. Raw 16 kHz PCM is converted
+with NumPy directly; anything else (Opus in Ogg/WebM, other sample rates)
+is piped through an ffmpeg subprocess that writes float32 samples to stdout.
+
+Uploads are streamed straight into ffmpeg's stdin as they arrive
+(`decode_stream`), so nothing is written to disk and the size and duration
+limits are enforced while the body is still coming in.
+
+ffmpeg's stderr is drained while it runs, keeping only the last
+FFMPEG_STDERR_TAIL_BYTES for the error message: a damaged file can make it
+log far more than a pipe holds, and a full stderr pipe stalls ffmpeg and,
+with it, every write to its stdin.
+
+Configuration (environment):
+    MAX_UPLOAD_BYTES              largest accepted upload (default 500 MB)
+    MAX_AUDIO_SECONDS             longest accepted recording (default 3 hours)
+    AUDIO_DECODE_TIMEOUT_SECONDS  longest ffmpeg may spend on one recording, not counting
+                                  time spent waiting for the upload body (default 300)
+"""
+import asyncio
+import logging
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# read size for upload bodies fed to ffmpeg
+UPLOAD_CHUNK_BYTES = 64 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+MAX_AUDIO_SECONDS = float(os.getenv("MAX_AUDIO_SECONDS", str(3 * 3600)))
+AUDIO_DECODE_TIMEOUT_SECONDS = float(os.getenv("AUDIO_DECODE_TIMEOUT_SECONDS", "300"))
+# end of ffmpeg's stderr kept for error messages
+FFMPEG_STDERR_TAIL_BYTES = 4096
+
+
+class AudioDecodeError(RuntimeError):
+    """Raised when incoming audio cannot be decoded."""
+
+
+class AudioTooLarge(AudioDecodeError):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES or MAX_AUDIO_SECONDS."""
+
+
+class AudioDecodeTimeout(AudioDecodeError):
+    """Raised when ffmpeg takes longer than AUDIO_DECODE_TIMEOUT_SECONDS."""
+
+    def __init__(self, timeout: float):
+        super().__init__(f"Decoding timed out after {timeout:.0f}s")
+
+
+def pcm16_to_float32(data: bytes) -> np.ndarray:
+    """Little-endian signed 16-bit PCM -> float32 samples in [-1, 1)."""
+    usable = len(data) - (len(data) % 2)
+    return np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def ffmpeg_decode_args(input_args: List[str]) -> List[str]:
+    """ffmpeg command reading `input_args`-described audio on stdin, writing 16 kHz mono f32le to stdout."""
+    return [
+        "ffmpeg",
+        "-nostdin",
+        "-loglevel", "error",
+        *input_args,
+        "-i", "pipe:0",
+        "-f", "f32le",
+        "-ac", "1",
+        "-ar", str(SAMPLE_RATE),
+        "pipe:1",
+    ]
+
+
+def _ffmpeg_error(stderr: bytes) -> str:
+    message = stderr[-FFMPEG_STDERR_TAIL_BYTES:].decode("utf-8", "replace").strip()
+    return f"ffmpeg failed: {message or 'unknown error'}"
+
+
+def load_audio(path: str, timeout: float = AUDIO_DECODE_TIMEOUT_SECONDS) -> np.ndarray:
+    """Blocking `decode_file`, for worker processes that have no event loop."""
+    try:
+        proc = subprocess.run(
+            ["ffmpeg", "-nostdin", "-loglevel", "error",
+             "-i", path,
+             "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+             "pipe:1"],
+            capture_output=True,
+            timeout=timeout,
+        )
+    except FileNotFoundError as e:
+        raise AudioDecodeError("ffmpeg not found on PATH") from e
+    except subprocess.TimeoutExpired:
+        raise AudioDecodeTimeout(timeout) from None
+    if proc.returncode != 0:
+        raise AudioDecodeError(_ffmpeg_error(proc.stderr))
+    return np.frombuffer(proc.stdout, dtype="<f4")
+
+
+async def decode_file(path: str, timeout: float = AUDIO_DECODE_TIMEOUT_SECONDS) -> np.ndarray:
+    """Decodes an audio file to 16 kHz mono float32 samples with an async ffmpeg subprocess."""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-nostdin", "-loglevel", "error",
+            "-i", path,
+            "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "pipe:1",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError as e:
+        raise AudioDecodeError("ffmpeg not found on PATH") from e
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise AudioDecodeTimeout(timeout) from None
+    if proc.returncode != 0:
+        raise AudioDecodeError(_ffmpeg_error(stderr))
+    return np.frombuffer(stdout, dtype="<f4")
+
+
+class FfmpegStreamDecoder:
+    """
+    Incremental decoder: bytes written with `write()` come out as float32
+    samples as soon as ffmpeg has decoded them, either passed to `on_samples`
+    or collected with `read_available()`. `close()` raises AudioDecodeError
+    if ffmpeg failed at any point, even after producing some samples.
+    """
+
+    def __init__(
+        self,
+        input_args: Optional[List[str]] = None,
+        on_samples: Optional[Callable[[np.ndarray], None]] = None,
+    ):
+        self.input_args = input_args or []
+        self.on_samples = on_samples
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._stderr_reader: Optional[asyncio.Task] = None
+        self._stderr_tail = bytearray()
+        self._pending = bytearray()
+        self.bytes_decoded = 0
+
+    async def start(self) -> None:
+        try:
+            self._proc = await asyncio.create_subprocess_exec(
+                *ffmpeg_decode_args(self.input_args),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError as e:
+            raise AudioDecodeError("ffmpeg not found on PATH") from e
+        self._reader = asyncio.create_task(self._read_stdout())
+        self._stderr_reader = asyncio.create_task(self._read_stderr())
+
+    async def _read_stdout(self) -> None:
+        while True:
+            chunk = await self._proc.stdout.read(65536)
+            if not chunk:
+                break
+            self._pending.extend(chunk)
+            self.bytes_decoded += len(chunk)
+            if self.on_samples is not None:
+                self.on_samples(self.read_available())
+
+    async def _read_stderr(self) -> None:
+        while True:
+            chunk = await self._proc.stderr.read(65536)
+            if not chunk:
+                break
+            self._stderr_tail.extend(chunk)
+            del self._stderr_tail[:-FFMPEG_STDERR_TAIL_BYTES]
+
+    async def write(self, data: bytes) -> None:
+        try:
+            self._proc.stdin.write(data)
+            await self._proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise AudioDecodeError(await self.error_message()) from e
+
+    def read_available(self) -> np.ndarray:
+        """Float32 samples decoded since the last call."""
+        usable = len(self._pending) - (len(self._pending) % 4)
+        samples = np.frombuffer(bytes(self._pending[:usable]), dtype="<f4")
+        del self._pending[:usable]
+        return samples
+
+    async def close(self) -> np.ndarray:
+        """Flushes ffmpeg and returns the remaining samples."""
+        if self._proc is None:
+            return np.zeros(0, dtype=np.float32)
+        if self._proc.stdin and not self._proc.stdin.is_closing():
+            self._proc.stdin.close()
+        await self._reader
+        returncode = await self._proc.wait()
+        if returncode != 0:
+            raise AudioDecodeError(await self.error_message())
+        return self.read_available()
+
+    async def kill(self) -> None:
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+            await self._proc.wait()
+
+    async def error_message(self) -> str:
+        if self._stderr_reader is None:
+            return "ffmpeg failed"
+        await self._stderr_reader
+        return _ffmpeg_error(bytes(self._stderr_tail))
+
+
+async def decode_bytes_via_file(
+    data: bytes, suffix: str = "", timeout: float = AUDIO_DECODE_TIMEOUT_SECONDS
+) -> np.ndarray:
+    """Decodes in-memory audio through a temp file, for formats ffmpeg can't read from a pipe."""
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(data)
+    try:
+        return await decode_file(tmp.name, timeout)
+    finally:
+        Path(tmp.name).unlink(missing_ok=True)
+
+
+async def decode_stream(
+    chunks: AsyncIterator[bytes],
+    on_chunk: Optional[Callable[[bytes], None]] = None,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    max_seconds: float = MAX_AUDIO_SECONDS,
+    timings: Optional[Dict[str, float]] = None,
+    timeout: float = AUDIO_DECODE_TIMEOUT_SECONDS,
+) -> np.ndarray:
+    """
+    Pipes `chunks` (e.g. an upload body) through ffmpeg as they arrive and
+    returns 16 kHz mono float32 samples. `on_chunk` sees every raw chunk
+    (used for hashing). Raises AudioTooLarge as soon as a limit is crossed,
+    and AudioDecodeError if ffmpeg fails after producing audio (the start of
+    a recording is not a valid result) or spends more than `timeout` seconds.
+    With `timings`, seconds spent waiting for the body ("receive") and the
+    rest of the wall time ("decode") are recorded into it.
+    """
+    started = time.perf_counter()
+    receive_seconds = 0.0
+    max_samples = int(max_seconds * SAMPLE_RATE)
+    pieces: List[np.ndarray] = []
+    n_samples = 0
+
+    def collect(samples: np.ndarray) -> None:
+        nonlocal n_samples
+        pieces.append(samples)
+        n_samples += len(samples)
+
+    # Containers with their index at the end (typical phone .m4a recordings)
+    # cannot be decoded from a pipe. Compressed bytes are kept until ffmpeg
+    # produces its first samples so those can be retried from a seekable file.
+    raw = bytearray()
+    total_bytes = 0
+
+    def accept(chunk: bytes) -> None:
+        nonlocal total_bytes
+        total_bytes += len(chunk)
+        if total_bytes > max_bytes:
+            raise AudioTooLarge(f"Upload exceeds {max_bytes} bytes")
+        if on_chunk is not None:
+            on_chunk(chunk)
+        if n_samples == 0:
+            raw.extend(chunk)
+        elif raw:
+            raw.clear()
+
+    def remaining() -> float:
+        # the clock only runs while ffmpeg is waited on, not while the client is
+        return max(0.0, timeout - (time.perf_counter() - started - receive_seconds))
+
+    async def within_timeout(operation):
+        try:
+            return await asyncio.wait_for(operation, remaining())
+        except asyncio.TimeoutError:
+            raise AudioDecodeTimeout(timeout) from None
+
+    decoder = FfmpegStreamDecoder(on_samples=collect)
+    await decoder.start()
+    pipe_failed = False
+    try:
+        iterator = chunks.__aiter__()
+        while True:
+            waiting = time.perf_counter()
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                receive_seconds += time.perf_counter() - waiting
+            accept(chunk)
+            if not pipe_failed:
+                try:
+                    await within_timeout(decoder.write(chunk))
+                except AudioDecodeTimeout:
+                    raise
+                except AudioDecodeError:
+                    # ffmpeg gave up; keep reading the body for the file fallback
+                    pipe_failed = True
+            if n_samples > max_samples:
+                raise AudioTooLarge(f"Audio exceeds {max_seconds:.0f} seconds")
+        if not pipe_failed:
+            try:
+                await within_timeout(decoder.close())
+            except AudioDecodeTimeout:
+                raise
+            except AudioDecodeError:
+                pipe_failed = True
+    finally:
+        await decoder.kill()
+
+    logger.info(f"Decoded {total_bytes} bytes into {n_samples / SAMPLE_RATE:.1f}s of audio")
+    if pipe_failed and n_samples:
+        # the compressed bytes were dropped once audio came out, so there is no fallback
+        raise AudioDecodeError(
+            f"{await decoder.error_message()} (after {n_samples / SAMPLE_RATE:.1f}s of audio)"
+        )
+    if n_samples == 0 and raw:
+        logger.info("Streaming decode produced no audio, retrying from a seekable temp file")
+        samples = await decode_bytes_via_file(bytes(raw), timeout=remaining())
+    else:
+        samples = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
+
+    if len(samples) > max_samples:
+        raise AudioTooLarge(f"Audio exceeds {max_seconds:.0f} seconds")
+    if timings is not None:
+        timings["receive"] = round(receive_seconds, 4)
+        timings["decode"] = round(time.perf_counter() - started - receive_seconds, 4)
+    return samples
@@ -0,0 +1,244 @@
+"""
+Batch transcription + summarization of many recordings.
+
+`simple_whisper.py` handles one file per interpreter: it starts the `whisper`
+CLI, which loads the model again for every recording. For backfills of
+thousands of archived visits this module runs the whole batch in one process
+instead:
+
+    transcribe  a `TranscriptionPool` of worker processes, each with the model
+                loaded once; enough files are in flight to keep every worker busy
+    summarize   the summaries of finished transcripts run concurrently, at most
+                `--gemini-concurrency` at a time, while later files are still
+                being transcribed
+
+Outputs are the same files the single-file CLI leaves next to each recording
+(`<name>.txt`, `<name>.json` and `<recording>.summary.txt`). A recording whose
+outputs are at least as new as the recording itself is skipped, so an
+interrupted run resumes where it stopped. A recording with a transcript but no
+summary only gets summarized. Each output is written to a temporary file and
+renamed into place, so a killed run never leaves a partial file that looks
+finished.
+
+    python batch_transcribe.py /archive/visits --workers 4
+    python simple_whisper.py batch "/archive/2025-*/*.m4a" --model small.en
+"""
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from gemini_client import GEMINI_API_KEY
+from simple_whisper import read_segments_for_audio, read_transcript_for_audio, summarize_with_gemini
+from transcription_pool import TRANSCRIBE_WORKERS, TranscriptionPool
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".aac", ".flac", ".ogg", ".opus", ".webm", ".mp4")
+
+
+@dataclass
+class BatchItem:
+    audio: str
+    transcribe: bool
+    summarize: bool
+
+    @property
+    def base(self) -> str:
+        return os.path.splitext(self.audio)[0]
+
+    @property
+    def txt_path(self) -> str:
+        return self.base + ".txt"
+
+    @property
+    def json_path(self) -> str:
+        return self.base + ".json"
+
+    @property
+    def summary_path(self) -> str:
+        return self.audio + ".summary.txt"
+
+
+def collect_audio(inputs: List[str]) -> List[str]:
+    """
+    Recordings named by `inputs`: files as given, directories searched
+    recursively for AUDIO_EXTENSIONS, anything else expanded as a glob.
+    """
+    found = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                found += [os.path.join(root, f) for f in files if f.lower().endswith(AUDIO_EXTENSIONS)]
+        elif os.path.isfile(pattern):
+            found.append(pattern)
+        else:
+            found += [
+                path
+                for path in glob.glob(pattern, recursive=True)
+                if os.path.isfile(path) and path.lower().endswith(AUDIO_EXTENSIONS)
+            ]
+    # the same recording may match more than one input
+    return sorted(set(os.path.normpath(path) for path in found))
+
+
+def _up_to_date(path: str, source_mtime: float) -> bool:
+    return os.path.exists(path) and os.path.getmtime(path) >= source_mtime
+
+
+def plan(audio_files: List[str], summarize: bool = True, force: bool = False) -> List[BatchItem]:
+    """What each recording still needs; recordings with nothing to do are left out."""
+    items = []
+    for audio in audio_files:
+        item = BatchItem(audio, transcribe=True, summarize=summarize)
+        if not force:
+            mtime = os.path.getmtime(audio)
+            item.transcribe = not (_up_to_date(item.txt_path, mtime) and _up_to_date(item.json_path, mtime))
+            item.summarize = summarize and (item.transcribe or not _up_to_date(item.summary_path, mtime))
+        if item.transcribe or item.summarize:
+            items.append(item)
+    return items
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_transcript(item: BatchItem, result: Dict[str, Any]) -> None:
+    """Writes `<name>.json` and `<name>.txt` in the layout of the whisper CLI."""
+    _write_atomic(
+        item.json_path,
+        json.dumps(
+            {"text": result["text"], "segments": result["segments"], "language": result["language"]},
+            ensure_ascii=False,
+        ),
+    )
+    lines = [segment["text"].strip() for segment in result["segments"]] or [result["text"]]
+    _write_atomic(item.txt_path, "\n".join(lines) + "\n")
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        items: List[BatchItem],
+        model: str = "base.en",
+        workers: int = TRANSCRIBE_WORKERS,
+        gemini_concurrency: int = 4,
+    ):
+        self.items = items
+        self.model = model
+        # the batch is the only client: no per-client quota or wait limit,
+        # and one queued file per worker so a worker never sits idle between files
+        self.pool = TranscriptionPool(
+            workers=workers,
+            queue_size=max(1, workers),
+            preload=[model],
+            max_wait_seconds=float("inf"),
+            max_per_client=0,
+        )
+        self._transcribe_slots = asyncio.Semaphore(self.pool.capacity)
+        self._gemini_slots = asyncio.Semaphore(max(1, gemini_concurrency))
+        self.done = 0
+        self.failed: List[str] = []
+        self.audio_seconds = 0.0
+        self.started = 0.0
+
+    async def run(self) -> bool:
+        """Processes every item; False if the pool could not start or any file failed."""
+        if any(item.transcribe for item in self.items):
+            print(f"Loading '{self.model}' on {self.pool.workers or 'in-process'} worker(s)...")
+            await self.pool.warm_up()
+            if not self.pool.ready:
+                print(f"Transcription pool failed to start: {self.pool.state_detail}", file=sys.stderr)
+                return False
+        self.started = time.perf_counter()
+        try:
+            await asyncio.gather(*(self._process(item) for item in self.items))
+        finally:
+            self.pool.shutdown()
+        self._report()
+        return not self.failed
+
+    async def _process(self, item: BatchItem) -> None:
+        started = time.perf_counter()
+        status = []
+        try:
+            if item.transcribe:
+                async with self._transcribe_slots:
+                    result = await self.pool.transcribe(item.audio, model=self.model)
+                await asyncio.to_thread(write_transcript, item, result)
+                self.audio_seconds += result.get("audio_seconds") or 0.0
+                status.append(f"{result.get('audio_seconds') or 0:.0f}s audio transcribed")
+                transcript, segments = result["text"], result["segments"]
+            else:
+                transcript = read_transcript_for_audio(item.audio)
+                segments = read_segments_for_audio(item.audio)
+            if item.summarize:
+                async with self._gemini_slots:
+                    summary = await summarize_with_gemini(transcript, segments=segments)
+                if summary.startswith("[Gemini parse error]"):
+                    raise RuntimeError(summary[:200])
+                await asyncio.to_thread(_write_atomic, item.summary_path, summary)
+                status.append("summarized")
+        except Exception as e:
+            self.failed.append(item.audio)
+            status.append(f"FAILED: {e}")
+        self.done += 1
+        print(
+            f"[{self.done}/{len(self.items)}] {item.audio}: {', '.join(status)} "
+            f"({time.perf_counter() - started:.1f}s)",
+            flush=True,
+        )
+
+    def _report(self) -> None:
+        wall = time.perf_counter() - self.started
+        succeeded = len(self.items) - len(self.failed)
+        print(f"\nProcessed {succeeded}/{len(self.items)} files in {wall:.1f}s", end="")
+        if self.audio_seconds and wall:
+            print(
+                f": {self.audio_seconds / 3600:.2f}h of audio, "
+                f"{self.audio_seconds / wall:.1f}x real time, "
+                f"{succeeded * 3600 / wall:.0f} files/hour"
+            )
+        else:
+            print()
+        for path in self.failed:
+            print(f"  failed: {path}", file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Transcribe and summarize a batch of recordings")
+    parser.add_argument("inputs", nargs="+", help="recordings, directories or glob patterns")
+    parser.add_argument("--model", default="base.en", help="Whisper model")
+    parser.add_argument("--workers", type=int, default=max(1, TRANSCRIBE_WORKERS),
+                        help="transcription worker processes (0 = in this process)")
+    parser.add_argument("--gemini-concurrency", type=int, default=4, help="summaries in flight")
+    parser.add_argument("--no-summary", action="store_true", help="only transcribe")
+    parser.add_argument("--force", action="store_true", help="redo recordings whose outputs are up to date")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    audio_files = collect_audio(args.inputs)
+    items = plan(audio_files, summarize=not args.no_summary, force=args.force)
+    print(f"Found {len(audio_files)} recordings, {len(audio_files) - len(items)} up to date, {len(items)} to process")
+    if not items:
+        return
+    if any(item.summarize for item in items) and not GEMINI_API_KEY:
+        sys.exit("GEMINI_API_KEY not found in environment (.env); pass --no-summary to only transcribe.")
+
+    runner = BatchRunner(items, model=args.model, workers=args.workers, gemini_concurrency=args.gemini_concurrency)
+    if not asyncio.run(runner.run()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
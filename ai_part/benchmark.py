@@ -0,0 +1,390 @@
+"""
+Offline benchmark for the transcription + summarization pipeline.
+
+For every (backend, model, workers) combination a fresh Python process is started
+with the matching environment, and it measures:
+
+    transcribe  `run_whisper_cli_on_file` on each test recording: wall time
+                and real-time factor (RTF = processing seconds / audio seconds)
+    summarize   `summarize_with_gemini` on a short and a long transcript
+    endpoint    `/transcribe_summarize` through the ASGI app, with
+                `--concurrency` uploads in flight: latency, per-stage timings
+                and throughput
+    memory      peak RSS of the benchmark process and of its workers
+
+Test audio is the bundled samplekedar.wav (when present) plus synthetic
+recordings of `--durations` seconds, built by looping samplekedar.wav or,
+without it, from tone bursts separated by pauses. Gemini is replaced by
+`stub_gemini` with a fixed latency, and the result cache is disabled, so
+runs are reproducible offline. Each endpoint upload gets its own payload
+(`vary_audio`); identical concurrent uploads would be coalesced into one
+transcription and overstate throughput.
+
+Results are written as JSON; pass an earlier file as `--baseline` to print
+the differences and exit non-zero on regressions beyond `--tolerance`.
+
+    python benchmark.py --models tiny.en,base.en --workers 0,2 --output bench.json
+    python benchmark.py --backends openai-whisper,faster-whisper --workers 2
+    python benchmark.py --baseline bench.json --output bench-new.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from audio_ingest import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+HERE = Path(__file__).resolve().parent
+SAMPLE_WAV = HERE / "samplekedar.wav"
+SAMPLE_TRANSCRIPT = HERE / "samplekedar.txt"
+
+
+def write_wav(path: Path, samples: np.ndarray) -> None:
+    """Writes float32 samples in [-1, 1] as 16 kHz mono 16-bit PCM."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(SAMPLE_RATE)
+        out.writeframes(pcm.tobytes())
+
+
+def vary_audio(audio: bytes, n: int) -> bytes:
+    """
+    `audio` with its last two samples replaced by near-silent values derived
+    from `n`, so every upload hashes differently but sounds the same.
+    Only 16-bit PCM WAV is changed; other formats are returned as they are.
+    """
+    if not audio.startswith(b"RIFF") or len(audio) < 48 or int.from_bytes(audio[34:36], "little") != 16:
+        return audio
+    low, high = n % 256 - 128, n // 256 % 256 - 128
+    return audio[:-4] + low.to_bytes(2, "little", signed=True) + high.to_bytes(2, "little", signed=True)
+
+
+def read_wav(path: Path) -> np.ndarray:
+    with wave.open(str(path), "rb") as src:
+        if src.getframerate() != SAMPLE_RATE or src.getnchannels() != 1 or src.getsampwidth() != 2:
+            raise ValueError(f"{path} is not 16 kHz mono 16-bit PCM")
+        data = src.readframes(src.getnframes())
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def synthetic_speech(seconds: float, seed: int = 0) -> np.ndarray:
+    """Voice-like harmonic bursts of 0.5-3 s separated by 0.2-1.5 s pauses, over faint noise."""
+    rng = np.random.default_rng(seed)
+    total = int(seconds * SAMPLE_RATE)
+    audio = rng.normal(0.0, 0.002, total).astype(np.float32)
+    position = 0
+    while position < total:
+        length = min(int(rng.uniform(0.5, 3.0) * SAMPLE_RATE), total - position)
+        t = np.arange(length) / SAMPLE_RATE
+        pitch = rng.uniform(100, 220)
+        burst = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(3, 6) * t)  # syllable rate
+        audio[position:position + length] += (0.2 * burst * envelope).astype(np.float32)
+        position += length + int(rng.uniform(0.2, 1.5) * SAMPLE_RATE)
+    return audio
+
+
+def build_audio_set(directory: Path, durations: List[float]) -> List[Dict[str, Any]]:
+    """Writes the test recordings into `directory`; returns [{"name", "path", "seconds"}]."""
+    sample = read_wav(SAMPLE_WAV) if SAMPLE_WAV.exists() else None
+    recordings = []
+    if sample is not None:
+        recordings.append({"name": SAMPLE_WAV.name, "path": str(SAMPLE_WAV), "seconds": len(sample) / SAMPLE_RATE})
+    for seconds in durations:
+        if sample is not None:
+            audio = np.resize(sample, int(seconds * SAMPLE_RATE))
+        else:
+            audio = synthetic_speech(seconds)
+        path = directory / f"synthetic_{int(seconds)}s.wav"
+        write_wav(path, audio)
+        recordings.append({"name": path.name, "path": str(path), "seconds": float(seconds)})
+    return recordings
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Peak resident set size of this process and of its largest finished child (Linux: KiB units)."""
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(float(np.percentile(values, q)), 4)
+
+
+# ---------------------------------------------------------------------------
+# One configuration (runs in its own process, see run_config_subprocess)
+# ---------------------------------------------------------------------------
+
+
+async def _bench_endpoint(app, recordings, model: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def upload(recording, n: int) -> Dict[str, Any]:
+            with open(recording["path"], "rb") as f:
+                data = vary_audio(f.read(), n)
+            started = time.perf_counter()
+            response = await client.post(
+                "/transcribe_summarize",
+                params={"whisper_model": model},
+                files={"file": (recording["name"], data, "audio/wav")},
+            )
+            elapsed = time.perf_counter() - started
+            body = response.json()
+            return {
+                "status": response.status_code,
+                "seconds": elapsed,
+                "audio_seconds": recording["seconds"],
+                "stages": body.get("stages", {}) if response.status_code == 200 else {},
+            }
+
+        await upload(recordings[0], requests)  # warm-up: spawns the workers and loads the model
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(i: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await upload(recordings[i % len(recordings)], i)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(bounded(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r["status"] == 200]
+    latencies = [r["seconds"] for r in ok]
+    stage_names = sorted({name for r in ok for name in r["stages"]})
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(results) - len(ok),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 4),
+        "audio_seconds_per_second": round(sum(r["audio_seconds"] for r in ok) / elapsed, 3),
+        "latency": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "max": percentile(latencies, 100)},
+        "stages_mean": {
+            name: round(statistics.mean(r["stages"].get(name, 0.0) for r in ok), 4) for name in stage_names
+        },
+    }
+
+
+def run_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Benchmarks one backend/model/workers combination in this process; the environment is already set."""
+    import transcribe_summarize as app_module
+    from whisper_models import registry
+
+    model = config["model"]
+    recordings = config["recordings"]
+    result: Dict[str, Any] = {"backend": config["backend"], "model": model, "workers": config["workers"]}
+
+    started = time.perf_counter()
+    registry.get(model)
+    result["model_load_seconds"] = round(time.perf_counter() - started, 3)
+
+    result["transcribe"] = []
+    for recording in recordings:
+        started = time.perf_counter()
+        text = app_module.run_whisper_cli_on_file(recording["path"], model=model)
+        elapsed = time.perf_counter() - started
+        result["transcribe"].append({
+            "audio": recording["name"],
+            "audio_seconds": round(recording["seconds"], 3),
+            "seconds": round(elapsed, 3),
+            "rtf": round(elapsed / recording["seconds"], 4),
+            "characters": len(text),
+        })
+
+    short = SAMPLE_TRANSCRIPT.read_text() if SAMPLE_TRANSCRIPT.exists() else "Hello, this is a short test transcript."
+    long = " ".join([short] * max(1, 4 * app_module.SUMMARY_CHUNK_CHARS // len(short)))
+    result["summarize"] = []
+    for name, text in (("short", short), ("long", long)):
+        started = time.perf_counter()
+        asyncio.run(app_module.summarize_with_gemini(text))
+        result["summarize"].append(
+            {"transcript": name, "characters": len(text), "seconds": round(time.perf_counter() - started, 3)}
+        )
+
+    result["endpoint"] = asyncio.run(
+        _bench_endpoint(app_module.app, recordings, model, config["requests"], config["concurrency"])
+    )
+    app_module.transcription_pool.shutdown(wait=True)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_config_subprocess(config: Dict[str, Any], env: Dict[str, str]) -> Dict[str, Any]:
+    """Runs `run_config` in a fresh interpreter so models, workers and RSS don't leak between configs."""
+    with tempfile.NamedTemporaryFile("w+", suffix=".json") as spec:
+        json.dump(config, spec)
+        spec.flush()
+        completed = subprocess.run(
+            [sys.executable, __file__, "--run-config", spec.name],
+            cwd=HERE,
+            env={**os.environ, **env},
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        if completed.returncode != 0:
+            return {
+                "backend": config["backend"],
+                "model": config["model"],
+                "workers": config["workers"],
+                "error": f"exit code {completed.returncode}",
+            }
+        spec.seek(0)
+        return json.load(spec)
+
+
+# ---------------------------------------------------------------------------
+# Comparison against a baseline
+# ---------------------------------------------------------------------------
+
+
+def summarize_run(run: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """Headline numbers used for comparisons; for each, lower is better."""
+    if "error" in run:
+        return {}
+    throughput = run["endpoint"]["throughput_rps"]
+    return {
+        "mean_rtf": round(statistics.mean(t["rtf"] for t in run["transcribe"]), 4),
+        "endpoint_p50": run["endpoint"]["latency"]["p50"],
+        "seconds_per_request": round(1 / throughput, 4) if throughput else None,
+        "peak_rss_mb": max(run["peak_rss_mb"].values()),
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """Prints metric changes per configuration; returns the regressions beyond `tolerance`."""
+    def key(run: Dict[str, Any]) -> Tuple[str, str, int]:
+        # runs recorded before backends were selectable used openai-whisper
+        return run.get("backend", "openai-whisper"), run["model"], run["workers"]
+
+    previous = {key(r): summarize_run(r) for r in baseline["runs"]}
+    regressions = []
+    for run in current["runs"]:
+        if key(run) not in previous:
+            continue
+        before, after = previous[key(run)], summarize_run(run)
+        for metric, value in after.items():
+            old = before.get(metric)
+            if not old or value is None:
+                continue
+            change = (value - old) / old
+            line = f"{key(run)[0]:>14} {run['model']:>10} workers={run['workers']} {metric:>20}: {old:10.4f} -> {value:10.4f} ({change:+.1%})"
+            print(line)
+            if change > tolerance:
+                regressions.append(line)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the transcription + summarization pipeline")
+    parser.add_argument("--backends", default="openai-whisper", help="comma-separated TRANSCRIBE_BACKEND values")
+    parser.add_argument("--models", default="tiny.en,base.en", help="comma-separated Whisper models")
+    parser.add_argument("--workers", default="0,2", help="comma-separated TRANSCRIBE_WORKERS values")
+    parser.add_argument("--durations", default="30,120,600", help="synthetic recording lengths in seconds")
+    parser.add_argument("--requests", type=int, default=8, help="endpoint requests per configuration")
+    parser.add_argument("--concurrency", type=int, default=4, help="endpoint requests in flight")
+    parser.add_argument("--gemini-latency", type=float, default=0.8, help="stub Gemini latency in seconds")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown before failing")
+    parser.add_argument("--run-config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.run_config:
+        with open(args.run_config) as f:
+            config = json.load(f)
+        result = run_config(config)
+        with open(args.run_config, "w") as f:
+            json.dump(result, f)
+        return
+
+    import stub_gemini
+
+    base_url, stub = stub_gemini.start_in_thread(latency=args.gemini_latency)
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True
+            ).stdout.strip() or None,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k != "run_config"},
+        },
+        "runs": [],
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        recordings = build_audio_set(Path(directory), [float(d) for d in args.durations.split(",") if d])
+        for backend, model, workers in itertools.product(
+            args.backends.split(","), args.models.split(","), (int(w) for w in args.workers.split(","))
+        ):
+            print(f"Benchmarking {model} on {backend} with {workers} workers...", flush=True)
+            config = {
+                "backend": backend,
+                "model": model,
+                "workers": workers,
+                "recordings": recordings,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+            }
+            env = {
+                "TRANSCRIBE_BACKEND": backend,
+                "TRANSCRIBE_WORKERS": str(workers),
+                "WHISPER_PRELOAD_MODELS": model,
+                # measure the model under test, not the adaptive selector
+                "WHISPER_MODEL_POLICY": "client",
+                "RESULT_CACHE_PATH": "",
+                "RECORDS_DB_PATH": "",
+                # every upload comes from one address; don't let the per-client quota reject them
+                "TRANSCRIBE_MAX_PER_CLIENT": "0",
+                "GEMINI_BASE_URL": base_url,
+                "GEMINI_API_KEY": "stub",
+            }
+            run = run_config_subprocess(config, env)
+            results["runs"].append(run)
+            print(json.dumps(summarize_run(run)) if "error" not in run else run["error"], flush=True)
+
+    stub.should_exit = True
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Server-side chat sessions with token-budgeted history.
+
+Without a session the client resends the whole conversation on every `/chat`
+call, so request size, Gemini input tokens and latency all grow with the
+conversation. A session keeps the system prompt and history on the server
+and the client only sends the new turn.
+
+History is kept within a token budget. When the turns pass
+CHAT_HISTORY_TOKEN_BUDGET, the oldest ones are folded into a running summary
+by Gemini until the history is back under half the budget. The most recent
+CHAT_KEEP_RECENT_MESSAGES messages are always kept verbatim. Compaction runs
+after the reply has been sent, so no turn waits for it. What Gemini receives
+per turn is then bounded: system prompt + summary + recent turns + new
+message. Tokens are estimated from character counts (about 4 per token); the
+estimate only has to be stable, not exact.
+
+Sessions live in process memory. The least recently used are evicted beyond
+CHAT_MAX_SESSIONS, and idle ones expire after CHAT_SESSION_TTL_SECONDS.
+Clients treat a 404 as "start a new session and resend the context".
+
+Configuration (environment):
+    CHAT_SESSION_TTL_SECONDS    idle time before a session expires (default 1800)
+    CHAT_MAX_SESSIONS           sessions kept per process (default 10000)
+    CHAT_HISTORY_TOKEN_BUDGET   estimated history tokens before compaction (default 4000)
+    CHAT_KEEP_RECENT_MESSAGES   messages never compacted (default 6)
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from metrics import observe_stages, stage_timer
+
+logger = logging.getLogger(__name__)
+
+CHAT_SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_SECONDS", "1800"))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "10000"))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "4000"))
+CHAT_KEEP_RECENT_MESSAGES = int(os.getenv("CHAT_KEEP_RECENT_MESSAGES", "6"))
+CHARS_PER_TOKEN = 4
+
+SYSTEM_ACK = "I understand. I'm ready to help."
+SUMMARY_ACK = "Understood, I'll keep that context in mind."
+
+COMPACT_PROMPT = (
+    "You maintain the running summary of a conversation between a user and an assistant. "
+    "Update the summary with the new turns below. Keep every fact, name, number, decision "
+    "and open question a later reply could depend on; drop small talk. Answer with the "
+    "updated summary only.\n\n"
+    "Current summary:\n\n{summary}\n\n"
+    "New turns:\n\n{turns}"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _content(role: str, text: str) -> Dict[str, Any]:
+    return {"role": role, "parts": [{"text": text}]}
+
+
+class ChatSession:
+    def __init__(self, system_prompt: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.system_prompt = system_prompt
+        self.summary = ""
+        self.messages: List[Dict[str, str]] = []
+        self.compacted_messages = 0
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self._compaction: Optional[asyncio.Task] = None
+
+    @property
+    def history_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(m["text"]) for m in self.messages)
+
+    def contents(
+        self, new_messages: List[Dict[str, str]], grounding: List[Dict[str, Any]] = ()
+    ) -> List[Dict[str, Any]]:
+        """
+        Gemini `contents` for the next turn: system prompt, summary, `grounding`
+        (retrieved context for this turn only), history, then `new_messages`.
+        """
+        contents = []
+        if self.system_prompt:
+            contents += [_content("user", self.system_prompt), _content("model", SYSTEM_ACK)]
+        if self.summary:
+            contents += [
+                _content("user", f"Summary of our conversation so far:\n\n{self.summary}"),
+                _content("model", SUMMARY_ACK),
+            ]
+        contents += grounding
+        contents += [_content(m["role"], m["text"]) for m in self.messages + new_messages]
+        return contents
+
+    def record(self, new_messages: List[Dict[str, str]], reply: str) -> None:
+        """Appends a finished turn; its messages and reply are added together, never interleaved."""
+        self.messages += new_messages + [{"role": "model", "text": reply}]
+        self.last_used = time.time()
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "messages": len(self.messages),
+            "compacted_messages": self.compacted_messages,
+            "summary": self.summary,
+            "history_tokens": self.history_tokens,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+        }
+
+    def _split_for_compaction(self, budget: int, keep_recent: int) -> int:
+        """
+        Number of oldest messages to fold into the summary (0 if within budget).
+        Compacts down to half the budget so it doesn't run again next turn,
+        and never splits a user message from the reply that follows it.
+        """
+        if self.history_tokens <= budget:
+            return 0
+        tokens = self.history_tokens
+        count = 0
+        limit = len(self.messages) - keep_recent
+        while count < limit and tokens > budget // 2:
+            tokens -= estimate_tokens(self.messages[count]["text"])
+            count += 1
+        while count < limit and self.messages[count]["role"] != "user":
+            count += 1
+        return count
+
+    async def compact(
+        self,
+        generate: Callable[[str], Awaitable[str]],
+        budget: int = CHAT_HISTORY_TOKEN_BUDGET,
+        keep_recent: int = CHAT_KEEP_RECENT_MESSAGES,
+    ) -> None:
+        """
+        Folds the oldest turns into the summary if the history is over `budget`.
+        Turns only ever append, so new turns can run meanwhile; the folded
+        messages are still the first `count` when the summary comes back.
+        """
+        count = self._split_for_compaction(budget, keep_recent)
+        if not count:
+            return
+        turns = "\n\n".join(
+            f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['text']}"
+            for m in self.messages[:count]
+        )
+        timings = {}
+        try:
+            with stage_timer(timings, "chat_compact"):
+                summary = await generate(
+                    COMPACT_PROMPT.format(summary=self.summary or "(none yet)", turns=turns)
+                )
+        except Exception as e:
+            # keep the turns; the next turn tries again
+            logger.warning(f"Compacting chat session {self.id} failed: {e}")
+            return
+        observe_stages(timings)
+        if summary.startswith("[Gemini parse error]"):
+            logger.warning(f"Compacting chat session {self.id} failed: {summary[:200]}")
+            return
+        before = self.history_tokens
+        self.summary = summary.strip()
+        del self.messages[:count]
+        self.compacted_messages += count
+        logger.info(
+            f"Compacted {count} messages of chat session {self.id}: "
+            f"~{before} -> ~{self.history_tokens} tokens in {timings['chat_compact']:.2f}s"
+        )
+
+    def schedule_compaction(self, generate: Callable[[str], Awaitable[str]]) -> None:
+        """Starts `compact` in the background unless it is already running or not needed."""
+        if self.history_tokens <= CHAT_HISTORY_TOKEN_BUDGET:
+            return
+        if self._compaction is not None and not self._compaction.done():
+            return
+        self._compaction = asyncio.create_task(self.compact(generate))
+
+
+class ChatSessionStore:
+    def __init__(
+        self,
+        ttl_seconds: float = CHAT_SESSION_TTL_SECONDS,
+        max_sessions: int = CHAT_MAX_SESSIONS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max(1, max_sessions)
+        # least recently used first
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, system_prompt: Optional[str] = None) -> ChatSession:
+        self._purge_expired()
+        while len(self._sessions) >= self.max_sessions:
+            session_id, _ = self._sessions.popitem(last=False)
+            logger.info(f"Evicted chat session {session_id} (store full)")
+        session = ChatSession(system_prompt)
+        self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """The session, marked as just used; None if unknown or expired."""
+        self._purge_expired()
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.time()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used >= cutoff:
+                break
+            del self._sessions[session_id]
+
+
+session_store = ChatSessionStore()
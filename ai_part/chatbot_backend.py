@@ -1,23 +1,37 @@
-import os
-import subprocess
-import tempfile
-from pathlib import Path
-from typing import List, Literal, Optional
-
-import requests
-from fastapi import FastAPI, HTTPException, UploadFile, File
+import asyncio
+import hashlib
+import json
+import logging
+from typing import List, Literal, Optional, Tuple
+
+from fastapi import FastAPI, Header, HTTPException, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 load_dotenv()  # this loads .env automatically
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-GEMINI_MODEL = "gemini-2.5-flash"
-GEMINI_ENDPOINT = (
-    f"https://generativelanguage.googleapis.com/v1beta/models/"
-    f"{GEMINI_MODEL}:generateContent"
+import transcription_engine
+from audio_ingest import (
+    SAMPLE_RATE,
+    UPLOAD_CHUNK_BYTES,
+    AudioDecodeError,
+    AudioDecodeTimeout,
+    AudioTooLarge,
+    decode_stream,
 )
+from chat_sessions import ChatSession, estimate_tokens, session_store
+from gemini_client import GEMINI_API_KEY, GEMINI_MODEL, GeminiError, GeminiOverloaded, gemini
+from metrics import CHAT_PROMPT_TOKENS, QUEUE_DEPTH, metrics_response, observe_stages, stage_timer
+from model_policy import candidates, select_model
+from records_store import RECORDS_API_TOKEN, records_token_valid
+from result_cache import make_key
+from retrieval import RETRIEVAL_TOP_K, grounding_contents, retrieval_index, retrieve
+from single_flight import SingleFlight
+from summarization import SUMMARY_CHUNK_CHARS, map_reduce_summarize
+from transcription_pool import ClientQuotaExceeded, TranscriptionPoolFull, pool as transcription_pool
+
+logger = logging.getLogger(__name__)
 
 
 class ChatMessage(BaseModel):
@@ -28,14 +42,33 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[ChatMessage]
     system_prompt: Optional[str] = None
+    # with a session, `messages` holds only the new turn
+    session_id: Optional[str] = None
+    # add matching excerpts of this patient's stored recordings; never done without
+    # patient_id, and only with the records token (X-Records-Token header)
+    grounding: bool = True
+    patient_id: Optional[str] = None
 
 
 class ChatResponse(BaseModel):
     reply: str
+    session_id: Optional[str] = None
+    # recordings the reply was grounded in: record_id, start, end, score
+    sources: List[dict] = []
+
+
+class SessionRequest(BaseModel):
+    system_prompt: Optional[str] = None
 
 
 app = FastAPI(title="Gemini Chatbot Backend", version="0.1.0")
 
+# devices behind one NAT share an address; the app can send a stable id instead
+CLIENT_ID_HEADER = "X-Client-Id"
+# identical requests still in flight (client retries) share one computation
+chat_flights = SingleFlight("chat")
+upload_flights = SingleFlight("transcribe_summarize")
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -45,65 +78,65 @@ app.add_middleware(
 )
 
 
-def run_whisper_cli_on_file(path: str, model: str = "base.en") -> str:
-    """
-    Calls whisper CLI on the given file path and returns the transcript text.
-    Whisper CLI will output <basename>.txt (it removes extension).
-    """
-    # Ensure whisper is installed in your backend env:
-    #   pip install git+https://github.com/openai/whisper.git
-    subprocess.check_call(["whisper", path, "--model", model])
+QUEUE_DEPTH.labels("transcription").set_function(lambda: transcription_pool.pending)
+
+
+@app.on_event("startup")
+async def start_transcription_pool():
+    # warm the workers in the background; /ready reports when they are done
+    app.state.warmup = asyncio.create_task(transcription_pool.warm_up())
+    # index recordings stored since the last run without delaying startup
+    app.state.indexing = asyncio.create_task(asyncio.to_thread(retrieval_index.refresh))
 
-    base = Path(path).stem  # remove extension
-    txt_path = Path(path).with_name(base + ".txt")
-    if not txt_path.exists():
-        raise FileNotFoundError(f"Expected whisper transcript {txt_path} not found.")
-    return txt_path.read_text(encoding="utf-8")
 
+@app.on_event("shutdown")
+async def stop_background_work():
+    # startup may not have run (e.g. it failed before creating the task)
+    warmup = getattr(app.state, "warmup", None)
+    if warmup is not None:
+        warmup.cancel()
+    transcription_pool.shutdown()
+    await gemini.aclose()
+    await asyncio.to_thread(retrieval_index.flush)
 
-def summarize_transcript_with_gemini(text: str, max_chars: int = 16000) -> str:
+
+def run_whisper_cli_on_file(path: str, model: str = "base.en") -> str:
     """
-    Summarize a transcript string using Gemini 2.5 flash.
+    Transcribes the given file path in-process and returns the transcript text.
     """
-    if not GEMINI_API_KEY:
-        raise RuntimeError("GEMINI_API_KEY is not set on the server.")
+    return transcription_engine.transcribe(path, model=model)["text"]
 
-    # simple truncation
-    if len(text) > max_chars:
-        text = text[:max_chars]
 
-    prompt = (
+def build_summary_prompt(text: str) -> str:
+    return (
         "You are a concise assistant. Produce a clear, human-friendly summary "
         "of the following transcript.\n\n"
         "Keep it concise (5-7 sentences) and preserve important names/facts.\n\n"
         f"Transcript:\n\n{text}"
     )
 
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
-    resp = requests.post(
-        GEMINI_ENDPOINT,
-        params={"key": GEMINI_API_KEY},
-        json=payload,
-        timeout=60,
-    )
-    resp.raise_for_status()
-    data = resp.json()
-    try:
-        parts = data["candidates"][0]["content"]["parts"]
-        return "".join(p.get("text", "") for p in parts).strip()
-    except Exception:
-        # fallback: return raw response for debugging
-        return f"[Gemini parse error] {data}"
-
 
-@app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest) -> ChatResponse:
+async def summarize_transcript_with_gemini(
+    text: str, max_chars: int = SUMMARY_CHUNK_CHARS, segments: Optional[list] = None
+) -> str:
+    """
+    Summarize a transcript string using Gemini 2.5 flash.
+    Long transcripts are summarized in chunks and the partial summaries merged.
+    """
     if not GEMINI_API_KEY:
-        raise HTTPException(
-            status_code=500,
-            detail="GEMINI_API_KEY is not set on the server.",
-        )
+        raise RuntimeError("GEMINI_API_KEY is not set on the server.")
+
+    return await map_reduce_summarize(
+        text,
+        generate=gemini.generate_text,
+        build_prompt=build_summary_prompt,
+        segments=segments,
+        max_chars=max_chars,
+    )
 
+
+def build_contents(request: ChatRequest, grounding: List[dict] = ()) -> List[dict]:
+    """Builds the Gemini `contents` array for a chat request; `grounding` goes before the messages."""
     # Build contents array for Gemini API
     contents = []
 
@@ -123,6 +156,8 @@ def chat(request: ChatRequest) -> ChatResponse:
             }
         )
 
+    contents.extend(grounding)
+
     # Add user messages - convert "model" role to "user" for Gemini API
     for msg in request.messages:
         # Gemini API uses "user" and "model" roles
@@ -135,33 +170,94 @@ def chat(request: ChatRequest) -> ChatResponse:
             }
         )
 
-    try:
-        response = requests.post(
-            GEMINI_ENDPOINT,
-            params={"key": GEMINI_API_KEY},
-            json={"contents": contents},
-            timeout=60,
-        )
-    except requests.RequestException as exc:
+    return contents
+
+
+def chat_key(request: ChatRequest) -> str:
+    """
+    Identity of a chat request for coalescing: the model, system prompt,
+    messages (ignoring whitespace around each text) and grounding options.
+    """
+    normalized = {
+        "system_prompt": (request.system_prompt or "").strip(),
+        "messages": [[msg.role, msg.text.strip()] for msg in request.messages],
+        "grounding": [request.grounding, request.patient_id],
+    }
+    return make_key("chat", GEMINI_MODEL, json.dumps(normalized, separators=(",", ":")))
+
+
+def lookup_session(session_id: str) -> ChatSession:
+    session = session_store.get(session_id)
+    if session is None:
         raise HTTPException(
-            status_code=502,
-            detail=f"Error calling Gemini API: {str(exc)}",
-        ) from exc
+            status_code=404,
+            detail="Chat session not found or expired; start a new one and resend the context.",
+        )
+    return session
 
-    if not response.ok:
-        try:
-            error_payload = response.json()
-            error_detail = error_payload.get("error", {}).get("message", str(error_payload))
-        except Exception:
-            error_detail = response.text
+
+def session_contents(
+    session: ChatSession, request: ChatRequest, grounding: List[dict] = ()
+) -> Tuple[List[dict], List[dict]]:
+    """Returns (the request's new messages, Gemini `contents` for this turn of `session`)."""
+    if request.system_prompt:
+        session.system_prompt = request.system_prompt
+    turn = [{"role": msg.role, "text": msg.text} for msg in request.messages]
+    return turn, session.contents(turn, grounding)
+
+
+def require_grounding_access(request: ChatRequest, records_token: Optional[str]) -> None:
+    """
+    Grounding on a patient's recordings shows their consultation text, so it
+    needs the same X-Records-Token as /records: 403 when the server has none
+    configured, 401 when the caller's is missing or wrong.
+    """
+    if not request.grounding or request.patient_id is None or RETRIEVAL_TOP_K <= 0:
+        return
+    if not RECORDS_API_TOKEN:
         raise HTTPException(
-            status_code=response.status_code,
-            detail=f"Gemini API error: {error_detail}",
+            status_code=403, detail="Grounding on patient records is disabled (RECORDS_API_TOKEN not set)"
         )
+    if not records_token_valid(records_token):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Records-Token")
+
+
+async def retrieve_sources(request: ChatRequest) -> List[dict]:
+    """
+    The patient's stored-recording passages matching the latest user message
+    (top RETRIEVAL_TOP_K). Without a patient_id there is nothing to search:
+    other patients' recordings must never reach the prompt.
+    """
+    query = next((msg.text for msg in reversed(request.messages) if msg.role == "user"), "")
+    if not request.grounding or request.patient_id is None or RETRIEVAL_TOP_K <= 0 or not query.strip():
+        return []
+    timings = {}
+    try:
+        with stage_timer(timings, "retrieval"):
+            sources = await asyncio.to_thread(retrieve, query, RETRIEVAL_TOP_K, request.patient_id)
+    except Exception as e:
+        # answer without grounding rather than fail the chat
+        logger.warning(f"Retrieval failed: {e}")
+        return []
+    observe_stages(timings)
+    return sources
+
+
+def source_refs(sources: List[dict]) -> List[dict]:
+    """What the client gets back about each passage (the text itself stays server-side)."""
+    return [{key: s[key] for key in ("record_id", "start", "end", "score")} for s in sources]
+
+
+def observe_prompt_tokens(mode: str, data: dict, contents: List[dict]) -> None:
+    """Gemini's reported input tokens for a turn, or an estimate when it reports none."""
+    tokens = data.get("usageMetadata", {}).get("promptTokenCount")
+    if tokens is None:
+        tokens = sum(estimate_tokens(part.get("text", "")) for c in contents for part in c["parts"])
+    CHAT_PROMPT_TOKENS.labels(mode).observe(tokens)
 
-    data = response.json()
 
-    # Extract reply from Gemini response
+def extract_reply(data: dict) -> str:
+    """Reply text of a generateContent response; HTTP 502 if it has none."""
     try:
         candidates = data.get("candidates", [])
         if not candidates:
@@ -175,71 +271,278 @@ def chat(request: ChatRequest) -> ChatResponse:
             detail=f"Unexpected Gemini response format: {str(e)}",
         )
 
-    if not reply_text:
-        reply_text = "Sorry, I could not generate a response."
+    return reply_text or "Sorry, I could not generate a response."
 
-    return ChatResponse(reply=reply_text)
+
+async def generate_reply(contents: List[dict], mode: str) -> str:
+    data = await gemini.generate_content(contents)
+    observe_prompt_tokens(mode, data, contents)
+    return extract_reply(data)
+
+
+async def session_turn(session: ChatSession, request: ChatRequest, grounding: List[dict]) -> str:
+    """One /chat turn against the session's history; compacts it afterwards if needed."""
+    turn, contents = session_contents(session, request, grounding)
+    reply = await generate_reply(contents, "session")
+    session.record(turn, reply)
+    session.schedule_compaction(gemini.generate_text)
+    return reply
+
+
+@app.post("/chat/sessions", status_code=201)
+def create_session(request: SessionRequest):
+    """
+    Starts a server-side conversation. Pass the returned session_id to /chat
+    and /chat/stream and send only the new message each turn.
+    """
+    session = session_store.create(request.system_prompt)
+    return {"session_id": session.id, "ttl_seconds": session_store.ttl_seconds}
+
+
+@app.get("/chat/sessions/{session_id}")
+def get_session(session_id: str):
+    return lookup_session(session_id).to_status()
+
+
+@app.delete("/chat/sessions/{session_id}", status_code=204)
+def delete_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Chat session not found or expired")
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(
+    request: ChatRequest, x_records_token: Optional[str] = Header(None)
+) -> ChatResponse:
+    """
+    Without session_id, `messages` is the whole conversation. With one, it is
+    only the new turn; the server adds the stored history.
+    With patient_id (and a valid X-Records-Token) the most relevant passages
+    of that patient's stored recordings are added to the prompt (see
+    retrieval) and listed in `sources`.
+    """
+    if not GEMINI_API_KEY:
+        raise HTTPException(
+            status_code=500,
+            detail="GEMINI_API_KEY is not set on the server.",
+        )
+    require_grounding_access(request, x_records_token)
+
+    sources = await retrieve_sources(request)
+    grounding = grounding_contents(sources)
+    try:
+        # a retry of a request Gemini is still answering waits for that answer
+        if request.session_id:
+            session = lookup_session(request.session_id)
+            reply_text, _ = await chat_flights.do(
+                make_key("chat_session", session.id, chat_key(request)),
+                lambda: session_turn(session, request, grounding),
+            )
+        else:
+            contents = build_contents(request, grounding)
+            reply_text, _ = await chat_flights.do(
+                chat_key(request), lambda: generate_reply(contents, "stateless")
+            )
+    except GeminiOverloaded as exc:
+        raise HTTPException(
+            status_code=503,
+            detail=str(exc),
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+    except GeminiError as exc:
+        raise HTTPException(
+            status_code=exc.status_code or 502,
+            detail=str(exc),
+        ) from exc
+
+    return ChatResponse(
+        reply=reply_text, session_id=request.session_id, sources=source_refs(sources)
+    )
+
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Formats one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest, x_records_token: Optional[str] = Header(None)
+) -> StreamingResponse:
+    """
+    Streaming variant of /chat. Relays Gemini's reply as server-sent events
+    while it is generated:
+        data: {"delta": "..."}              one per chunk
+        event: done / data: {"reply": ..., "sources": [...]}  full reply at the end
+        event: error / data: {"detail": ...} if Gemini fails mid-stream
+    With session_id the turn is added to the session once the reply is complete.
+    """
+    if not GEMINI_API_KEY:
+        raise HTTPException(
+            status_code=500,
+            detail="GEMINI_API_KEY is not set on the server.",
+        )
+
+    require_grounding_access(request, x_records_token)
+    session = lookup_session(request.session_id) if request.session_id else None
+    sources = await retrieve_sources(request)
+    grounding = grounding_contents(sources)
+    if session is not None:
+        turn, contents = session_contents(session, request, grounding)
+    else:
+        contents = build_contents(request, grounding)
+    chunks = gemini.stream_generate_content(contents)
+
+    # Wait for the first chunk before answering so upstream failures still
+    # surface as a regular HTTP error instead of a half-open stream
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = ""
+    except GeminiOverloaded as exc:
+        raise HTTPException(
+            status_code=503,
+            detail=str(exc),
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+    except GeminiError as exc:
+        raise HTTPException(
+            status_code=exc.status_code or 502,
+            detail=str(exc),
+        ) from exc
+
+    async def events():
+        reply = first
+        if first:
+            yield sse_event({"delta": first})
+        try:
+            async for text in chunks:
+                reply += text
+                yield sse_event({"delta": text})
+        except GeminiError as exc:
+            yield sse_event({"detail": str(exc)}, event="error")
+            return
+        finally:
+            # release the upstream connection if the client went away early
+            await chunks.aclose()
+        reply = reply.strip() or "Sorry, I could not generate a response."
+        if session is not None:
+            session.record(turn, reply)
+            session.schedule_compaction(gemini.generate_text)
+        yield sse_event({"reply": reply, "sources": source_refs(sources)}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/transcribe_summarize")
 async def transcribe_summarize(
+    http_request: Request,
     file: UploadFile = File(...),
     whisper_model: str = "base.en",
+    latency_budget: Optional[float] = None,
 ):
     """
-    Receives uploaded audio file, saves it temporarily, runs whisper CLI to transcribe,
-    summarizes using Gemini, returns JSON { transcript, summary }.
+    Receives uploaded audio file, decodes it in memory, transcribes it with the
+    shared in-process Whisper engine, summarizes using Gemini,
+    returns JSON { transcript, segments, summary, whisper_model }.
+    whisper_model="auto" lets the server pick a model that finishes within
+    `latency_budget` seconds under the current load.
+    A retry of an upload that is still being processed waits for that run.
+    When Gemini fails (circuit open, overloaded, out of retries or past the
+    summary deadline) the transcript is returned with "summary": None and
+    the reason in "summary_error".
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="No filename provided")
 
-    # Save upload to temp file
-    suffix = Path(file.filename).suffix or ".wav"
-    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-        tmp_name = tmp.name
+    digest = hashlib.sha256()
+
+    async def chunks():
         while True:
-            chunk = await file.read(4096)
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
             if not chunk:
                 break
-            tmp.write(chunk)
+            yield chunk
 
+    client = http_request.headers.get(CLIENT_ID_HEADER) or (
+        http_request.client.host if http_request.client else "unknown"
+    )
+    timings = {}
+    smallest_model = candidates(whisper_model)[-1]
     try:
-        # run whisper CLI (will create <basename>.txt etc in same dir)
-        transcript = run_whisper_cli_on_file(tmp_name, model=whisper_model)
-
-        # summarize with Gemini
-        summary = summarize_transcript_with_gemini(transcript)
-
-        return {
-            "filename": file.filename,
-            "transcript": transcript,
-            "summary": summary,
-        }
-    except requests.HTTPError as e:
-        detail = (
-            e.response.text
-            if hasattr(e, "response") and getattr(e, "response") is not None
-            else str(e)
-        )
-        raise HTTPException(status_code=502, detail=f"Gemini API error: {detail}")
+        # cheap refusal before the upload is read: queue full or client over its share
+        transcription_pool.check_admission(client, model=smallest_model)
+        # stream the upload through ffmpeg straight into memory (no temp file)
+        audio = await decode_stream(chunks(), on_chunk=digest.update, timings=timings)
+
+        async def run():
+            run_timings = {}
+            model, model_selection = select_model(
+                whisper_model, len(audio) / SAMPLE_RATE, transcription_pool, latency_budget
+            )
+            # transcribe on a warm worker process (no CLI, no output files)
+            with stage_timer(run_timings, "transcribe"):
+                result = await transcription_pool.transcribe_long(audio, model=model, client=client)
+
+            # summarize with Gemini over the shared async client
+            summary = summary_error = None
+            try:
+                with stage_timer(run_timings, "summarize"):
+                    summary = await summarize_transcript_with_gemini(
+                        result["text"], segments=result["segments"]
+                    )
+            except GeminiError as e:
+                # don't throw away the transcription; the client can summarize later
+                logger.warning(f"Returning transcript without summary: {e}")
+                summary_error = str(e)
+            observe_stages(run_timings)
+            return {
+                "transcript": result["text"],
+                "segments": result["segments"],
+                "summary": summary,
+                **({"summary_error": summary_error} if summary_error else {}),
+                "whisper_model": model,
+                "model_selection": model_selection,
+            }
+
+        flight_key = make_key("transcribe_summarize", digest.hexdigest(), whisper_model, str(latency_budget))
+        if flight_key not in upload_flights:
+            # a retry of work already in flight attaches to it below whatever the load;
+            # new work is refused if the queue (or this client's share) is full, or if
+            # it would wait too long even on the smallest model it may run on
+            transcription_pool.check_admission(client, len(audio) / SAMPLE_RATE, smallest_model)
+        result, coalesced = await upload_flights.do(flight_key, run)
+        return {"filename": file.filename, **result, "coalesced": coalesced}
+    except ClientQuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TranscriptionPoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except AudioTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except AudioDecodeTimeout as e:
+        # the decoder stalled or the host is overloaded; the upload itself may be fine
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode audio: {e}")
+    except GeminiOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except GeminiError as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        # cleanup temp files: uploaded + whisper outputs (txt, srt, vtt, json)
-        try:
-            p = Path(tmp_name)
-            base = p.with_suffix("").name
-            dirp = p.parent
-            # list of possible outputs that whisper produced (basename.*)
-            for ext in ["", ".txt", ".srt", ".vtt", ".json", ".tsv"]:
-                candidate = dirp / (base + ext)
-                try:
-                    if candidate.exists():
-                        candidate.unlink()
-                except Exception:
-                    pass
-        except Exception:
-            pass
+        observe_stages(timings)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: per-stage latency histograms, queue and Gemini counters."""
+    return metrics_response()
 
 
 @app.get("/")
@@ -248,14 +551,33 @@ def root():
     return {"status": "ok", "message": "Chatbot API is running"}
 
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the Whisper models are loaded, 503 until then."""
+    body = {"ready": transcription_pool.ready, "state": transcription_pool.state}
+    if not transcription_pool.ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
 @app.get("/health")
 def health():
-    """Detailed health check"""
-    return {
+    """
+    Detailed health check from cached flags; never imports whisper/torch.
+    `state` is "warming" until the transcription workers have their models.
+    """
+    response = {
         "status": "ok",
+        "state": transcription_pool.state,
         "gemini_api_key_set": GEMINI_API_KEY is not None,
+        "gemini_circuit": gemini.breaker.state,
         "gemini_model": GEMINI_MODEL,
+        "chat_sessions": len(session_store),
+        "retrieval_passages": retrieval_index.passages,
     }
+    if transcription_pool.state_detail:
+        response["whisper_error"] = transcription_pool.state_detail
+    return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,578 @@
+"""
+Shared async client for the Gemini REST API.
+
+One pooled `httpx.AsyncClient` per event loop keeps TLS connections alive
+(HTTP/2 when the `h2` package is installed), every call has its own timeout,
+and a semaphore caps how many requests are in flight at once. Calls that
+would wait behind more than GEMINI_QUEUE_SIZE others are refused right away
+with GeminiOverloaded (HTTP 503 plus a Retry-After estimated from recent
+call latency). `/chat`, the summarizers and the CLI all go through it.
+
+Calls are made resilient to a slow or failing upstream:
+
+    retries   generateContent has no side effects, so failures that may be
+              transient (429, 5xx, timeouts, connection errors) are retried
+              with full-jitter exponential backoff. A Retry-After from
+              Gemini is honoured when it is longer than the backoff; one
+              beyond GEMINI_RETRY_MAX_DELAY_SECONDS ends the retries. A
+              stream is only retried until its first chunk has been yielded.
+              Retries get a shorter timeout (GEMINI_RETRY_TIMEOUT_SECONDS), and
+              a call, retries included, ends after GEMINI_DEADLINE_SECONDS
+              or sooner inside a `gemini_deadline()` block (which bounds all
+              the calls of, say, one map-reduce summary together).
+    hedging   with GEMINI_HEDGE_REQUESTS=1, a call still unanswered after
+              the p95 of recent call latencies gets a duplicate request (if
+              a slot is free) and the first answer wins. This cuts the tail
+              latency for at most ~5% more upstream calls.
+    breaker   after GEMINI_BREAKER_FAILURES consecutive failures the circuit
+              opens. For GEMINI_BREAKER_RESET_SECONDS calls then fail fast
+              with GeminiUnavailable instead of tying up a slot for a full
+              timeout. Then a single probe call is let through, and its
+              outcome closes or re-opens the circuit.
+
+Configuration (environment):
+    GEMINI_API_KEY           API key (required)
+    GEMINI_MODEL             model name (default gemini-2.5-flash)
+    GEMINI_BASE_URL          API root (default https://generativelanguage.googleapis.com/v1beta)
+    GEMINI_TIMEOUT_SECONDS   per-call timeout (default 60)
+    GEMINI_MAX_CONCURRENCY   requests in flight per process (default 16)
+    GEMINI_QUEUE_SIZE        requests allowed to wait for a free slot (default 64)
+    GEMINI_MAX_CONNECTIONS   pooled connections (default 20)
+    GEMINI_MAX_RETRIES              retries of a failed call (default 3)
+    GEMINI_RETRY_BASE_SECONDS       backoff before the first retry, doubled per retry (default 0.5)
+    GEMINI_RETRY_MAX_DELAY_SECONDS  longest backoff or Retry-After waited for (default 10)
+    GEMINI_RETRY_TIMEOUT_SECONDS    per-attempt timeout of retries (default 20)
+    GEMINI_DEADLINE_SECONDS         longest a call may take, retries included (default 90)
+    GEMINI_HEDGE_REQUESTS           "1" to hedge slow calls (default "0")
+    GEMINI_BREAKER_FAILURES         consecutive failures that open the circuit (default 5)
+    GEMINI_BREAKER_RESET_SECONDS    time the circuit stays open before a probe (default 30)
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from metrics import GEMINI_BREAKER_STATE, GEMINI_ERRORS, GEMINI_HEDGES, GEMINI_RETRIES, STAGE_SECONDS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_BASE_URL = os.getenv(
+    "GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta"
+).rstrip("/")
+GEMINI_ENDPOINT = f"{GEMINI_BASE_URL}/models/{GEMINI_MODEL}:generateContent"
+GEMINI_STREAM_ENDPOINT = f"{GEMINI_BASE_URL}/models/{GEMINI_MODEL}:streamGenerateContent"
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "20"))
+GEMINI_QUEUE_SIZE = int(os.getenv("GEMINI_QUEUE_SIZE", "64"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_RETRY_BASE_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_SECONDS", "0.5"))
+GEMINI_RETRY_MAX_DELAY_SECONDS = float(os.getenv("GEMINI_RETRY_MAX_DELAY_SECONDS", "10"))
+GEMINI_RETRY_TIMEOUT_SECONDS = float(os.getenv("GEMINI_RETRY_TIMEOUT_SECONDS", "20"))
+GEMINI_DEADLINE_SECONDS = float(os.getenv("GEMINI_DEADLINE_SECONDS", "90"))
+GEMINI_HEDGE_REQUESTS = os.getenv("GEMINI_HEDGE_REQUESTS", "0") == "1"
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_RESET_SECONDS = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+# weight of the newest call in the latency moving average used for Retry-After
+LATENCY_SMOOTHING = 0.2
+# upstream statuses worth retrying; other 4xx would fail the same way again
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+# recent call latencies kept for the hedging delay, and how many are needed first
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+HEDGE_PERCENTILE = 0.95
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class GeminiError(RuntimeError):
+    """
+    A failed Gemini call. `status_code` is the upstream HTTP status,
+    or None when the request never got a response (timeout, connection error).
+    """
+
+    def __init__(
+        self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        # seconds the upstream asked us to wait (its Retry-After header), if any
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code is None or self.status_code in RETRYABLE_STATUSES
+
+
+class GeminiOverloaded(GeminiError):
+    """Raised instead of queueing when GEMINI_QUEUE_SIZE calls are already waiting."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message, status_code=503, retry_after=max(1, math.ceil(retry_after)))
+
+    @property
+    def retryable(self) -> bool:
+        # the queue is ours: retrying here would only add to it
+        return False
+
+
+class GeminiUnavailable(GeminiOverloaded):
+    """Raised without calling Gemini while the circuit breaker is open."""
+
+
+class GeminiDeadlineExceeded(GeminiError):
+    """Raised when a call (with its retries) runs out of time."""
+
+    def __init__(self, message: str = "Gemini call exceeded its deadline"):
+        super().__init__(message, status_code=504)
+
+    @property
+    def retryable(self) -> bool:
+        return False
+
+
+# absolute time.monotonic() by which calls in the current context must finish
+_deadline: ContextVar[Optional[float]] = ContextVar("gemini_deadline", default=None)
+
+
+@contextmanager
+def gemini_deadline(seconds: float):
+    """Every Gemini call in the block, and in tasks started from it, ends within `seconds` from now."""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _call_deadline() -> float:
+    deadline = time.monotonic() + GEMINI_DEADLINE_SECONDS
+    outer = _deadline.get()
+    return deadline if outer is None else min(outer, deadline)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), None if absent or invalid."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _error_detail(response: httpx.Response) -> str:
+    try:
+        payload = response.json()
+        return payload.get("error", {}).get("message", str(payload))
+    except Exception:
+        return response.text
+
+
+def _response_error(response: httpx.Response) -> GeminiError:
+    GEMINI_ERRORS.labels(str(response.status_code)).inc()
+    return GeminiError(
+        f"Gemini API error: {_error_detail(response)}",
+        status_code=response.status_code,
+        retry_after=_retry_after(response),
+    )
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based): a random time up
+    to the exponential backoff ("full jitter", so clients that failed together
+    don't retry together), but at least the upstream's Retry-After.
+    """
+    ceiling = min(GEMINI_RETRY_MAX_DELAY_SECONDS, GEMINI_RETRY_BASE_SECONDS * 2 ** attempt)
+    return max(random.uniform(0, ceiling), retry_after or 0.0)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker: "closed" (calls pass), "open" (calls
+    fail fast) and "half_open" (one probe call decides which one is next).
+    """
+
+    STATES = ("closed", "half_open", "open")
+
+    def __init__(
+        self,
+        failure_threshold: int = GEMINI_BREAKER_FAILURES,
+        reset_seconds: float = GEMINI_BREAKER_RESET_SECONDS,
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    @contextmanager
+    def guard(self):
+        """Lets one call through, or raises GeminiUnavailable while the circuit is open."""
+        if self.state == "open" and not self.retry_after():
+            self.state = "half_open"
+        if self.state == "open" or (self.state == "half_open" and self._probing):
+            raise GeminiUnavailable(
+                f"Gemini is unavailable (circuit open after {self.failures} consecutive failures)",
+                retry_after=self.retry_after() or 1,
+            )
+        probe = self.state == "half_open"
+        self._probing = self._probing or probe
+        try:
+            yield
+        finally:
+            # a probe that was cancelled (e.g. lost a hedge) lets the next call probe
+            if probe:
+                self._probing = False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info("Gemini circuit closed")
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or (
+            self.state == "closed" and self.failures >= self.failure_threshold
+        ):
+            logger.warning(
+                f"Gemini circuit opened for {self.reset_seconds:.0f}s "
+                f"after {self.failures} consecutive failures"
+            )
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def record(self, error: Optional[GeminiError]) -> None:
+        """Counts a finished call: only failures that say the upstream is unhealthy count."""
+        if error is None or not error.retryable:
+            self.record_success()
+        else:
+            self.record_failure()
+
+
+def extract_text(data: Dict[str, Any], strip: bool = True) -> str:
+    """Joins the text parts of the first candidate; raises KeyError/IndexError if absent."""
+    parts = data["candidates"][0]["content"]["parts"]
+    text = "".join(p.get("text", "") for p in parts)
+    return text.strip() if strip else text
+
+
+class GeminiClient:
+    def __init__(
+        self,
+        api_key: Optional[str] = GEMINI_API_KEY,
+        endpoint: str = GEMINI_ENDPOINT,
+        stream_endpoint: str = GEMINI_STREAM_ENDPOINT,
+        timeout: float = GEMINI_TIMEOUT_SECONDS,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        max_connections: int = GEMINI_MAX_CONNECTIONS,
+        queue_size: int = GEMINI_QUEUE_SIZE,
+        max_retries: int = GEMINI_MAX_RETRIES,
+        hedge: bool = GEMINI_HEDGE_REQUESTS,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.stream_endpoint = stream_endpoint
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_connections = max(1, max_connections)
+        self.queue_size = max(0, queue_size)
+        self.max_retries = max(0, max_retries)
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self._waiting = 0
+        self._latency = 1.0
+        self._latencies: deque = deque(maxlen=HEDGE_WINDOW)
+        # httpx clients and asyncio semaphores belong to one event loop;
+        # the CLI runs a fresh loop per asyncio.run(), so keep one set per loop
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop or self._http.is_closed:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._http = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._http
+
+    def estimated_wait(self) -> float:
+        """Seconds before a new call would get a slot, from the recent call latency."""
+        return (self._waiting + 1) * self._latency / self.max_concurrency
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Holds one of the `max_concurrency` slots; refuses to queue past `queue_size`."""
+        if self._semaphore.locked() and self._waiting >= self.queue_size:
+            raise GeminiOverloaded(
+                f"Gemini is overloaded ({self._waiting} calls waiting)",
+                retry_after=self.estimated_wait(),
+            )
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+            elapsed = time.perf_counter() - started
+            self._latency = (1 - LATENCY_SMOOTHING) * self._latency + LATENCY_SMOOTHING * elapsed
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a call gets a hedged duplicate; None until enough calls were measured."""
+        if not self.hedge or len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(HEDGE_PERCENTILE * len(ordered)))]
+
+    def _attempt_timeout(self, attempt: int, timeout: Optional[float], deadline: float) -> float:
+        """Timeout of attempt number `attempt`: shorter for retries, and never past `deadline`."""
+        limit = timeout or self.timeout
+        if attempt:
+            limit = min(limit, GEMINI_RETRY_TIMEOUT_SECONDS)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise GeminiDeadlineExceeded()
+        return min(limit, remaining)
+
+    async def _wait_to_retry(self, attempt: int, error: GeminiError, deadline: float) -> None:
+        """Sleeps before retry number `attempt`, or re-raises `error` if it shouldn't be retried."""
+        if not error.retryable or attempt >= self.max_retries:
+            raise error
+        if (error.retry_after or 0) > GEMINI_RETRY_MAX_DELAY_SECONDS:
+            logger.warning(f"Not retrying Gemini call: asked to wait {error.retry_after:.0f}s")
+            raise error
+        delay = backoff_delay(attempt, error.retry_after)
+        if time.monotonic() + delay >= deadline:
+            logger.warning("Not retrying Gemini call: its deadline would pass first")
+            raise error
+        GEMINI_RETRIES.labels(str(error.status_code or "transport")).inc()
+        logger.warning(
+            f"Gemini call failed ({error}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+        )
+        await asyncio.sleep(delay)
+
+    async def _with_retries(
+        self, call: Callable[[float], Awaitable[Any]], timeout: Optional[float], deadline: float
+    ) -> Any:
+        """Runs call(attempt timeout) until it succeeds, retries run out, or `deadline` passes."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await call(self._attempt_timeout(attempt, timeout, deadline))
+            except GeminiError as e:
+                await self._wait_to_retry(attempt, e, deadline)
+
+    async def _hedged(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs `call`; if it hasn't finished after `hedge_delay()` and a slot is
+        free, runs it a second time and returns whichever succeeds first.
+        """
+        delay = self.hedge_delay()
+        if delay is None:
+            return await call()
+        tasks = {asyncio.ensure_future(call())}
+        primary = next(iter(tasks))
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or self._semaphore.locked():
+                return await primary
+            GEMINI_HEDGES.labels("sent").inc()
+            tasks.add(asyncio.ensure_future(call()))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        GEMINI_HEDGES.labels("primary_won" if task is primary else "hedge_won").inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _post(self, http: httpx.AsyncClient, contents: List[Dict[str, Any]], timeout: float):
+        """One generateContent request, counted by the circuit breaker."""
+        with self.breaker.guard():
+            async with self._slot():
+                started = time.perf_counter()
+                try:
+                    response = await http.post(
+                        self.endpoint,
+                        params={"key": self.api_key},
+                        json={"contents": contents},
+                        timeout=timeout,
+                    )
+                except httpx.HTTPError as e:
+                    GEMINI_ERRORS.labels(type(e).__name__).inc()
+                    error = GeminiError(f"Error calling Gemini API: {e!r}")
+                    self.breaker.record(error)
+                    raise error from e
+                finally:
+                    STAGE_SECONDS.labels("gemini").observe(time.perf_counter() - started)
+
+            if response.is_error:
+                error = _response_error(response)
+                self.breaker.record(error)
+                raise error
+            self.breaker.record(None)
+            self._latencies.append(time.perf_counter() - started)
+            return response.json()
+
+    async def generate_content(
+        self, contents: List[Dict[str, Any]], timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        POSTs `contents` to generateContent and returns the decoded JSON response,
+        retrying (and optionally hedging) transient failures.
+        Raises GeminiError once retries are exhausted, right away on other
+        non-2xx responses, GeminiUnavailable while the circuit is open, and
+        GeminiDeadlineExceeded when the call runs past its deadline.
+        """
+        if not self.api_key:
+            raise GeminiError("GEMINI_API_KEY is not set on the server.")
+
+        http = self._ensure_client()
+        deadline = _call_deadline()
+        try:
+            # also bounds time spent waiting for a slot, which no request timeout covers
+            return await asyncio.wait_for(
+                self._with_retries(
+                    lambda limit: self._hedged(lambda: self._post(http, contents, limit)), timeout, deadline
+                ),
+                max(0.0, deadline - time.monotonic()),
+            )
+        except asyncio.TimeoutError:
+            raise GeminiDeadlineExceeded() from None
+
+    async def _stream(
+        self, http: httpx.AsyncClient, contents: List[Dict[str, Any]], timeout: float
+    ) -> AsyncIterator[str]:
+        """One streamGenerateContent request, counted by the circuit breaker."""
+        with self.breaker.guard():
+            async with self._slot():
+                started = time.perf_counter()
+                try:
+                    async with http.stream(
+                        "POST",
+                        self.stream_endpoint,
+                        params={"key": self.api_key, "alt": "sse"},
+                        json={"contents": contents},
+                        timeout=timeout,
+                    ) as response:
+                        if response.is_error:
+                            await response.aread()
+                            error = _response_error(response)
+                            self.breaker.record(error)
+                            raise error
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            try:
+                                text = extract_text(json.loads(line[len("data:"):]), strip=False)
+                            except (ValueError, KeyError, IndexError):
+                                # keep-alives and chunks without text (e.g. final usage metadata)
+                                continue
+                            if text:
+                                yield text
+                    self.breaker.record(None)
+                except httpx.HTTPError as e:
+                    GEMINI_ERRORS.labels(type(e).__name__).inc()
+                    error = GeminiError(f"Error calling Gemini API: {e!r}")
+                    self.breaker.record(error)
+                    raise error from e
+                finally:
+                    STAGE_SECONDS.labels("gemini_stream").observe(time.perf_counter() - started)
+
+    async def stream_generate_content(
+        self, contents: List[Dict[str, Any]], timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Calls streamGenerateContent (server-sent events) and yields the text
+        of each chunk as soon as it arrives. Failures before the first chunk
+        are retried like `generate_content`; later ones would repeat text.
+        Raises GeminiError on transport errors and non-2xx responses.
+        """
+        if not self.api_key:
+            raise GeminiError("GEMINI_API_KEY is not set on the server.")
+
+        http = self._ensure_client()
+        deadline = _call_deadline()
+        for attempt in range(self.max_retries + 1):
+            streamed = False
+            try:
+                limit = self._attempt_timeout(attempt, timeout, deadline)
+                async for text in self._stream(http, contents, limit):
+                    streamed = True
+                    yield text
+                return
+            except GeminiError as e:
+                if streamed:
+                    raise
+                await self._wait_to_retry(attempt, e, deadline)
+
+    async def generate_text(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """
+        Sends a single user prompt and returns the reply text, or a
+        "[Gemini parse error] ..." string if the response has no text.
+        """
+        data = await self.generate_content([{"parts": [{"text": prompt}]}], timeout=timeout)
+        try:
+            return extract_text(data)
+        except (KeyError, IndexError) as e:
+            logger.error(f"Failed to parse Gemini response: {e}")
+            return f"[Gemini parse error] {json.dumps(data)}"
+
+
+gemini = GeminiClient()
+GEMINI_BREAKER_STATE.set_function(lambda: CircuitBreaker.STATES.index(gemini.breaker.state))
@@ -0,0 +1,168 @@
+"""
+Background job queue for long-running transcription requests.
+
+Instead of holding the HTTP connection open while Whisper and Gemini run,
+the client submits a job, gets an id back immediately and polls for the
+status and result. Jobs run on a fixed number of asyncio workers; finished
+jobs are kept for a TTL and then dropped.
+
+Configuration (environment):
+    JOB_CONCURRENCY         jobs processed at the same time (default 2)
+    JOB_QUEUE_SIZE          jobs allowed to wait (default 100)
+    JOB_RESULT_TTL_SECONDS  how long finished jobs are kept (default 3600)
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when JOB_QUEUE_SIZE jobs are already waiting."""
+
+
+class Job:
+    def __init__(
+        self,
+        runner: Callable[["Job"], Awaitable[Dict[str, Any]]],
+        metadata: Dict[str, Any],
+        client: Optional[str] = None,
+    ):
+        self.id = uuid.uuid4().hex
+        # who submitted it, for the transcription pool's per-client limit; not reported
+        self.client = client
+        self.status = QUEUED
+        self.metadata = metadata
+        self.stages: Dict[str, float] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._runner = runner
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_status(self) -> Dict[str, Any]:
+        status = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "stages": dict(self.stages),
+            **self.metadata,
+        }
+        if self.started_at is not None:
+            status["queued_seconds"] = round(self.started_at - self.created_at, 4)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+class JobManager:
+    def __init__(
+        self,
+        concurrency: int = JOB_CONCURRENCY,
+        queue_size: int = JOB_QUEUE_SIZE,
+        ttl_seconds: float = JOB_RESULT_TTL_SECONDS,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(1, queue_size)
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.concurrency)
+        ]
+        logger.info(f"Started {self.concurrency} job workers (queue size {self.queue_size})")
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(
+        self, runner: Callable[[Job], Awaitable[Dict[str, Any]]], client: Optional[str] = None, **metadata
+    ) -> Job:
+        """
+        Queues `runner(job)`; its return value becomes the job result.
+        `client` is kept on the job for the runner's fair-share accounting.
+        Raises JobQueueFull if too many jobs are waiting.
+        """
+        self.start()
+        self._purge_expired()
+        job = Job(runner, metadata, client)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Job queue is full ({self.queue_depth} jobs waiting)")
+        self._jobs[job.id] = job
+        logger.info(f"Queued job {job.id} ({self.queue_depth} waiting)")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge_expired()
+        return self._jobs.get(job_id)
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = RUNNING
+            job.started_at = time.time()
+            try:
+                job.result = await job._runner(job)
+                job.status = DONE
+                logger.info(f"Job {job.id} done in {time.time() - job.started_at:.2f}s")
+            except asyncio.CancelledError:
+                job.status = FAILED
+                job.error = "Job cancelled"
+                raise
+            except Exception as e:
+                job.status = FAILED
+                job.error = str(e)
+                logger.error(f"Job {job.id} failed: {e}")
+            finally:
+                job.finished_at = time.time()
+                job._runner = None
+                self._queue.task_done()
+
+
+job_manager = JobManager()
@@ -0,0 +1,139 @@
+"""
+Incremental transcription of audio that is still being recorded.
+
+Samples are appended to a rolling buffer. Each time enough new audio has
+arrived, the whole uncommitted buffer is transcribed again; segments that end
+well before the end of the buffer are considered stable, committed with
+timestamps on the recording's timeline and dropped from the buffer. The rest
+is re-transcribed together with the next audio, so words cut at a window edge
+get a second chance. When recording stops only the short uncommitted tail is
+left to transcribe.
+
+Configuration (environment):
+    LIVE_STEP_SECONDS      new audio needed before re-transcribing (default 5)
+    LIVE_WINDOW_SECONDS    max uncommitted audio kept in the buffer (default 30)
+    LIVE_HOLDBACK_SECONDS  segments ending this close to the buffer end stay tentative (default 1.5)
+"""
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from audio_ingest import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+LIVE_STEP_SECONDS = float(os.getenv("LIVE_STEP_SECONDS", "5"))
+LIVE_WINDOW_SECONDS = float(os.getenv("LIVE_WINDOW_SECONDS", "30"))
+LIVE_HOLDBACK_SECONDS = float(os.getenv("LIVE_HOLDBACK_SECONDS", "1.5"))
+
+# characters of committed text passed to whisper as context for the next window
+PROMPT_CONTEXT_CHARS = 200
+
+Transcribe = Callable[..., Awaitable[Dict[str, Any]]]
+
+
+class LiveTranscriber:
+    def __init__(
+        self,
+        transcribe: Transcribe,
+        step_seconds: float = LIVE_STEP_SECONDS,
+        window_seconds: float = LIVE_WINDOW_SECONDS,
+        holdback_seconds: float = LIVE_HOLDBACK_SECONDS,
+    ):
+        """`transcribe(audio, **options)` must return the transcription_engine result dict."""
+        self._transcribe = transcribe
+        self.step_samples = int(step_seconds * SAMPLE_RATE)
+        self.window_samples = int(window_seconds * SAMPLE_RATE)
+        self.holdback_seconds = holdback_seconds
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0  # sample offset of _buffer[0] in the recording
+        self._unprocessed = 0  # samples added since the last transcription
+        self.committed: List[Dict[str, Any]] = []
+        self.tentative_text = ""
+
+    @property
+    def duration(self) -> float:
+        """Seconds of audio received so far."""
+        return (self._buffer_start + len(self._buffer)) / SAMPLE_RATE
+
+    @property
+    def text(self) -> str:
+        return "".join(segment["text"] for segment in self.committed).strip()
+
+    def feed(self, samples: np.ndarray) -> None:
+        if len(samples):
+            self._buffer = np.concatenate([self._buffer, samples.astype(np.float32, copy=False)])
+            self._unprocessed += len(samples)
+
+    def ready(self) -> bool:
+        """True when enough new audio arrived to be worth another pass."""
+        return self._unprocessed >= self.step_samples
+
+    async def step(self, final: bool = False) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Transcribes the uncommitted buffer. Returns (newly committed segments,
+        tentative text of the uncommitted tail). With final=True everything is committed.
+        `feed()` may keep appending while the transcription is awaited; only
+        the audio that was actually transcribed is committed or dropped.
+        """
+        self._unprocessed = 0
+        audio = self._buffer
+        transcribed = len(audio)
+        if transcribed == 0:
+            self.tentative_text = ""
+            return [], ""
+
+        options = {}
+        context = self.text[-PROMPT_CONTEXT_CHARS:]
+        if context:
+            options["initial_prompt"] = context
+        result = await self._transcribe(audio, **options)
+        segments = result["segments"]
+
+        buffer_seconds = transcribed / SAMPLE_RATE
+        if final:
+            stable = segments
+        else:
+            # the last segment may be cut mid-word; keep it and anything near the end tentative
+            stable = [
+                s for s in segments[:-1] if s["end"] <= buffer_seconds - self.holdback_seconds
+            ]
+            if not stable and transcribed >= self.window_samples:
+                # buffer is full without a safe cut point: commit what we have
+                stable = segments[:-1] or segments
+
+        new_segments = self._commit(stable)
+
+        if final:
+            self._drop_until(transcribed)
+        elif stable:
+            self._drop_until(int(stable[-1]["end"] * SAMPLE_RATE))
+        elif not segments and transcribed >= self.window_samples:
+            # nothing but silence: keep only the holdback tail (and what arrived meanwhile)
+            self._drop_until(transcribed - int(self.holdback_seconds * SAMPLE_RATE))
+
+        remaining = segments[len(stable):]
+        self.tentative_text = "".join(s["text"] for s in remaining).strip()
+        return new_segments, self.tentative_text
+
+    def _commit(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        offset = self._buffer_start / SAMPLE_RATE
+        committed = []
+        for segment in segments:
+            committed.append(
+                {
+                    **segment,
+                    "id": len(self.committed) + len(committed),
+                    "start": round(segment["start"] + offset, 3),
+                    "end": round(segment["end"] + offset, 3),
+                }
+            )
+        self.committed.extend(committed)
+        return committed
+
+    def _drop_until(self, sample: int) -> None:
+        sample = max(0, min(sample, len(self._buffer)))
+        self._buffer = self._buffer[sample:]
+        self._buffer_start += sample
@@ -0,0 +1,286 @@
+"""
+Open-loop load generator for both FastAPI apps, with an SLO report.
+
+Requests arrive as a Poisson process at each target rate (they are not
+throttled by how fast the server answers, so a server that blocks shows up
+as growing latency and errors rather than a quietly lower request rate).
+The traffic mixes `/chat` on chatbot_backend with `/transcribe_summarize`
+on transcribe_summarize. For every rate the report shows p50/p95/p99
+latency, error rate and achieved throughput per endpoint. The saturation
+point is the highest rate that still met the SLOs.
+
+Unless --chat-url / --transcribe-url are given, both apps are started with
+uvicorn on free ports. Gemini is then served by `stub_gemini`, and the
+result cache is disabled so every upload is transcribed.
+
+Every request carries a different payload: the chat message gets a request
+number and a WAV upload has its last sample nudged. Otherwise concurrent
+requests would be identical and the servers would coalesce them into one
+run, measuring deduplication rather than load. --identical-payloads sends
+the same body every time, to measure exactly that.
+
+    python loadtest.py --rates 0.5,1,2,4 --duration 30 --mix chat=0.8,transcribe=0.2
+    python loadtest.py --transcribe-url http://127.0.0.1:8001 --mix transcribe=1 --rates 0.2,0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmark import SAMPLE_WAV, percentile, synthetic_speech, vary_audio, write_wav
+from stub_gemini import free_port, start_in_thread
+
+HERE = Path(__file__).resolve().parent
+# spawning the workers and loading the models, downloading them on a first run
+STARTUP_TIMEOUT_SECONDS = 300
+
+CHAT_BODY = {
+    "messages": [{"role": "user", "text": "Summarize the advice about checking blood pressure."}],
+    "system_prompt": "You are a concise medical assistant.",
+}
+
+
+def chat_body(n: int) -> Dict[str, Any]:
+    """CHAT_BODY with the request number in the message, so no two requests are identical."""
+    message = CHAT_BODY["messages"][0]
+    return {**CHAT_BODY, "messages": [{**message, "text": f"{message['text']} (request {n})"}]}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'chat=0.8,transcribe=0.2' -> {"chat": 0.8, "transcribe": 0.2} (normalized)."""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("chat", "transcribe"):
+            raise ValueError(f"Unknown request kind '{name}' (expected chat or transcribe)")
+        weights[name] = float(weight or 1)
+    total = sum(weights.values())
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def start_app(module: str, env: Dict[str, str]) -> Tuple[str, subprocess.Popen]:
+    """
+    Starts `module:app` under uvicorn and waits until its /ready reports the
+    models loaded, so the first rate step doesn't measure warm-up.
+    Returns (base URL, process).
+    """
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE,
+        env={**os.environ, **env},
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{module} exited with code {proc.returncode}")
+        try:
+            response = httpx.get(f"{url}/ready", timeout=1)
+            if response.status_code == 200:
+                return url, proc
+            if response.json().get("state") == "failed":
+                proc.kill()
+                raise RuntimeError(f"{module} failed to warm up; see its /health")
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    proc.kill()
+    raise RuntimeError(f"{module} was not ready within {STARTUP_TIMEOUT_SECONDS}s")
+
+
+class LoadTest:
+    def __init__(
+        self,
+        urls: Dict[str, str],
+        mix: Dict[str, float],
+        audio: bytes,
+        whisper_model: str,
+        timeout: float,
+        identical_payloads: bool = False,
+    ):
+        self.urls = urls
+        self.mix = mix
+        self.audio = audio
+        self.whisper_model = whisper_model
+        self.timeout = timeout
+        self.identical_payloads = identical_payloads
+        self._sent = 0
+
+    async def _request(self, client: httpx.AsyncClient, kind: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        self._sent += 1
+        # each request is its own simulated device, also for servers started elsewhere
+        headers = {"X-Client-Id": f"loadtest-{self._sent}"}
+        n = 0 if self.identical_payloads else self._sent
+        try:
+            if kind == "chat":
+                body = CHAT_BODY if self.identical_payloads else chat_body(n)
+                response = await client.post(f"{self.urls['chat']}/chat", json=body, headers=headers)
+            else:
+                audio = self.audio if self.identical_payloads else vary_audio(self.audio, n)
+                response = await client.post(
+                    f"{self.urls['transcribe']}/transcribe_summarize",
+                    params={"whisper_model": self.whisper_model},
+                    files={"file": ("load.wav", audio, "audio/wav")},
+                    headers=headers,
+                )
+            status = response.status_code
+        except httpx.TimeoutException:
+            status = "timeout"
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        return {"kind": kind, "status": status, "seconds": time.perf_counter() - started}
+
+    async def run_rate(self, rate: float, duration: float) -> List[Dict[str, Any]]:
+        """Fires requests at `rate` per second (Poisson arrivals) for `duration` seconds."""
+        kinds, weights = zip(*self.mix.items())
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            tasks = []
+            deadline = time.perf_counter() + duration
+            while True:
+                await asyncio.sleep(random.expovariate(rate))
+                if time.perf_counter() >= deadline:
+                    break
+                kind = random.choices(kinds, weights)[0]
+                tasks.append(asyncio.create_task(self._request(client, kind)))
+            return list(await asyncio.gather(*tasks))
+
+
+def report(results: List[Dict[str, Any]], duration: float, slo: Dict[str, float], max_error_rate: float) -> Dict[str, Any]:
+    """Per-kind latency percentiles, error rate and throughput, and whether the SLOs held."""
+    kinds = {}
+    for kind in sorted({r["kind"] for r in results}):
+        subset = [r for r in results if r["kind"] == kind]
+        ok = [r["seconds"] for r in subset if r["status"] == 200]
+        errors = len(subset) - len(ok)
+        p95 = percentile(ok, 95)
+        kinds[kind] = {
+            "requests": len(subset),
+            "errors": errors,
+            "error_rate": round(errors / len(subset), 4),
+            "statuses": {str(s): sum(1 for r in subset if r["status"] == s) for s in {r["status"] for r in subset}},
+            "throughput_rps": round(len(ok) / duration, 3),
+            "p50": percentile(ok, 50),
+            "p95": p95,
+            "p99": percentile(ok, 99),
+            "slo_met": p95 is not None and p95 <= slo[kind] and errors / len(subset) <= max_error_rate,
+        }
+    return {"kinds": kinds, "slo_met": all(k["slo_met"] for k in kinds.values())}
+
+
+def _seconds(value: Optional[float]) -> str:
+    return f"{value:9.3f}" if value is not None else f"{'-':>9}"
+
+
+def print_report(rate: float, summary: Dict[str, Any]) -> None:
+    print(f"\n== {rate:g} req/s ({'SLO met' if summary['slo_met'] else 'SLO MISSED'})")
+    print(f"{'endpoint':<12}{'reqs':>6}{'err%':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for kind, stats in summary["kinds"].items():
+        print(
+            f"{kind:<12}{stats['requests']:>6}{stats['error_rate'] * 100:>6.1f}%{stats['throughput_rps']:>8.2f}"
+            f"{_seconds(stats['p50'])}{_seconds(stats['p95'])}{_seconds(stats['p99'])}"
+        )
+
+
+async def run_all(test: LoadTest, rates: List[float], duration: float, args) -> Dict[str, Any]:
+    slo = {"chat": args.slo_chat_p95, "transcribe": args.slo_transcribe_p95}
+    steps = []
+    saturation: Optional[float] = None
+    for rate in rates:
+        results = await test.run_rate(rate, duration)
+        if not results:
+            continue
+        summary = report(results, duration, slo, args.max_error_rate)
+        print_report(rate, summary)
+        steps.append({"rate": rate, **summary})
+        if not summary["slo_met"]:
+            break
+        saturation = rate
+    return {"steps": steps, "max_rate_within_slo": saturation}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test chatbot_backend and transcribe_summarize")
+    parser.add_argument("--rates", default="0.5,1,2,4,8", help="comma-separated request rates (req/s), ramped in order")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per rate")
+    parser.add_argument("--mix", default="chat=0.8,transcribe=0.2", help="request mix weights")
+    parser.add_argument("--chat-url", help="running chatbot_backend (default: start one)")
+    parser.add_argument("--transcribe-url", help="running transcribe_summarize (default: start one)")
+    parser.add_argument("--audio", help="upload for /transcribe_summarize (default: samplekedar.wav or 10s synthetic)")
+    parser.add_argument("--whisper-model", default="tiny.en")
+    parser.add_argument("--gemini-latency", type=float, default=0.8, help="stub Gemini latency in seconds")
+    parser.add_argument("--gemini-jitter", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=120, help="client timeout per request")
+    parser.add_argument("--slo-chat-p95", type=float, default=2.0, help="p95 seconds for /chat")
+    parser.add_argument("--slo-transcribe-p95", type=float, default=30.0, help="p95 seconds for /transcribe_summarize")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--identical-payloads", action="store_true",
+                        help="send the same body every time (measures request coalescing, not load)")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    rates = [float(r) for r in args.rates.split(",")]
+
+    if args.audio:
+        audio = Path(args.audio).read_bytes()
+    elif SAMPLE_WAV.exists():
+        audio = SAMPLE_WAV.read_bytes()
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "load.wav"
+            write_wav(path, synthetic_speech(10))
+            audio = path.read_bytes()
+
+    processes = []
+    stub = None
+    urls = {"chat": args.chat_url, "transcribe": args.transcribe_url}
+    try:
+        if any(urls[kind] is None for kind in mix):
+            base_url, stub = start_in_thread(latency=args.gemini_latency, jitter=args.gemini_jitter)
+            env = {
+                "GEMINI_BASE_URL": base_url,
+                "GEMINI_API_KEY": "stub",
+                "RESULT_CACHE_PATH": "",
+                "RECORDS_DB_PATH": "",
+                # every upload comes from one address; don't let the per-client quota reject them
+                "TRANSCRIBE_MAX_PER_CLIENT": "0",
+            }
+            if args.whisper_model != "auto":
+                # workers also preload the auto candidates; keep them to the model under test
+                env["WHISPER_PRELOAD_MODELS"] = env["WHISPER_AUTO_MODELS"] = args.whisper_model
+            for kind, module in (("chat", "chatbot_backend"), ("transcribe", "transcribe_summarize")):
+                if kind in mix and urls[kind] is None:
+                    print(f"Starting {module}...", flush=True)
+                    urls[kind], proc = start_app(module, env)
+                    processes.append(proc)
+
+        test = LoadTest(urls, mix, audio, args.whisper_model, args.timeout, args.identical_payloads)
+        result = asyncio.run(run_all(test, rates, args.duration, args))
+    finally:
+        for proc in processes:
+            proc.terminate()
+            proc.wait()
+        if stub is not None:
+            stub.should_exit = True
+
+    saturation = result["max_rate_within_slo"]
+    print(f"\nHighest rate within SLO: {f'{saturation:g} req/s' if saturation else 'none of the tested rates'}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), **result}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Split-and-merge helpers for transcribing long recordings in parallel.
+
+A long recording is cut into chunks of roughly `chunk_seconds`, each cut
+placed in the middle of a pause found by the VAD so no word is split. The
+chunks are transcribed independently (on different worker processes) and the
+segment lists stitched back together with timestamps shifted by each chunk's
+offset, so times stay consistent with the original recording.
+
+Configuration (environment):
+    LONG_AUDIO_MIN_SECONDS    recordings at least this long are split (default 300)
+    LONG_AUDIO_CHUNK_SECONDS  target chunk length (default 120)
+"""
+import os
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from audio_ingest import SAMPLE_RATE
+from vad import detect_speech
+
+LONG_AUDIO_MIN_SECONDS = float(os.getenv("LONG_AUDIO_MIN_SECONDS", "300"))
+LONG_AUDIO_CHUNK_SECONDS = float(os.getenv("LONG_AUDIO_CHUNK_SECONDS", "120"))
+
+
+def plan_chunks(
+    audio: np.ndarray, chunk_seconds: float = LONG_AUDIO_CHUNK_SECONDS, sample_rate: int = SAMPLE_RATE
+) -> List[Tuple[int, int]]:
+    """
+    (start_sample, end_sample) chunks covering all of `audio`. Each cut is the
+    pause midpoint closest to the target length, searched between half and one
+    and a half target lengths; without a pause there the cut falls at the target.
+    """
+    target = int(chunk_seconds * sample_rate)
+    if len(audio) <= target * 1.5:
+        return [(0, len(audio))]
+
+    regions = detect_speech(audio, sample_rate)
+    cut_points = np.array(
+        [(end + next_start) // 2 for (_, end), (next_start, _) in zip(regions, regions[1:])],
+        dtype=np.int64,
+    )
+
+    chunks = []
+    start = 0
+    while len(audio) - start > target * 1.5:
+        low, high = start + target // 2, start + target * 3 // 2
+        wanted = start + target
+        candidates = cut_points[(cut_points > low) & (cut_points < high)]
+        cut = int(candidates[np.argmin(np.abs(candidates - wanted))]) if len(candidates) else wanted
+        chunks.append((start, cut))
+        start = cut
+    chunks.append((start, len(audio)))
+    return chunks
+
+
+def merge_results(
+    results: List[Dict[str, Any]], chunks: List[Tuple[int, int]], sample_rate: int = SAMPLE_RATE
+) -> Dict[str, Any]:
+    """Stitches per-chunk transcription results into one, on the original timeline."""
+    segments = []
+    for result, (start, _) in zip(results, chunks):
+        offset = start / sample_rate
+        for segment in result["segments"]:
+            segments.append(
+                {
+                    **segment,
+                    "id": len(segments),
+                    "start": round(segment["start"] + offset, 3),
+                    "end": round(segment["end"] + offset, 3),
+                }
+            )
+
+    speech = [r.get("speech_seconds") for r in results]
+    # per-stage work summed over the chunks (they ran in parallel, so this exceeds wall time)
+    timings: Dict[str, float] = {}
+    for result in results:
+        for stage, seconds in result.get("timings", {}).items():
+            timings[stage] = round(timings.get(stage, 0.0) + seconds, 4)
+    return {
+        "text": " ".join(r["text"].strip() for r in results if r["text"].strip()),
+        "segments": segments,
+        "language": next((r["language"] for r in results if r.get("language")), None),
+        "audio_seconds": round(sum(end - start for start, end in chunks) / sample_rate, 3),
+        "speech_seconds": round(sum(speech), 3) if None not in speech else None,
+        "chunks": len(chunks),
+        "timings": timings,
+    }
@@ -0,0 +1,89 @@
+"""
+Prometheus metrics shared by both backends, exposed on `/metrics`.
+
+Every request stage lands in one `stage_seconds` histogram labelled by stage:
+
+    receive        reading the upload body
+    decode         ffmpeg decoding to 16 kHz PCM
+    model_load     fetching the Whisper model (near zero once warm)
+    vad            silence stripping
+    inference      Whisper inference
+    gemini         one Gemini API call
+    gemini_stream  one streamed Gemini call, until the last chunk
+    chat_compact   folding old chat turns into a session's summary
+    retrieval      finding transcript passages to ground a /chat turn
+    transcribe     the whole transcription step of a request
+    summarize      the whole summarization step (all Gemini calls)
+    serialize      building the JSON response
+
+Model load, VAD and inference run in worker processes, so the engine reports
+them in the result's "timings" and the pool observes them here, in the
+process that serves `/metrics`.
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# 10 ms .. ~20 min: covers a cache lookup as well as a long inference
+STAGE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+STAGE_SECONDS = Histogram(
+    "stage_seconds", "Wall-clock seconds spent in each request stage", ["stage"], buckets=STAGE_BUCKETS
+)
+CACHE_LOOKUPS = Counter(
+    "result_cache_lookups_total", "Result cache lookups", ["kind", "result"]
+)
+QUEUE_DEPTH = Gauge("queue_depth", "Work waiting or running, per queue", ["queue"])
+AUDIO_SECONDS = Counter("audio_seconds_total", "Seconds of audio transcribed")
+SPEECH_SECONDS = Counter("speech_seconds_total", "Seconds of speech left after VAD")
+GEMINI_ERRORS = Counter("gemini_errors_total", "Failed Gemini API calls", ["reason"])
+GEMINI_RETRIES = Counter("gemini_retries_total", "Gemini calls retried, by the failure retried", ["reason"])
+GEMINI_HEDGES = Counter("gemini_hedges_total", "Hedged Gemini calls sent and which request won", ["outcome"])
+GEMINI_BREAKER_STATE = Gauge(
+    "gemini_breaker_state", "Gemini circuit breaker: 0 closed, 1 half open, 2 open"
+)
+# 16 .. ~1M tokens
+CHAT_PROMPT_TOKENS = Histogram(
+    "chat_prompt_tokens",
+    "Gemini input tokens per /chat turn",
+    ["mode"],
+    buckets=tuple(16 * 4 ** i for i in range(9)),
+)
+COALESCED_REQUESTS = Counter(
+    "coalesced_requests_total", "Requests served by identical in-flight work", ["endpoint"]
+)
+
+
+@contextmanager
+def stage_timer(timings: Dict[str, float], name: str):
+    """Records the wall-clock seconds spent in the block as timings[name]."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - started, 4)
+
+
+def observe_stages(timings: Dict[str, float]) -> None:
+    """Records a {stage: seconds} dict into the stage histogram."""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def observe_cache(kind: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(kind, "hit" if hit else "miss").inc()
+
+
+def observe_transcription(audio_seconds: Optional[float], speech_seconds: Optional[float]) -> None:
+    if audio_seconds:
+        AUDIO_SECONDS.inc(audio_seconds)
+    if speech_seconds:
+        SPEECH_SECONDS.inc(speech_seconds)
+
+
+def metrics_response() -> Response:
+    """Prometheus text exposition of this process's metrics."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
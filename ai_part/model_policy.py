@@ -0,0 +1,92 @@
+"""
+Load-adaptive Whisper model selection.
+
+With `whisper_model=auto` (or WHISPER_MODEL_POLICY=auto for every request)
+the server picks the model instead of the client. It takes the largest
+candidate whose estimated completion time still fits the client's latency
+budget:
+
+    queued work ahead of the job (the pool's estimated wait)
+  + this recording's processing time (audio seconds x RTF, spread over the
+    workers when the recording is long enough to be split)
+
+RTFs are the pool's measured real-time factors (`whisper_models.RTF_PRIORS`
+for models that haven't run yet).
+Under light load requests get the most accurate model. As the queue grows
+they step down to smaller ones rather than missing the deadline, and the
+response reports which model was used.
+
+Configuration (environment):
+    WHISPER_MODEL_POLICY            "client" (obey whisper_model unless it is "auto") or
+                                    "auto" (always adapt; whisper_model caps the size) (default "client")
+    WHISPER_AUTO_MODELS             candidates, largest first; preloaded by every worker under the
+                                    "auto" policy (default "small.en,base.en,tiny.en")
+    WHISPER_LATENCY_BUDGET_SECONDS  budget used when the client sends none (default 60)
+"""
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from long_audio import LONG_AUDIO_MIN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+AUTO = "auto"
+WHISPER_MODEL_POLICY = os.getenv("WHISPER_MODEL_POLICY", "client")
+WHISPER_AUTO_MODELS = [
+    name.strip()
+    for name in os.getenv("WHISPER_AUTO_MODELS", "small.en,base.en,tiny.en").split(",")
+    if name.strip()
+]
+WHISPER_LATENCY_BUDGET_SECONDS = float(os.getenv("WHISPER_LATENCY_BUDGET_SECONDS", "60"))
+
+
+def candidates(requested: str, policy: str = WHISPER_MODEL_POLICY) -> List[str]:
+    """
+    Models the selector may choose from, largest first. An explicit model
+    under the "auto" policy caps the size; under "client" it is used as is.
+    """
+    if requested == AUTO:
+        return WHISPER_AUTO_MODELS
+    if policy != AUTO or requested not in WHISPER_AUTO_MODELS:
+        return [requested]
+    return WHISPER_AUTO_MODELS[WHISPER_AUTO_MODELS.index(requested):]
+
+
+def estimate_seconds(pool, model: str, audio_seconds: float) -> float:
+    """Estimated seconds until a job of `audio_seconds` on `model` would finish."""
+    rtf = pool.rtf(model)
+    workers = max(1, pool.workers)
+    # long recordings are split and spread across the workers
+    parallel = workers if pool.workers >= 2 and audio_seconds >= LONG_AUDIO_MIN_SECONDS else 1
+    return pool.estimated_wait() + audio_seconds * rtf / parallel
+
+
+def select_model(
+    requested: str,
+    audio_seconds: float,
+    pool,
+    latency_budget: Optional[float] = None,
+    policy: str = WHISPER_MODEL_POLICY,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Returns (model to use, selection details for the response). Falls back
+    to the smallest candidate when none fits the budget.
+    """
+    options = candidates(requested, policy)
+    if len(options) == 1:
+        return options[0], {"requested": requested, "policy": "client"}
+
+    budget = latency_budget or WHISPER_LATENCY_BUDGET_SECONDS
+    estimates = {model: round(estimate_seconds(pool, model, audio_seconds), 2) for model in options}
+    chosen = next((m for m in options if estimates[m] <= budget), options[-1])
+    logger.info(
+        f"Selected Whisper model '{chosen}' for {audio_seconds:.0f}s of audio "
+        f"(budget {budget:.0f}s, estimates {estimates})"
+    )
+    return chosen, {
+        "requested": requested,
+        "policy": AUTO,
+        "latency_budget": budget,
+        "estimated_seconds": estimates,
+    }
@@ -0,0 +1,308 @@
+"""
+Persistent, searchable store of transcription results for the Records tab.
+
+Every transcript and summary produced by `/transcribe_summarize` (and by
+finished `/jobs`) is written to a SQLite file, together with the patient
+metadata sent with the upload, the Whisper segments and the stage timings.
+Records are served back from here, so they never need Whisper again.
+
+Search uses an FTS5 index over transcript and summary (porter stemming,
+external content, kept in sync by triggers). Listing and search both page
+with a keyset cursor on the record id, newest first. Each page is then an
+index range scan of `limit` rows, however deep the client has paged, and
+stays in the millisecond range at hundreds of thousands of records.
+
+The store holds patients' consultations, so it is off unless
+RECORDS_DB_PATH is set, and the /records endpoints additionally require
+RECORDS_API_TOKEN (sent as the X-Records-Token header) and always filter by
+patient. /chat needs the same token before it grounds a reply in a
+patient's records.
+
+Configuration (environment):
+    RECORDS_DB_PATH     SQLite file, e.g. ai_part/records.sqlite3 (default "": records are not stored)
+    RECORDS_API_TOKEN   shared secret for the /records endpoints (unset: they are disabled)
+    RECORDS_PAGE_SIZE   default page size of /records (default 20; at most 100)
+"""
+import hmac
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+RECORDS_DB_PATH = os.getenv("RECORDS_DB_PATH", "")
+RECORDS_API_TOKEN = os.getenv("RECORDS_API_TOKEN")
+RECORDS_PAGE_SIZE = int(os.getenv("RECORDS_PAGE_SIZE", "20"))
+MAX_PAGE_SIZE = 100
+# characters of the summary shown in list results
+PREVIEW_CHARS = 240
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS records ("
+    " id INTEGER PRIMARY KEY,"
+    " created_at REAL NOT NULL,"
+    " patient_id TEXT,"
+    " filename TEXT,"
+    " audio_hash TEXT,"
+    " audio_seconds REAL,"
+    " whisper_model TEXT,"
+    " transcript TEXT NOT NULL,"
+    " summary TEXT NOT NULL,"
+    " metadata TEXT NOT NULL,"
+    " segments TEXT NOT NULL,"
+    " stages TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS records_patient ON records (patient_id, id)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5("
+    " transcript, summary, content='records', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS records_ai AFTER INSERT ON records BEGIN"
+    " INSERT INTO records_fts (rowid, transcript, summary) VALUES (new.id, new.transcript, new.summary);"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS records_ad AFTER DELETE ON records BEGIN"
+    " INSERT INTO records_fts (records_fts, rowid, transcript, summary)"
+    " VALUES ('delete', old.id, old.transcript, old.summary);"
+    " END",
+    # deletions other processes (the /chat retrieval index) must apply to their copies
+    "CREATE TABLE IF NOT EXISTS deleted_records (seq INTEGER PRIMARY KEY AUTOINCREMENT, record_id INTEGER NOT NULL)",
+    "CREATE TRIGGER IF NOT EXISTS records_deleted AFTER DELETE ON records BEGIN"
+    " INSERT INTO deleted_records (record_id) VALUES (old.id);"
+    " END",
+)
+
+LIST_COLUMNS = (
+    "r.id, r.created_at, r.patient_id, r.filename, r.audio_seconds, r.whisper_model, "
+    f"substr(r.summary, 1, {PREVIEW_CHARS}), r.metadata"
+)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def records_token_valid(token: Optional[str]) -> bool:
+    """True if `token` matches RECORDS_API_TOKEN; always False while no token is configured."""
+    return bool(RECORDS_API_TOKEN and token and hmac.compare_digest(token, RECORDS_API_TOKEN))
+
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    Turns free text into an FTS5 query that cannot be a syntax error: every
+    word must match (after stemming, so "pressures" finds "pressure").
+    None when the text has no words.
+    """
+    words = _WORD.findall(text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
+
+
+class RecordStore:
+    def __init__(self, path: str = RECORDS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def add(
+        self,
+        result: Dict[str, Any],
+        stages: Dict[str, float],
+        patient_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        filename: Optional[str] = None,
+        audio_hash: Optional[str] = None,
+        audio_seconds: Optional[float] = None,
+    ) -> Optional[int]:
+        """
+        Stores one transcribe + summarize result; returns its record id.
+        Failures are logged and return None, so they never fail the request.
+        """
+        if not self.enabled:
+            return None
+        row = (
+            time.time(),
+            patient_id,
+            filename,
+            audio_hash,
+            audio_seconds,
+            result.get("whisper_model"),
+            result["transcript"],
+            # None when the transcript was returned without a summary
+            result["summary"] or "",
+            json.dumps(metadata or {}),
+            json.dumps(result.get("segments", [])),
+            json.dumps(stages),
+        )
+        try:
+            with self._lock:
+                conn = self._connect()
+                cursor = conn.execute(
+                    "INSERT INTO records (created_at, patient_id, filename, audio_hash, audio_seconds,"
+                    " whisper_model, transcript, summary, metadata, segments, stages)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+                conn.commit()
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.warning(f"Storing record failed: {e}")
+            return None
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        patient_id: Optional[str] = None,
+        limit: int = RECORDS_PAGE_SIZE,
+        before: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        One page of records, newest first, optionally full-text matched and
+        filtered by patient. `before` is the previous page's `next_cursor`.
+        Returns {"records": [...], "next_cursor": id or None}.
+        """
+        if not self.enabled:
+            return {"records": [], "next_cursor": None}
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        match = fts_query(query) if query else None
+        if query and not match:
+            return {"records": [], "next_cursor": None}
+        conditions, params = [], []
+        if match:
+            if patient_id is not None:
+                # a patient has few records: start from them and probe the index for each
+                order = "r.id"
+                source = "records r CROSS JOIN records_fts ON records_fts.rowid = r.id"
+            else:
+                # walk the full-text index in rowid order so LIMIT can stop early
+                order = "records_fts.rowid"
+                source = "records_fts JOIN records r ON r.id = records_fts.rowid"
+            columns = f"{LIST_COLUMNS}, snippet(records_fts, -1, '[', ']', '…', 16)"
+            conditions.append("records_fts MATCH ?")
+            params.append(match)
+        else:
+            order = "r.id"
+            source = "records r"
+            columns = f"{LIST_COLUMNS}, NULL"
+        if patient_id is not None:
+            conditions.append("r.patient_id = ?")
+            params.append(patient_id)
+        if before is not None:
+            conditions.append(f"{order} < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"SELECT {columns} FROM {source} {where} ORDER BY {order} DESC LIMIT ?"
+        with self._lock:
+            rows = self._connect().execute(sql, params + [limit + 1]).fetchall()
+
+        records = [
+            {
+                "id": row[0],
+                "created_at": row[1],
+                "patient_id": row[2],
+                "filename": row[3],
+                "audio_seconds": row[4],
+                "whisper_model": row[5],
+                "summary_preview": row[6],
+                "metadata": json.loads(row[7]),
+                **({"match": row[8]} if match else {}),
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = records[-1]["id"] if len(rows) > limit else None
+        return {"records": records, "next_cursor": next_cursor}
+
+    def get(self, record_id: int, patient_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """The full record, with transcript, segments and stage timings; None unless it is `patient_id`'s."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT id, created_at, patient_id, filename, audio_hash, audio_seconds, whisper_model,"
+                " transcript, summary, metadata, segments, stages FROM records WHERE id = ? AND patient_id IS ?",
+                (record_id, patient_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "created_at": row[1],
+            "patient_id": row[2],
+            "filename": row[3],
+            "audio_hash": row[4],
+            "audio_seconds": row[5],
+            "whisper_model": row[6],
+            "transcript": row[7],
+            "summary": row[8],
+            "metadata": json.loads(row[9]),
+            "segments": json.loads(row[10]),
+            "stages": json.loads(row[11]),
+        }
+
+    def segments_since(self, after_id: int, limit: int) -> List[Tuple[int, Optional[str], str, list]]:
+        """(id, patient_id, transcript, segments) of up to `limit` records after `after_id`, oldest first."""
+        if not self.enabled:
+            return []
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, patient_id, transcript, segments FROM records WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit),
+            ).fetchall()
+        return [(row[0], row[1], row[2], json.loads(row[3])) for row in rows]
+
+    def deletions_since(self, after_seq: int, limit: int) -> List[Tuple[int, int]]:
+        """(seq, record id) of up to `limit` deletions after `after_seq`, oldest first."""
+        if not self.enabled:
+            return []
+        with self._lock:
+            return self._connect().execute(
+                "SELECT seq, record_id FROM deleted_records WHERE seq > ? ORDER BY seq LIMIT ?",
+                (after_seq, limit),
+            ).fetchall()
+
+    def existing_ids(self, record_ids: Iterable[int]) -> Set[int]:
+        """The subset of `record_ids` that have not been deleted."""
+        ids = list(record_ids)
+        if not self.enabled or not ids:
+            return set()
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id FROM records WHERE id IN ({', '.join('?' * len(ids))})", ids
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def delete(self, record_id: int, patient_id: Optional[str]) -> bool:
+        """Deletes the record if it is `patient_id`'s; False if there was no such record."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            conn = self._connect()
+            deleted = conn.execute(
+                "DELETE FROM records WHERE id = ? AND patient_id IS ?", (record_id, patient_id)
+            ).rowcount
+            conn.commit()
+        return deleted > 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+record_store = RecordStore()
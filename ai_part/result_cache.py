@@ -0,0 +1,127 @@
+"""
+Content-addressed on-disk cache for transcripts and summaries.
+
+Uploads are hashed while they stream in; the hash plus the Whisper model,
+backend and VAD settings (for transcripts) or plus the summary prompt version
+(for summaries) forms the key. Transcripts and summaries are separate entries, so changing the
+summarizer only recomputes summaries. Entries live in a SQLite file and the
+least recently used ones are evicted once the total size passes the limit.
+Calls block on SQLite, so async code runs them in a thread.
+
+Configuration (environment):
+    RESULT_CACHE_PATH       SQLite file (default ai_part/result_cache.sqlite3, "" disables the cache)
+    RESULT_CACHE_MAX_BYTES  total size of stored values (default 256 MB)
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_PATH = os.getenv(
+    "RESULT_CACHE_PATH", str(Path(__file__).with_name("result_cache.sqlite3"))
+)
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def make_key(kind: str, *parts: str) -> str:
+    """Stable key for an entry of `kind` derived from its inputs."""
+    return hashlib.sha256(":".join((kind,) + parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path: str = RESULT_CACHE_PATH, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # size of all stored values, summed once per connection and then kept up to date
+        self._total: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+            self._conn = conn
+        if self._total is None:
+            self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache read failed: {e}")
+            return None
+
+    def put(self, key: str, kind: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        data = json.dumps(value)
+        try:
+            with self._lock:
+                conn = self._connect()
+                replaced = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, kind, value, size, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, kind, data, len(data), time.time()),
+                )
+                self._total += len(data) - (replaced[0] if replaced else 0)
+                self._evict(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            # the running total may no longer match the table; sum it again next time
+            self._total = None
+            logger.warning(f"Result cache write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        if self._total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT key, size FROM entries ORDER BY last_access")
+        evicted = []
+        for key, size in rows:
+            if self._total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        logger.info(f"Evicted {len(evicted)} result cache entries")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._total = None
+
+
+result_cache = ResultCache()
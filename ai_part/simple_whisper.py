@@ -38,12 +38,17 @@
 #!/usr/bin/env python3
 
 #!/usr/bin/env python3
+import asyncio
+import importlib.util
 import subprocess
 import sys
 import os
-import requests
+import json
 from dotenv import load_dotenv
 
+from gemini_client import GeminiError, gemini
+from summarization import SUMMARY_CHUNK_CHARS, map_reduce_summarize
+
 # -------------------------
 # Whisper install / run (your original code, unchanged)
 # -------------------------
@@ -75,24 +80,22 @@ def run_whisper(audio_file="samplekedar.wav", model="base.en"):
 # -------------------------
 load_dotenv()  # reads .env in current dir
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_MODEL = "gemini-2.5-flash"
-GEMINI_ENDPOINT = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
 
-def summarize_with_gemini(text: str, max_chars: int = 16000) -> str:
+async def generate_with_gemini(prompt: str) -> str:
     """
-    Summarize the provided text using Gemini 2.5 flash.
-    - Truncates to max_chars to avoid extremely large payloads.
-    - Returns summary string or error string if Gemini fails.
+    Send one prompt to Gemini 2.5 flash over the shared pooled client and
+    return the response text (or an error string if it cannot be parsed).
     """
-    if not GEMINI_API_KEY:
-        raise RuntimeError("GEMINI_API_KEY not found in environment (.env).")
+    try:
+        return await gemini.generate_text(prompt)
+    except GeminiError as e:
+        # present the upstream error before giving up
+        print("Gemini returned error:", e)
+        raise
 
-    # simple truncation strategy to avoid huge requests
-    if len(text) > max_chars:
-        print(f"Transcript is long ({len(text)} chars). Truncating to {max_chars} chars before summarizing.")
-        text = text[:max_chars]
 
-    prompt = (
+def build_summary_prompt(text: str) -> str:
+    return (
         "You are a concise assistant. Produce a clear, human-friendly summary of the following transcript.\n\n"
         "Requirements:\n"
         "- Keep it concise (5-7 sentences) unless the content is short.\n"
@@ -101,37 +104,27 @@ def summarize_with_gemini(text: str, max_chars: int = 16000) -> str:
         f"Transcript:\n\n{text}"
     )
 
-    payload = {
-        "contents": [
-            {
-                "parts": [
-                    {"text": prompt}
-                ]
-            }
-        ],
-        # you could add other fields here (temperature, safety settings) if desired
-    }
-
-    resp = requests.post(GEMINI_ENDPOINT, params={"key": GEMINI_API_KEY}, json=payload, timeout=60)
-    try:
-        resp.raise_for_status()
-    except requests.HTTPError as e:
-        # try to present helpful error JSON if available
-        try:
-            print("Gemini returned error:", resp.json())
-        except Exception:
-            print("Gemini returned non-JSON error:", resp.text)
-        raise
 
-    data = resp.json()
-    # parse response
-    try:
-        parts = data["candidates"][0]["content"]["parts"]
-        summary = "".join(p.get("text", "") for p in parts).strip()
-        return summary
-    except Exception:
-        # fallback: return raw payload for debugging
-        return f"[Gemini parse error] full response: {data}"
+async def summarize_with_gemini(text: str, max_chars: int = SUMMARY_CHUNK_CHARS, segments=None) -> str:
+    """
+    Summarize the provided text using Gemini 2.5 flash.
+    - Transcripts longer than max_chars are summarized in chunks (split on
+      Whisper segments when given) and the partial summaries merged.
+    - Returns summary string or error string if Gemini fails.
+    """
+    if not GEMINI_API_KEY:
+        raise RuntimeError("GEMINI_API_KEY not found in environment (.env).")
+
+    if len(text) > max_chars:
+        print(f"Transcript is long ({len(text)} chars). Summarizing in chunks of {max_chars} chars.")
+
+    return await map_reduce_summarize(
+        text,
+        generate=generate_with_gemini,
+        build_prompt=build_summary_prompt,
+        segments=segments,
+        max_chars=max_chars,
+    )
 
 # -------------------------
 # Helper to read Whisper output and write summary
@@ -147,6 +140,15 @@ def read_transcript_for_audio(audio_file: str) -> str:
         return f.read().strip()
 
 
+def read_segments_for_audio(audio_file: str):
+    """Segments from whisper's <basename>.json output, or None if it is missing."""
+    json_path = os.path.splitext(audio_file)[0] + ".json"
+    if not os.path.exists(json_path):
+        return None
+    with open(json_path, "r", encoding="utf-8") as f:
+        return json.load(f).get("segments")
+
+
 def save_summary(audio_file: str, summary_text: str):
     out_path = audio_file + ".summary.txt"
     with open(out_path, "w", encoding="utf-8") as f:
@@ -157,12 +159,20 @@ def save_summary(audio_file: str, summary_text: str):
 # Main: run whisper then summarize resulting transcript
 # -------------------------
 if __name__ == "__main__":
+    # `simple_whisper.py batch <dir|glob>...` processes many recordings in one process
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from batch_transcribe import main as batch_main
+
+        batch_main(sys.argv[2:])
+        sys.exit(0)
+
     # allow passing audio filename as CLI arg
     audio = sys.argv[1] if len(sys.argv) > 1 else "samplekedar.wav"
     model = sys.argv[2] if len(sys.argv) > 2 else "base.en"
 
     # Run Whisper (will create samplekedar.wav.txt etc.)
-    install_whisper()
+    if importlib.util.find_spec("whisper") is None:
+        install_whisper()
     run_whisper(audio, model)
 
     # Read transcript (whisper-created .txt)
@@ -173,7 +183,9 @@ if __name__ == "__main__":
 
     # Summarize via Gemini
     try:
-        summary = summarize_with_gemini(transcript)
+        summary = asyncio.run(
+            summarize_with_gemini(transcript, segments=read_segments_for_audio(audio))
+        )
         print("\n--- Summary ---\n")
         print(summary)
         print("\n--- End summary ---\n")
@@ -0,0 +1,62 @@
+"""
+Coalescing of identical concurrent requests ("single flight").
+
+A client that times out and retries does not stop the server working on its
+first request, so without coalescing the retry starts the same transcription
+or Gemini call a second time, doubling the load exactly when it is already
+high. Here the retry attaches to the pending computation instead, and every
+caller gets its result (or its exception).
+
+The computation runs in its own task: it finishes, and its result reaches
+the callers still waiting, even if the request that started it is cancelled
+or disconnects. Only in-flight work is shared; once it completes the key is
+forgotten, and repeats of finished work are left to `result_cache`.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Tuple, TypeVar
+
+from metrics import COALESCED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: str) -> bool:
+        """True while work for `key` is in flight (a `do` with it would attach to that work)."""
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Runs `fn()` unless work for `key` is already in flight, in which case
+        its outcome is awaited instead. Returns (result, shared), where
+        `shared` is True for callers that attached to existing work.
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if shared:
+            COALESCED_REQUESTS.labels(self.name).inc()
+            logger.info(f"Coalesced identical {self.name} request onto in-flight work")
+        else:
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        # a cancelled caller must not cancel the work the others are waiting on
+        return await asyncio.shield(call), shared
+
+    def _forget(self, key: str, call: asyncio.Future) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            # mark the exception as retrieved when every caller has gone away
+            call.exception()
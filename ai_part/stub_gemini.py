@@ -0,0 +1,103 @@
+"""
+Local stand-in for the Gemini REST API, for benchmarks and load tests.
+
+Serves generateContent and streamGenerateContent (alt=sse) for any model,
+waits a configurable latency (plus optional jitter) before answering and
+returns a fixed reply, so pipeline timings can be measured offline and
+without quota. Point the backends at it with GEMINI_BASE_URL, which must be
+set before `gemini_client` is imported.
+
+    python stub_gemini.py --port 8090 --latency 0.8
+    GEMINI_BASE_URL=http://127.0.0.1:8090/v1beta GEMINI_API_KEY=stub uvicorn transcribe_summarize:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from typing import Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_REPLY = (
+    "The speaker describes the recording in a few sentences. "
+    "Key names and facts are preserved. This is a canned reply from the stub Gemini server."
+)
+
+
+def _response(text: str) -> dict:
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+
+def create_app(latency: float = 0.5, jitter: float = 0.0, error_rate: float = 0.0) -> FastAPI:
+    """Stub app answering every call after `latency` ± `jitter` seconds; `error_rate` of calls get a 503."""
+    app = FastAPI(title="Stub Gemini")
+    app.state.calls = 0
+
+    async def delay() -> None:
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+    @app.post("/v1beta/models/{model_action}")
+    async def generate(model_action: str, request: Request):
+        app.state.calls += 1
+        await request.body()
+        await delay()
+        if random.random() < error_rate:
+            return JSONResponse({"error": {"code": 503, "message": "stub overloaded"}}, status_code=503)
+
+        if model_action.endswith(":streamGenerateContent"):
+            async def events():
+                for word in STUB_REPLY.split(" "):
+                    yield f"data: {json.dumps(_response(word + ' '))}\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return _response(STUB_REPLY)
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_in_thread(
+    latency: float = 0.5, jitter: float = 0.0, error_rate: float = 0.0, port: int = 0
+) -> Tuple[str, uvicorn.Server]:
+    """
+    Runs the stub on a background thread. Returns (base URL for
+    GEMINI_BASE_URL, server); set `server.should_exit = True` to stop it.
+    """
+    port = port or free_port()
+    config = uvicorn.Config(
+        create_app(latency, jitter, error_rate), host="127.0.0.1", port=port, log_level="warning"
+    )
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Stub Gemini server did not start")
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}/v1beta", server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a stub Gemini API locally")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="± seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered 503")
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.latency, args.jitter, args.error_rate), host="127.0.0.1", port=args.port
+    )
+
+
+if __name__ == "__main__":
+    main()
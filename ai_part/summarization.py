@@ -0,0 +1,137 @@
+"""
+Map-reduce summarization for transcripts longer than one Gemini prompt.
+
+The transcript is split on Whisper segment boundaries (or sentence boundaries
+when only plain text is available) into chunks of at most `max_chars`. Each
+chunk is summarized concurrently with a bounded number of in-flight Gemini
+calls, then a reduce pass merges the partial summaries into one. Short
+transcripts still go through a single call with the caller's own prompt.
+All the Gemini calls of one summary, retries included, share a deadline of
+SUMMARY_DEADLINE_SECONDS, so a failing upstream can't hold a request open
+for several full timeouts per chunk.
+
+Configuration (environment):
+    SUMMARY_CHUNK_CHARS      max transcript characters per Gemini call (default 16000)
+    SUMMARY_MAX_CONCURRENCY  Gemini calls in flight per summary (default 4)
+    SUMMARY_DEADLINE_SECONDS longest a whole summary may take (default 120)
+"""
+import asyncio
+import logging
+import os
+import re
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from gemini_client import gemini_deadline
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", "16000"))
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+SUMMARY_DEADLINE_SECONDS = float(os.getenv("SUMMARY_DEADLINE_SECONDS", "120"))
+
+CHUNK_PROMPT = (
+    "You are a concise assistant. The following is part {index} of {total} of a longer "
+    "transcript. Summarize this part in a few sentences, preserving important names, "
+    "facts, numbers and actions. Do not add an introduction.\n\n"
+    "Transcript part:\n\n{text}"
+)
+
+REDUCE_PROMPT = (
+    "You are a concise assistant. The following are summaries of consecutive parts of "
+    "one transcript, in order. Merge them into a single clear, human-friendly summary "
+    "of the whole transcript.\n\n"
+    "Keep it concise (5-7 sentences) and preserve important names/facts.\n\n"
+    "Part summaries:\n\n{text}"
+)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    """Greedily packs pieces into chunks of at most max_chars, splitting oversized pieces."""
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        while len(piece) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(piece[:max_chars])
+            piece = piece[max_chars:]
+        if current and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current.strip():
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+def split_transcript(
+    text: str, segments: Optional[List[Dict]] = None, max_chars: int = SUMMARY_CHUNK_CHARS
+) -> List[str]:
+    """Splits a transcript into chunks of at most max_chars on segment or sentence boundaries."""
+    if segments:
+        pieces = [segment.get("text", "") for segment in segments]
+    else:
+        pieces = [sentence + " " for sentence in _SENTENCE_END.split(text)]
+    return _pack(pieces, max_chars)
+
+
+Generate = Callable[[str], Awaitable[str]]
+
+
+async def map_reduce_summarize(
+    text: str,
+    generate: Generate,
+    build_prompt: Callable[[str], str],
+    segments: Optional[List[Dict]] = None,
+    max_chars: int = SUMMARY_CHUNK_CHARS,
+    max_concurrency: int = SUMMARY_MAX_CONCURRENCY,
+) -> str:
+    """
+    Summarizes `text` of any length.
+    - generate(prompt) is a coroutine sending one prompt to Gemini and
+      returning its text.
+    - build_prompt(text) is the caller's single-pass summary prompt, used when
+      the transcript fits in one chunk.
+    Gemini calls still running at SUMMARY_DEADLINE_SECONDS fail with
+    GeminiDeadlineExceeded.
+    """
+    chunks = split_transcript(text, segments, max_chars)
+    with gemini_deadline(SUMMARY_DEADLINE_SECONDS):
+        if len(chunks) <= 1:
+            return await generate(build_prompt(text))
+
+        logger.info(f"Summarizing transcript in {len(chunks)} chunks")
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        partials = await _map(chunks, generate, semaphore)
+        return await _reduce(partials, generate, max_chars, semaphore)
+
+
+async def _map(chunks: List[str], generate: Generate, semaphore: asyncio.Semaphore) -> List[str]:
+    async def summarize_chunk(index: int, chunk: str) -> str:
+        async with semaphore:
+            return await generate(
+                CHUNK_PROMPT.format(index=index + 1, total=len(chunks), text=chunk)
+            )
+
+    return await asyncio.gather(*(summarize_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+
+
+async def _reduce(
+    partials: List[str], generate: Generate, max_chars: int, semaphore: asyncio.Semaphore
+) -> str:
+    pieces = [f"Part {i + 1}:\n{partial}\n\n" for i, partial in enumerate(partials)]
+    merged = "".join(pieces)
+    if len(merged) <= max_chars or len(partials) <= 1:
+        return await generate(REDUCE_PROMPT.format(text=merged.strip()))
+
+    # Too many partial summaries for one prompt: condense them in groups first
+    groups = _pack(pieces, max_chars)
+    if len(groups) >= len(partials):
+        # partials longer than a chunk would only be cut into more pieces each round
+        return await generate(REDUCE_PROMPT.format(text=merged.strip()))
+    logger.info(f"Condensing {len(partials)} partial summaries in {len(groups)} groups")
+    condensed = await _map(groups, generate, semaphore)
+    return await _reduce(condensed, generate, max_chars, semaphore)
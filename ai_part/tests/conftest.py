@@ -0,0 +1,12 @@
+"""
+Tests for the ai_part modules. None of them load Whisper or call Gemini.
+
+    python -m pytest ai_part/tests
+
+The modules import each other by bare name (they run from ai_part/), so the
+directory is put on sys.path here.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
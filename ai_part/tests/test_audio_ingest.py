@@ -0,0 +1,94 @@
+import asyncio
+import sys
+
+import numpy as np
+import pytest
+
+import audio_ingest
+from audio_ingest import AudioDecodeError, AudioDecodeTimeout, AudioTooLarge, decode_stream, pcm16_to_float32
+
+# Stand-ins for ffmpeg: each reads the upload on stdin and writes float32 samples to stdout
+ECHO = """
+import sys
+data = sys.stdin.buffer.read()
+sys.stdout.buffer.write(data)
+"""
+# what ffmpeg does on a badly damaged file: decode some audio, log a line per broken frame
+FLOOD_AND_FAIL = """
+import signal, sys
+# if nobody drains stderr this process blocks; dying lets the test fail instead of hang
+signal.alarm(10)
+for i in range(4000):
+    sys.stderr.write(f"[mp3float @ 0x5581] invalid new backstep {i}\\n" * 4)
+sys.stderr.flush()
+data = sys.stdin.buffer.read()
+sys.stdout.buffer.write(bytes(16000 * 4))
+sys.stderr.write("Error while decoding stream #0:0: Invalid data found\\n")
+sys.exit(1)
+"""
+HANG = """
+import time
+time.sleep(30)
+"""
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    def use(script):
+        monkeypatch.setattr(audio_ingest, "ffmpeg_decode_args", lambda input_args: [sys.executable, "-c", script])
+
+    return use
+
+
+def _chunks(data, size=64 * 1024):
+    async def gen():
+        for i in range(0, len(data), size):
+            yield data[i:i + size]
+
+    return gen()
+
+
+def _decode(data, **kwargs):
+    # the test fails instead of hanging if the decoder deadlocks
+    return asyncio.run(asyncio.wait_for(decode_stream(_chunks(data), **kwargs), 20))
+
+
+def test_pcm16_conversion():
+    samples = pcm16_to_float32(np.array([0, 16384, -32768, 1], dtype="<i2").tobytes() + b"\x00")
+    assert samples.tolist() == [0.0, 0.5, -1.0, 1 / 32768]
+
+
+def test_stream_decode_returns_samples(fake_ffmpeg):
+    fake_ffmpeg(ECHO)
+    samples = np.linspace(-1, 1, 48000, dtype="<f4")
+    hashed = []
+    timings = {}
+    decoded = _decode(samples.tobytes(), on_chunk=hashed.append, timings=timings)
+    np.testing.assert_array_equal(decoded, samples)
+    assert b"".join(hashed) == samples.tobytes()
+    assert set(timings) == {"receive", "decode"}
+
+
+def test_stream_decode_enforces_the_duration_limit(fake_ffmpeg):
+    fake_ffmpeg(ECHO)
+    with pytest.raises(AudioTooLarge):
+        _decode(np.zeros(5 * 16000, dtype="<f4").tobytes(), max_seconds=2)
+
+
+def test_stderr_flood_neither_hangs_nor_passes_as_success(fake_ffmpeg):
+    # regression: stderr was only read at the end, so a full stderr pipe
+    # stalled ffmpeg (and every write to its stdin), and a failure after some
+    # audio had been decoded returned that audio as if it were the recording
+    fake_ffmpeg(FLOOD_AND_FAIL)
+    with pytest.raises(AudioDecodeError) as raised:
+        _decode(bytes(1024 * 1024))
+    message = str(raised.value)
+    assert "Invalid data found" in message
+    assert "after 1.0s of audio" in message
+    assert len(message) < audio_ingest.FFMPEG_STDERR_TAIL_BYTES + 200
+
+
+def test_stuck_decoder_times_out(fake_ffmpeg):
+    fake_ffmpeg(HANG)
+    with pytest.raises(AudioDecodeTimeout):
+        _decode(bytes(1024), timeout=0.5)
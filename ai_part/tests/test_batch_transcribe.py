@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import batch_transcribe
+import transcription_pool
+from batch_transcribe import BatchRunner, collect_audio, plan
+
+
+def _touch(path, text="", mtime=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_collect_finds_audio_in_directories_and_globs_once(tmp_path):
+    a = _touch(tmp_path / "2025-01" / "a.wav")
+    b = _touch(tmp_path / "2025-02" / "nested" / "b.M4A")
+    _touch(tmp_path / "2025-02" / "notes.txt")
+    found = collect_audio([str(tmp_path), str(tmp_path / "2025-01" / "*.wav"), str(a)])
+    assert found == [str(a), str(b)]
+
+
+def test_plan_skips_finished_work_and_resumes_summaries(tmp_path):
+    done = _touch(tmp_path / "done.wav", mtime=1000)
+    for name in ("done.txt", "done.json", "done.wav.summary.txt"):
+        _touch(tmp_path / name, mtime=2000)
+    unsummarized = _touch(tmp_path / "half.wav", mtime=1000)
+    for name in ("half.txt", "half.json"):
+        _touch(tmp_path / name, mtime=2000)
+    # re-recorded after its transcript was written
+    stale = _touch(tmp_path / "stale.wav", mtime=3000)
+    for name in ("stale.txt", "stale.json"):
+        _touch(tmp_path / name, mtime=2000)
+
+    items = {item.audio: (item.transcribe, item.summarize) for item in plan([str(done), str(unsummarized), str(stale)])}
+    assert items == {str(unsummarized): (False, True), str(stale): (True, True)}
+    assert len(plan([str(done)], force=True)) == 1
+    assert plan([str(unsummarized)], summarize=False) == []
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    summaries = []
+
+    def transcribe(audio, model, options):
+        if "broken" in audio:
+            raise RuntimeError("ffmpeg could not read it")
+        return {
+            "text": "Take it daily.",
+            "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": " Take it daily."}],
+            "language": "en",
+            "audio_seconds": 60.0,
+        }
+
+    async def summarize(transcript, segments=None):
+        summaries.append(transcript)
+        return f"Summary: {transcript}"
+
+    monkeypatch.setattr(transcription_pool, "_transcribe", transcribe)
+    monkeypatch.setattr(transcription_pool.registry, "preload", lambda names: None)
+    monkeypatch.setattr(transcription_pool.registry, "loaded_models", lambda: ["base.en"])
+    monkeypatch.setattr(batch_transcribe, "summarize_with_gemini", summarize)
+    return summaries
+
+
+def test_batch_writes_every_output_and_reports_failures(tmp_path, fakes):
+    good, broken = _touch(tmp_path / "good.wav"), _touch(tmp_path / "broken.wav")
+    runner = BatchRunner(plan([str(good), str(broken)]), workers=0, gemini_concurrency=2)
+    assert asyncio.run(runner.run()) is False
+    assert runner.failed == [str(broken)]
+
+    assert json.loads((tmp_path / "good.json").read_text())["text"] == "Take it daily."
+    assert (tmp_path / "good.txt").read_text() == "Take it daily.\n"
+    assert (tmp_path / "good.wav.summary.txt").read_text() == "Summary: Take it daily."
+    assert not (tmp_path / "broken.json").exists()
+    assert not any(path.suffix == ".tmp" for path in tmp_path.iterdir())
+    assert runner.audio_seconds == 60.0
+
+
+def test_summary_only_items_reuse_the_transcript_on_disk(tmp_path, fakes, monkeypatch):
+    audio = _touch(tmp_path / "half.wav", mtime=1000)
+    _touch(tmp_path / "half.txt", "Earlier transcript.", mtime=2000)
+    _touch(tmp_path / "half.json", json.dumps({"segments": []}), mtime=2000)
+    monkeypatch.setattr(transcription_pool, "_transcribe", None)  # must not be needed
+
+    runner = BatchRunner(plan([str(audio)]), workers=0)
+    assert asyncio.run(runner.run()) is True
+    assert fakes == ["Earlier transcript."]
+    assert (tmp_path / "half.wav.summary.txt").read_text() == "Summary: Earlier transcript."
@@ -0,0 +1,26 @@
+import hashlib
+
+import numpy as np
+
+from benchmark import read_wav, synthetic_speech, vary_audio, write_wav
+
+
+def test_varied_uploads_hash_differently_but_sound_the_same(tmp_path):
+    path = tmp_path / "speech.wav"
+    write_wav(path, synthetic_speech(2))
+    audio = path.read_bytes()
+
+    variants = [vary_audio(audio, n) for n in range(300)]
+    assert len({hashlib.sha256(v).digest() for v in variants}) == 300
+    assert all(len(v) == len(audio) for v in variants)
+
+    varied = tmp_path / "varied.wav"
+    varied.write_bytes(variants[299])
+    samples, original = read_wav(varied), read_wav(path)
+    # only the last two samples change, to near-silence
+    np.testing.assert_array_equal(samples[:-2], original[:-2])
+    assert np.abs(samples[-2:]).max() < 0.005
+
+
+def test_other_formats_are_left_alone():
+    assert vary_audio(b"ID3" + bytes(100), 5) == b"ID3" + bytes(100)
@@ -0,0 +1,59 @@
+import asyncio
+
+from chat_sessions import ChatSession, estimate_tokens
+
+
+def _session(texts):
+    session = ChatSession()
+    session.messages = [
+        {"role": "user" if i % 2 == 0 else "model", "text": text} for i, text in enumerate(texts)
+    ]
+    return session
+
+
+def test_within_budget_nothing_is_compacted():
+    session = _session(["x" * 40] * 4)
+    assert session._split_for_compaction(budget=40, keep_recent=2) == 0
+
+
+def test_compacts_down_to_half_the_budget():
+    # 10 messages of 10 tokens each, budget 60: drop until at most 30 remain
+    session = _session(["x" * 40] * 10)
+    count = session._split_for_compaction(budget=60, keep_recent=2)
+    assert count == 8
+    assert sum(estimate_tokens(m["text"]) for m in session.messages[count:]) <= 30
+
+
+def test_never_compacts_the_recent_messages():
+    session = _session(["x" * 400] * 6)
+    assert session._split_for_compaction(budget=10, keep_recent=4) == 2
+    assert session._split_for_compaction(budget=10, keep_recent=6) == 0
+
+
+def test_never_splits_a_user_message_from_its_reply():
+    # dropping the first message would be enough, but its reply goes with it
+    session = _session(["x" * 200, "x" * 4, "x" * 4, "x" * 4, "x" * 4, "x" * 4])
+    count = session._split_for_compaction(budget=40, keep_recent=2)
+    assert count == 2
+    assert session.messages[count]["role"] == "user"
+
+
+def test_summary_counts_against_the_budget():
+    session = _session(["x" * 40] * 4)
+    assert session._split_for_compaction(budget=40, keep_recent=0) == 0
+    session.summary = "x" * 400
+    assert session._split_for_compaction(budget=40, keep_recent=0) == 4
+
+
+def test_compact_folds_the_oldest_turns_into_the_summary():
+    session = _session([f"message {i} " + "x" * 40 for i in range(8)])
+    prompts = []
+
+    async def generate(prompt):
+        prompts.append(prompt)
+        return "the summary"
+
+    asyncio.run(session.compact(generate, budget=40, keep_recent=2))
+    assert session.summary == "the summary"
+    assert [m["text"][:9] for m in session.messages] == ["message 6", "message 7"]
+    assert "message 0" in prompts[0] and "message 6" not in prompts[0]
@@ -0,0 +1,193 @@
+import json
+import subprocess
+import sys
+from functools import partial
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import audio_ingest
+import chatbot_backend
+import records_store
+import transcription_pool
+from audio_ingest import SAMPLE_RATE
+from gemini_client import GeminiError
+from transcription_pool import TranscriptionPool
+
+TOKEN = "records-secret"
+# stand-in for ffmpeg: the "upload" is already raw float32 samples
+ECHO = "import sys; sys.stdout.buffer.write(sys.stdin.buffer.read())"
+PASSAGE = {"record_id": 7, "patient_id": "p1", "start": 0.0, "end": 4.0, "text": "BP 150/95", "score": 1.5}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    prompts = []
+
+    async def generate_content(contents):
+        prompts.append(contents)
+        return {"candidates": [{"content": {"parts": [{"text": "reply"}]}}]}
+
+    def retrieve(query, k, patient_id):
+        assert patient_id == "p1"
+        return [PASSAGE]
+
+    monkeypatch.setattr(chatbot_backend, "GEMINI_API_KEY", "test")
+    monkeypatch.setattr(chatbot_backend.gemini, "generate_content", generate_content)
+    monkeypatch.setattr(chatbot_backend, "retrieve", retrieve)
+    for module in (records_store, chatbot_backend):
+        monkeypatch.setattr(module, "RECORDS_API_TOKEN", TOKEN)
+    client = TestClient(chatbot_backend.app)
+    client.prompts = prompts
+    return client
+
+
+def _chat(patient_id="p1", message="What was my blood pressure?"):
+    return {"messages": [{"role": "user", "text": message}], "patient_id": patient_id}
+
+
+@pytest.mark.parametrize("path", ["/chat", "/chat/stream"])
+@pytest.mark.parametrize("headers", [{}, {"X-Records-Token": "wrong"}])
+def test_grounding_on_a_patient_needs_the_records_token(api, path, headers):
+    response = api.post(path, json=_chat(), headers=headers)
+    assert response.status_code == 401
+    assert api.prompts == []
+
+
+def test_grounding_is_refused_when_no_token_is_configured(api, monkeypatch):
+    monkeypatch.setattr(chatbot_backend, "RECORDS_API_TOKEN", None)
+    monkeypatch.setattr(records_store, "RECORDS_API_TOKEN", None)
+    response = api.post("/chat", json=_chat(), headers={"X-Records-Token": ""})
+    assert response.status_code == 403
+    assert api.prompts == []
+
+
+def test_grounded_chat_with_the_token(api):
+    response = api.post("/chat", json=_chat(), headers={"X-Records-Token": TOKEN})
+    assert response.status_code == 200
+    assert response.json()["sources"] == [{"record_id": 7, "start": 0.0, "end": 4.0, "score": 1.5}]
+    assert "BP 150/95" in str(api.prompts[0])
+
+
+def test_chat_without_a_patient_needs_no_token(api):
+    response = api.post("/chat", json=_chat(patient_id=None))
+    assert response.status_code == 200
+    assert response.json()["sources"] == []
+    assert "BP 150/95" not in str(api.prompts[0])
+
+
+def test_upload_admission_uses_the_decoded_length(monkeypatch):
+    decodes = []
+
+    def ffmpeg_decode_args(input_args):
+        decodes.append(input_args)
+        return [sys.executable, "-c", ECHO]
+
+    pool = TranscriptionPool(workers=0, queue_size=4, max_wait_seconds=100, max_per_client=1, preload=[])
+    monkeypatch.setattr(audio_ingest, "ffmpeg_decode_args", ffmpeg_decode_args)
+    monkeypatch.setattr(chatbot_backend, "transcription_pool", pool)
+    client = TestClient(chatbot_backend.app)
+    upload = {"file": ("visit.raw", np.zeros(600 * SAMPLE_RATE, dtype="<f4").tobytes())}
+    try:
+        with pool._admitted("testclient", 0.0, "base.en"):
+            assert client.post("/transcribe_summarize", files=upload).status_code == 429
+        assert decodes == []
+        with pool._admitted("other", 500.0, "base.en"):
+            response = client.post("/transcribe_summarize", files=upload)
+        assert response.status_code == 503
+        assert "Estimated wait" in response.json()["detail"]
+    finally:
+        pool.shutdown()
+
+
+def test_health_reports_the_pool_state_without_importing_torch(monkeypatch):
+    pool = TranscriptionPool(workers=0, preload=[])
+    pool.state, pool.state_detail = "failed", "Models failed to load: base.en"
+    monkeypatch.setattr(chatbot_backend, "transcription_pool", pool)
+    body = TestClient(chatbot_backend.app).get("/health").json()
+    assert body["state"] == "failed"
+    assert body["whisper_error"] == "Models failed to load: base.en"
+    assert "torch" not in sys.modules
+
+
+def test_stuck_decoder_is_a_503_not_a_bad_upload(monkeypatch):
+    monkeypatch.setattr(
+        audio_ingest, "ffmpeg_decode_args", lambda input_args: [sys.executable, "-c", "import time; time.sleep(30)"]
+    )
+    monkeypatch.setattr(chatbot_backend, "decode_stream", partial(audio_ingest.decode_stream, timeout=0.5))
+    upload = {"file": ("visit.raw", bytes(1024))}
+    response = TestClient(chatbot_backend.app).post("/transcribe_summarize", files=upload)
+    assert response.status_code == 503
+    assert "timed out" in response.json()["detail"]
+
+
+def test_upload_is_transcribed_in_process_and_summarized(monkeypatch):
+    def transcribe(audio, model, options):
+        return {"text": "hello", "segments": [], "language": "en", "audio_seconds": len(audio) / SAMPLE_RATE}
+
+    async def summarize(text, segments=None):
+        return f"summary of {text}"
+
+    def no_subprocess(*args, **kwargs):
+        raise AssertionError("the whisper CLI must not be spawned")
+
+    pool = TranscriptionPool(workers=0, max_per_client=0, preload=[])
+    monkeypatch.setattr(audio_ingest, "ffmpeg_decode_args", lambda input_args: [sys.executable, "-c", ECHO])
+    monkeypatch.setattr(transcription_pool, "_transcribe", transcribe)
+    monkeypatch.setattr(chatbot_backend, "transcription_pool", pool)
+    monkeypatch.setattr(chatbot_backend, "summarize_transcript_with_gemini", summarize)
+    monkeypatch.setattr(subprocess, "run", no_subprocess)
+    upload = {"file": ("visit.raw", np.zeros(2 * SAMPLE_RATE, dtype="<f4").tobytes())}
+    try:
+        response = TestClient(chatbot_backend.app).post("/transcribe_summarize", files=upload)
+    finally:
+        pool.shutdown()
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["transcript"], body["summary"], body["whisper_model"]) == ("hello", "summary of hello", "base.en")
+
+
+def _events(body):
+    """Parses a server-sent event stream into [(event, data)]."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields.get("event"), json.loads(fields["data"])))
+    return events
+
+
+def _stream(monkeypatch, *chunks, fail_after=None):
+    async def stream_generate_content(contents):
+        for i, chunk in enumerate(chunks):
+            if i == fail_after:
+                raise GeminiError("upstream reset", status_code=503)
+            yield chunk
+
+    monkeypatch.setattr(chatbot_backend, "GEMINI_API_KEY", "test")
+    monkeypatch.setattr(chatbot_backend.gemini, "stream_generate_content", stream_generate_content)
+
+
+def test_stream_relays_deltas_then_the_full_reply(monkeypatch):
+    _stream(monkeypatch, "Drink ", "more ", "water.")
+    response = TestClient(chatbot_backend.app).post("/chat/stream", json=_chat(patient_id=None))
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert _events(response.text) == [
+        (None, {"delta": "Drink "}),
+        (None, {"delta": "more "}),
+        (None, {"delta": "water."}),
+        ("done", {"reply": "Drink more water.", "sources": []}),
+    ]
+
+
+def test_failure_before_the_first_chunk_is_an_http_error(monkeypatch):
+    _stream(monkeypatch, "never sent", fail_after=0)
+    response = TestClient(chatbot_backend.app).post("/chat/stream", json=_chat(patient_id=None))
+    assert response.status_code == 503
+
+
+def test_failure_mid_stream_ends_with_an_error_event(monkeypatch):
+    _stream(monkeypatch, "Drink ", "more ", fail_after=1)
+    response = TestClient(chatbot_backend.app).post("/chat/stream", json=_chat(patient_id=None))
+    assert response.status_code == 200
+    assert _events(response.text) == [(None, {"delta": "Drink "}), ("error", {"detail": "upstream reset"})]
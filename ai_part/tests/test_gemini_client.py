@@ -0,0 +1,226 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import gemini_client
+from gemini_client import (
+    CircuitBreaker,
+    GeminiClient,
+    GeminiDeadlineExceeded,
+    GeminiError,
+    GeminiOverloaded,
+    GeminiUnavailable,
+    backoff_delay,
+    gemini_deadline,
+)
+
+RETRYABLE = GeminiError("upstream 503", status_code=503)
+NOT_RETRYABLE = GeminiError("bad request", status_code=400)
+
+
+def test_backoff_is_jittered_below_an_exponential_ceiling(monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_RETRY_BASE_SECONDS", 0.5)
+    monkeypatch.setattr(gemini_client, "GEMINI_RETRY_MAX_DELAY_SECONDS", 3.0)
+    for attempt, ceiling in ((0, 0.5), (1, 1.0), (2, 2.0), (3, 3.0), (10, 3.0)):
+        delays = [backoff_delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        # full jitter: spread over the whole range, not bunched at the ceiling
+        assert min(delays) < ceiling / 4 and max(delays) > ceiling * 3 / 4
+
+
+def test_backoff_honours_a_longer_retry_after():
+    assert backoff_delay(0, retry_after=7.0) == 7.0
+    assert backoff_delay(0, retry_after=0.0) <= gemini_client.GEMINI_RETRY_BASE_SECONDS
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    for _ in range(2):
+        with breaker.guard():
+            breaker.record(RETRYABLE)
+    with breaker.guard():
+        breaker.record(None)
+    assert breaker.state == "closed" and breaker.failures == 0
+
+    for _ in range(3):
+        with breaker.guard():
+            breaker.record(RETRYABLE)
+    assert breaker.state == "open"
+    with pytest.raises(GeminiUnavailable) as raised:
+        with breaker.guard():
+            pass
+    assert 1 <= raised.value.retry_after <= 60
+    assert not raised.value.retryable
+
+
+def test_client_errors_do_not_open_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    for _ in range(5):
+        with breaker.guard():
+            breaker.record(NOT_RETRYABLE)
+    assert breaker.state == "closed"
+
+
+def _opened(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(gemini_client.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    with breaker.guard():
+        breaker.record(RETRYABLE)
+    now[0] += 30
+    return breaker
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success(monkeypatch):
+    breaker = _opened(monkeypatch)
+    with breaker.guard():
+        assert breaker.state == "half_open"
+        # a second call while the probe is in flight still fails fast
+        with pytest.raises(GeminiUnavailable):
+            with breaker.guard():
+                pass
+        breaker.record(None)
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens(monkeypatch):
+    breaker = _opened(monkeypatch)
+    with breaker.guard():
+        breaker.record(RETRYABLE)
+    assert breaker.state == "open"
+    with pytest.raises(GeminiUnavailable):
+        with breaker.guard():
+            pass
+
+
+def test_cancelled_probe_lets_the_next_call_probe(monkeypatch):
+    breaker = _opened(monkeypatch)
+    with pytest.raises(asyncio.CancelledError):
+        with breaker.guard():
+            raise asyncio.CancelledError()
+    with breaker.guard():
+        breaker.record(None)
+    assert breaker.state == "closed"
+
+
+def _client(monkeypatch, handler, **kwargs):
+    transport = httpx.MockTransport(handler)
+    async_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        gemini_client.httpx, "AsyncClient", lambda **options: async_client(transport=transport, **options)
+    )
+    monkeypatch.setattr(gemini_client, "backoff_delay", lambda attempt, retry_after=None: retry_after or 0.0)
+    return GeminiClient(api_key="test", **kwargs)
+
+
+def _reply(text):
+    return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+
+def test_transient_failures_are_retried_with_a_shorter_timeout(monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_RETRY_TIMEOUT_SECONDS", 5.0)
+    timeouts = []
+
+    def handler(request):
+        timeouts.append(request.extensions["timeout"]["read"])
+        return httpx.Response(503) if len(timeouts) < 3 else _reply("ok")
+
+    client = _client(monkeypatch, handler, timeout=60, max_retries=3)
+    assert asyncio.run(client.generate_text("hi")) == "ok"
+    assert timeouts[0] == 60
+    assert all(timeout <= 5.0 for timeout in timeouts[1:])
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400, json={"error": {"message": "bad prompt"}})
+
+    client = _client(monkeypatch, handler, max_retries=3)
+    with pytest.raises(GeminiError, match="bad prompt"):
+        asyncio.run(client.generate_text("hi"))
+    assert len(calls) == 1
+
+
+def test_retries_stop_at_the_deadline(monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_DEADLINE_SECONDS", 0.5)
+
+    async def handler(request):
+        # a hung upstream: each attempt runs into its own timeout
+        timeout = request.extensions["timeout"]["read"]
+        await asyncio.sleep(timeout)
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    client = _client(monkeypatch, handler, timeout=0.2, max_retries=10, breaker=CircuitBreaker(100))
+    started = time.monotonic()
+    with pytest.raises(GeminiError):
+        asyncio.run(client.generate_text("hi"))
+    assert time.monotonic() - started < 1.0
+
+
+def test_deadline_block_bounds_every_call_in_it(monkeypatch):
+    async def handler(request):
+        await asyncio.sleep(5)
+        return _reply("late")
+
+    client = _client(monkeypatch, handler, timeout=10)
+
+    async def main():
+        with gemini_deadline(0.2):
+            return await asyncio.gather(
+                client.generate_text("a"), client.generate_text("b"), return_exceptions=True
+            )
+
+    started = time.monotonic()
+    results = asyncio.run(main())
+    assert all(isinstance(result, GeminiDeadlineExceeded) for result in results)
+    assert time.monotonic() - started < 1.0
+
+
+def test_full_queue_is_refused_without_calling_upstream(monkeypatch):
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        return _reply("ok")
+
+    client = _client(monkeypatch, handler, max_concurrency=1, queue_size=1)
+
+    async def main():
+        first = asyncio.create_task(client.generate_text("a"))
+        second = asyncio.create_task(client.generate_text("b"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(GeminiOverloaded):
+            await client.generate_text("c")
+        release.set()
+        assert await asyncio.gather(first, second) == ["ok", "ok"]
+
+    asyncio.run(main())
+
+
+def test_one_pooled_http_client_per_event_loop(monkeypatch):
+    created = []
+    transport = httpx.MockTransport(lambda request: _reply("ok"))
+    async_client = httpx.AsyncClient
+
+    def make(**options):
+        created.append(options)
+        return async_client(transport=transport, **options)
+
+    monkeypatch.setattr(gemini_client.httpx, "AsyncClient", make)
+    client = GeminiClient(api_key="test", max_concurrency=3)
+
+    async def main():
+        await asyncio.gather(*(client.generate_text(str(i)) for i in range(5)))
+        await client.generate_text("again")
+
+    asyncio.run(main())
+    assert len(created) == 1
+    assert created[0]["limits"].max_keepalive_connections == created[0]["limits"].max_connections
+    # asyncio.run() starts a new loop: the old client can't be reused there
+    asyncio.run(main())
+    assert len(created) == 2
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+import jobs
+from jobs import DONE, FAILED, QUEUED, JobManager, JobQueueFull
+
+
+def test_jobs_run_in_the_background_and_keep_their_result():
+    async def main():
+        manager = JobManager(concurrency=1)
+        release = asyncio.Event()
+
+        async def runner(job):
+            job.stages["transcribe"] = 1.5
+            await release.wait()
+            return {"transcript": "hello"}
+
+        job = manager.submit(runner, client="alice", filename="visit.wav")
+        assert job.status == QUEUED
+        await asyncio.sleep(0.01)
+        assert job.to_status()["status"] == "running"
+        release.set()
+        await asyncio.sleep(0.01)
+        await manager.stop()
+        return job
+
+    job = asyncio.run(main())
+    assert job.status == DONE and job.result == {"transcript": "hello"}
+    status = job.to_status()
+    assert status["filename"] == "visit.wav" and status["stages"] == {"transcribe": 1.5}
+    # the client is for fair-share accounting, not reported back
+    assert job.client == "alice" and "client" not in status
+
+
+def test_failures_are_reported_on_the_job():
+    async def main():
+        manager = JobManager(concurrency=1)
+
+        async def runner(job):
+            raise RuntimeError("Whisper exploded")
+
+        job = manager.submit(runner)
+        await asyncio.sleep(0.01)
+        await manager.stop()
+        return job
+
+    job = asyncio.run(main())
+    assert (job.status, job.error) == (FAILED, "Whisper exploded")
+
+
+def test_full_queue_refuses_new_jobs():
+    async def main():
+        manager = JobManager(concurrency=1, queue_size=1)
+        release = asyncio.Event()
+
+        async def runner(job):
+            await release.wait()
+            return {}
+
+        manager.submit(runner)
+        await asyncio.sleep(0.01)  # the first job is taken by the worker
+        manager.submit(runner)
+        with pytest.raises(JobQueueFull):
+            manager.submit(runner)
+        await manager.stop()
+
+    asyncio.run(main())
+
+
+def test_finished_jobs_expire(monkeypatch):
+    async def main():
+        manager = JobManager(ttl_seconds=60)
+
+        async def runner(job):
+            return {}
+
+        job = manager.submit(runner)
+        await asyncio.sleep(0.01)
+        assert manager.get(job.id) is job
+        monkeypatch.setattr(jobs.time, "time", lambda: job.finished_at + 61)
+        assert manager.get(job.id) is None
+        await manager.stop()
+
+    asyncio.run(main())
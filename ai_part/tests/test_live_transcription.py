@@ -0,0 +1,104 @@
+import asyncio
+
+import numpy as np
+
+from audio_ingest import SAMPLE_RATE
+from live_transcription import LiveTranscriber
+
+
+def _seconds(n):
+    return np.zeros(int(n * SAMPLE_RATE), dtype=np.float32)
+
+
+def _segment(start, end, text):
+    return {"start": start, "end": end, "text": text}
+
+
+class FakeWhisper:
+    """Returns queued segment lists; records the audio length and options of every call."""
+
+    def __init__(self, *replies, during=None):
+        self.replies = list(replies)
+        self.calls = []
+        # run while the "transcription" is in progress
+        self.during = during
+
+    async def __call__(self, audio, **options):
+        self.calls.append((len(audio) / SAMPLE_RATE, options))
+        if self.during is not None:
+            self.during()
+        await asyncio.sleep(0)
+        return {"segments": self.replies.pop(0)}
+
+
+def test_commits_stable_segments_and_keeps_the_tail_tentative():
+    whisper = FakeWhisper(
+        [_segment(0.0, 2.0, " Hello"), _segment(2.0, 4.0, " there"), _segment(4.0, 5.8, " gen")],
+        [_segment(0.0, 1.5, " general"), _segment(1.5, 3.0, " kenobi")],
+    )
+    live = LiveTranscriber(whisper, step_seconds=5, window_seconds=30, holdback_seconds=1.5)
+    live.feed(_seconds(6))
+    assert live.ready()
+
+    new, tentative = asyncio.run(live.step())
+    # the last segment, and anything within the holdback of the end, stay tentative
+    assert [(s["start"], s["end"], s["text"]) for s in new] == [(0.0, 2.0, " Hello"), (2.0, 4.0, " there")]
+    assert tentative == "gen"
+    assert not live.ready()
+    assert live.duration == 6.0
+
+    new, tentative = asyncio.run(live.step(final=True))
+    # the second pass saw only the uncommitted 2 s, shifted back onto the recording's timeline
+    assert whisper.calls[1][0] == 2.0
+    assert whisper.calls[1][1] == {"initial_prompt": "Hello there"}
+    assert [(s["id"], s["start"], s["end"]) for s in new] == [(2, 4.0, 5.5), (3, 5.5, 7.0)]
+    assert live.text == "Hello there general kenobi"
+    assert tentative == ""
+
+
+def test_full_window_without_a_safe_cut_is_committed():
+    whisper = FakeWhisper([_segment(0.0, 9.8, " one long sentence"), _segment(9.8, 10.0, " and")])
+    live = LiveTranscriber(whisper, step_seconds=5, window_seconds=10, holdback_seconds=1.5)
+    live.feed(_seconds(10))
+    new, tentative = asyncio.run(live.step())
+    assert [s["text"] for s in new] == [" one long sentence"]
+    assert tentative == "and"
+
+
+def test_silence_does_not_grow_the_buffer_forever():
+    whisper = FakeWhisper([])
+    live = LiveTranscriber(whisper, step_seconds=5, window_seconds=10, holdback_seconds=1.5)
+    live.feed(_seconds(12))
+    assert asyncio.run(live.step()) == ([], "")
+    assert live._buffer_start == int(10.5 * SAMPLE_RATE)
+    assert live.duration == 12.0
+
+
+def test_audio_fed_during_a_step_is_not_committed_or_dropped():
+    # regression: the step used the buffer length after the await, so audio
+    # that arrived while Whisper ran was treated as transcribed
+    live = None
+    whisper = FakeWhisper(
+        [_segment(0.0, 1.0, " a"), _segment(1.0, 3.8, " b"), _segment(3.8, 4.0, " c")],
+        during=lambda: live.feed(_seconds(3)),
+    )
+    live = LiveTranscriber(whisper, step_seconds=1, window_seconds=30, holdback_seconds=1.0)
+    live.feed(_seconds(4))
+
+    new, _ = asyncio.run(live.step())
+    # only segments ending a holdback before the end of the 4 s actually transcribed are stable
+    assert [s["end"] for s in new] == [1.0]
+    assert live._buffer_start == SAMPLE_RATE
+    assert len(live._buffer) == 6 * SAMPLE_RATE
+    # the audio that arrived meanwhile still counts as new
+    assert live.ready()
+
+
+def test_final_step_drops_only_the_transcribed_audio():
+    live = None
+    whisper = FakeWhisper([_segment(0.0, 2.0, " done")], during=lambda: live.feed(_seconds(1)))
+    live = LiveTranscriber(whisper, step_seconds=1, window_seconds=30, holdback_seconds=1.0)
+    live.feed(_seconds(2))
+    asyncio.run(live.step(final=True))
+    assert live._buffer_start == 2 * SAMPLE_RATE
+    assert len(live._buffer) == SAMPLE_RATE
@@ -0,0 +1,31 @@
+import pytest
+
+from loadtest import chat_body, parse_mix, report
+
+SLO = {"chat": 2.0, "transcribe": 30.0}
+
+
+def test_mix_is_normalized_and_validated():
+    assert parse_mix("chat=3,transcribe=1") == {"chat": 0.75, "transcribe": 0.25}
+    assert parse_mix("transcribe") == {"transcribe": 1.0}
+    with pytest.raises(ValueError, match="Unknown request kind 'records'"):
+        parse_mix("chat=1,records=1")
+
+
+def test_chat_bodies_differ_per_request():
+    assert chat_body(1) != chat_body(2)
+    assert chat_body(1)["system_prompt"] == chat_body(2)["system_prompt"]
+
+
+def test_report_checks_latency_and_error_rate_per_kind():
+    results = [{"kind": "chat", "status": 200, "seconds": 0.1 * i} for i in range(1, 11)]
+    results += [{"kind": "transcribe", "status": 200, "seconds": 5.0}] * 3
+    results += [{"kind": "transcribe", "status": 503, "seconds": 0.01}]
+
+    summary = report(results, duration=10, slo=SLO, max_error_rate=0.1)
+    chat, transcribe = summary["kinds"]["chat"], summary["kinds"]["transcribe"]
+    assert chat["slo_met"] and chat["throughput_rps"] == 1.0 and chat["p50"] == pytest.approx(0.55)
+    # latency is fine but one request in four was refused
+    assert transcribe["statuses"] == {"200": 3, "503": 1}
+    assert transcribe["error_rate"] == 0.25 and not transcribe["slo_met"]
+    assert not summary["slo_met"]
@@ -0,0 +1,87 @@
+import numpy as np
+
+from long_audio import merge_results, plan_chunks
+
+SR = 16000
+
+
+def _speech_with_pauses(seconds, pauses):
+    """Noise bursts standing in for speech, with near-silence over each (start, end) pause."""
+    rng = np.random.default_rng(0)
+    audio = rng.uniform(-0.3, 0.3, int(seconds * SR)).astype(np.float32)
+    for start, end in pauses:
+        audio[int(start * SR):int(end * SR)] *= 1e-4
+    return audio
+
+
+def test_short_audio_is_one_chunk():
+    audio = np.zeros(int(14 * SR), dtype=np.float32)
+    assert plan_chunks(audio, chunk_seconds=10, sample_rate=SR) == [(0, len(audio))]
+
+
+def test_cuts_fall_in_pauses_and_cover_the_audio():
+    pauses = [(7.0, 9.0), (20.0, 22.0), (28.0, 30.0)]
+    audio = _speech_with_pauses(40, pauses)
+    chunks = plan_chunks(audio, chunk_seconds=10, sample_rate=SR)
+
+    assert len(chunks) == 4
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(audio)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(chunks, chunks[1:]))
+    for _, cut in chunks[:-1]:
+        assert any(start * SR <= cut <= end * SR for start, end in pauses), cut / SR
+
+
+def test_without_pauses_cuts_at_the_target_length():
+    audio = _speech_with_pauses(40, [])
+    assert plan_chunks(audio, chunk_seconds=10, sample_rate=SR) == [
+        (0, 10 * SR), (10 * SR, 20 * SR), (20 * SR, 30 * SR), (30 * SR, 40 * SR)
+    ]
+
+
+def test_merge_shifts_segments_onto_the_original_timeline():
+    chunks = [(0, 10 * SR), (10 * SR, 25 * SR), (25 * SR, 30 * SR)]
+    results = [
+        {
+            "text": " Hello there. ",
+            "segments": [{"id": 0, "start": 0.5, "end": 2.0, "text": " Hello there."}],
+            "language": "en",
+            "speech_seconds": 8.0,
+            "timings": {"transcribe": 1.5},
+        },
+        {
+            "text": "",
+            "segments": [],
+            "language": None,
+            "speech_seconds": 0.0,
+            "timings": {"transcribe": 0.5, "vad": 0.1},
+        },
+        {
+            "text": "Goodbye.",
+            "segments": [
+                {"id": 0, "start": 1.0, "end": 2.25, "text": " Good"},
+                {"id": 1, "start": 2.25, "end": 3.0, "text": "bye."},
+            ],
+            "language": "en",
+            "speech_seconds": 3.0,
+            "timings": {"transcribe": 1.0},
+        },
+    ]
+
+    merged = merge_results(results, chunks, sample_rate=SR)
+    assert merged["text"] == "Hello there. Goodbye."
+    assert [(s["id"], s["start"], s["end"]) for s in merged["segments"]] == [
+        (0, 0.5, 2.0), (1, 26.0, 27.25), (2, 27.25, 28.0)
+    ]
+    assert merged["language"] == "en"
+    assert merged["audio_seconds"] == 30.0
+    assert merged["speech_seconds"] == 11.0
+    assert merged["chunks"] == 3
+    assert merged["timings"] == {"transcribe": 3.0, "vad": 0.1}
+
+
+def test_merge_leaves_speech_unknown_if_any_chunk_lacks_it():
+    results = [
+        {"text": "a", "segments": [], "language": "en", "speech_seconds": 1.0},
+        {"text": "b", "segments": [], "language": "en", "speech_seconds": None},
+    ]
+    assert merge_results(results, [(0, SR), (SR, 2 * SR)], sample_rate=SR)["speech_seconds"] is None
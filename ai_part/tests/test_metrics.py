@@ -0,0 +1,34 @@
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+import chatbot_backend
+import transcribe_summarize
+from metrics import observe_stages, stage_timer
+
+
+def _count(stage):
+    return REGISTRY.get_sample_value("stage_seconds_count", {"stage": stage}) or 0.0
+
+
+def test_stage_timer_records_even_when_the_stage_fails():
+    timings = {}
+    with pytest.raises(ValueError):
+        with stage_timer(timings, "decode"):
+            raise ValueError("bad upload")
+    assert timings["decode"] >= 0
+
+
+def test_observed_stages_land_in_the_histogram():
+    before = _count("retrieval")
+    observe_stages({"retrieval": 0.02})
+    assert _count("retrieval") == before + 1
+
+
+@pytest.mark.parametrize("app", [chatbot_backend.app, transcribe_summarize.app])
+def test_metrics_endpoint_serves_prometheus_text(app):
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE stage_seconds histogram" in response.text
+    assert 'queue_depth{queue="transcription"}' in response.text
@@ -0,0 +1,57 @@
+import pytest
+
+import model_policy
+from model_policy import candidates, select_model
+
+MODELS = ["small.en", "base.en", "tiny.en"]
+RTF = {"small.en": 0.5, "base.en": 0.2, "tiny.en": 0.1}
+
+
+class FakePool:
+    def __init__(self, wait=0.0, workers=1):
+        self.wait = wait
+        self.workers = workers
+
+    def rtf(self, model):
+        return RTF[model]
+
+    def estimated_wait(self):
+        return self.wait
+
+
+@pytest.fixture(autouse=True)
+def auto_models(monkeypatch):
+    monkeypatch.setattr(model_policy, "WHISPER_AUTO_MODELS", MODELS)
+
+
+def test_candidates_depend_on_the_policy():
+    assert candidates("auto", policy="client") == MODELS
+    assert candidates("small.en", policy="client") == ["small.en"]
+    # under "auto" an explicit model caps the size
+    assert candidates("base.en", policy="auto") == ["base.en", "tiny.en"]
+    assert candidates("large", policy="auto") == ["large"]
+
+
+def test_idle_pool_gets_the_largest_model():
+    model, details = select_model("auto", 60, FakePool(), latency_budget=60)
+    assert model == "small.en"
+    assert details["policy"] == "auto"
+    assert details["estimated_seconds"] == {"small.en": 30.0, "base.en": 12.0, "tiny.en": 6.0}
+
+
+def test_backlog_steps_down_to_a_smaller_model():
+    assert select_model("auto", 60, FakePool(wait=40), latency_budget=60)[0] == "base.en"
+    # nothing fits: the smallest candidate rather than a refusal
+    assert select_model("auto", 60, FakePool(wait=100), latency_budget=60)[0] == "tiny.en"
+
+
+def test_long_recordings_are_spread_over_the_workers():
+    audio_seconds = model_policy.LONG_AUDIO_MIN_SECONDS * 2
+    budget = audio_seconds * RTF["small.en"] / 2
+    assert select_model("auto", audio_seconds, FakePool(workers=1), latency_budget=budget)[0] != "small.en"
+    assert select_model("auto", audio_seconds, FakePool(workers=2), latency_budget=budget)[0] == "small.en"
+
+
+def test_explicit_model_under_the_client_policy_is_used_as_is():
+    model, details = select_model("small.en", 600, FakePool(wait=1000), latency_budget=1, policy="client")
+    assert (model, details) == ("small.en", {"requested": "small.en", "policy": "client"})
@@ -0,0 +1,97 @@
+import pytest
+
+from records_store import RecordStore, fts_query
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RecordStore(str(tmp_path / "records.sqlite3"))
+    yield store
+    store.close()
+
+
+def _add(store, transcript, patient_id="p1", summary="summary"):
+    return store.add({"transcript": transcript, "summary": summary, "segments": []}, {}, patient_id=patient_id)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("blood pressure", '"blood" "pressure"'),
+        ('a "quoted" OR NOT -x*', '"a" "quoted" "OR" "NOT" "x"'),
+        ("NEAR(knee, 2)", '"NEAR" "knee" "2"'),
+        ("  ", None),
+        ("*:-()", None),
+    ],
+)
+def test_fts_query_quotes_every_word(text, expected):
+    assert fts_query(text) == expected
+
+
+def test_fts_query_never_fails_in_sqlite(store):
+    _add(store, "Knee pain near the joint")
+    for text in ['"unbalanced', "AND OR", "NEAR(", "col:knee", "knee*"]:
+        store.search(query=text)
+
+
+def test_search_stems_and_requires_every_word(store):
+    first = _add(store, "Blood pressures were high")
+    _add(store, "Blood sugar is fine")
+    assert [r["id"] for r in store.search(query="pressure")["records"]] == [first]
+    assert [r["id"] for r in store.search(query="blood pressure")["records"]] == [first]
+    assert store.search(query="blood insulin")["records"] == []
+
+
+def test_keyset_pages_cover_everything_once(store):
+    ids = [_add(store, f"visit {i} blood pressure", patient_id="p1" if i % 2 else "p2") for i in range(23)]
+    for kwargs, expected in (
+        ({}, ids),
+        ({"query": "pressure"}, ids),
+        ({"patient_id": "p1"}, ids[1::2]),
+        ({"query": "blood", "patient_id": "p2"}, ids[0::2]),
+    ):
+        seen, cursor = [], None
+        while True:
+            page = store.search(limit=5, before=cursor, **kwargs)
+            assert len(page["records"]) <= 5
+            seen += [record["id"] for record in page["records"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == sorted(expected, reverse=True)
+
+
+def test_last_full_page_has_no_cursor(store):
+    for i in range(4):
+        _add(store, f"visit {i}")
+    page = store.search(limit=2)
+    assert page["next_cursor"] is not None
+    assert store.search(limit=2, before=page["next_cursor"])["next_cursor"] is None
+
+
+def test_delete_is_logged_for_other_processes(store):
+    first, second = _add(store, "one"), _add(store, "two")
+    assert store.delete(first, "p1")
+    assert not store.delete(first, "p1")
+    assert store.search(query="one")["records"] == []
+    assert store.existing_ids({first, second}) == {second}
+    assert [record_id for _, record_id in store.deletions_since(0, 10)] == [first]
+
+
+def test_get_and_delete_are_scoped_to_the_patient(store):
+    record_id = _add(store, "knee pain", patient_id="p1")
+    assert store.get(record_id, "p2") is None
+    assert not store.delete(record_id, "p2")
+    assert store.get(record_id, "p1")["transcript"] == "knee pain"
+    assert store.delete(record_id, "p1")
+
+
+def test_summary_may_be_missing(store):
+    record_id = store.add({"transcript": "text", "summary": None, "segments": []}, {})
+    assert store.get(record_id, None)["summary"] == ""
+
+
+def test_disabled_store_keeps_nothing():
+    store = RecordStore("")
+    assert store.add({"transcript": "t", "summary": "s"}, {}) is None
+    assert store.search() == {"records": [], "next_cursor": None}
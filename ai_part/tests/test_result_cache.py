@@ -0,0 +1,52 @@
+import json
+
+from result_cache import ResultCache, make_key
+
+
+def _cache(tmp_path, max_bytes=10_000):
+    return ResultCache(path=str(tmp_path / "cache.sqlite3"), max_bytes=max_bytes)
+
+
+def _size(value):
+    return len(json.dumps(value))
+
+
+def test_round_trip_and_disabled_cache(tmp_path):
+    cache = _cache(tmp_path)
+    key = make_key("transcript", "abc", "base.en")
+    assert cache.get(key) is None
+    cache.put(key, "transcript", {"text": "hello", "segments": []})
+    assert cache.get(key) == {"text": "hello", "segments": []}
+    assert make_key("transcript", "abc", "tiny.en") != key
+
+    disabled = ResultCache(path="")
+    disabled.put(key, "transcript", "x")
+    assert disabled.get(key) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    value = "x" * 100
+    cache = _cache(tmp_path, max_bytes=3 * _size(value))
+    for key in "abc":
+        cache.put(key, "summary", value)
+    cache.get("a")  # now b is the least recently used
+    cache.put("d", "summary", value)
+    assert [cache.get(key) is not None for key in "abcd"] == [True, False, True, True]
+
+
+def test_running_total_counts_replacements_and_survives_reopening(tmp_path):
+    value = "x" * 100
+    cache = _cache(tmp_path, max_bytes=3 * _size(value))
+    for _ in range(5):
+        # replacing an entry must not count its old size twice
+        cache.put("a", "summary", value)
+    cache.put("b", "summary", value)
+    assert cache.get("a") is not None and cache._total == 2 * _size(value)
+
+    cache.close()
+    reopened = _cache(tmp_path, max_bytes=3 * _size(value))
+    reopened.put("c", "summary", value)
+    reopened.put("d", "summary", value)
+    assert reopened._total == 3 * _size(value)
+    # reading "a" above made "b" the least recently used
+    assert reopened.get("b") is None
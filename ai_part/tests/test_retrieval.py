@@ -0,0 +1,129 @@
+import pytest
+
+import retrieval
+from records_store import RecordStore
+from retrieval import RetrievalIndex, retrieve
+
+DOCS = [
+    (1, "p1", "Blood pressure was high at the last visit, we discussed salt."),
+    (2, "p1", "The knee pain is better since physiotherapy started."),
+    (3, "p2", "Blood sugar and blood pressure are both under control."),
+    (4, "p2", "Insulin dose stays the same; recheck sugar in three months."),
+    (5, "p1", "Pressure in the chest when climbing stairs, refer to cardiology."),
+]
+QUERIES = ["blood pressure", "sugar", "knee physiotherapy", "pressure stairs", "unknown words"]
+
+
+def _segments(text):
+    return [{"start": 0.0, "end": 4.0, "text": text}]
+
+
+def _build(path="", merge_docs=1000, docs=DOCS):
+    index = RetrievalIndex(path, merge_docs=merge_docs)
+    for record_id, patient_id, text in docs:
+        index.add_record(record_id, _segments(text), patient_id=patient_id)
+    return index
+
+
+def _results(index, query, patient_id=None):
+    return [(hit["record_id"], hit["score"]) for hit in index.search(query, k=10, patient_id=patient_id)]
+
+
+def test_search_ranks_by_bm25_and_filters_by_patient():
+    index = _build()
+    hits = index.search("blood pressure", k=10)
+    assert {hit["record_id"] for hit in hits} == {1, 3, 5}
+    # record 3 mentions "blood" twice and "pressure" once
+    assert hits[0]["record_id"] == 3
+    assert [hit["record_id"] for hit in index.search("blood pressure", k=10, patient_id="p1")] == [1, 5]
+    assert index.search("blood pressure", k=10, patient_id="nobody") == []
+    assert index.search("the and of", k=10) == []
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_merge_keeps_results(query):
+    delta_only = _build(merge_docs=1000)
+    merged = _build(merge_docs=1000)
+    merged.flush()
+    # merged in two steps: main arrays plus a delta with terms the main arrays lack
+    mixed = _build(merge_docs=1000, docs=DOCS[:2])
+    mixed.flush()
+    for record_id, patient_id, text in DOCS[2:]:
+        mixed.add_record(record_id, _segments(text), patient_id=patient_id)
+
+    expected = _results(delta_only, query)
+    assert _results(merged, query) == expected
+    assert _results(mixed, query) == expected
+    for patient_id in ("p1", "p2"):
+        assert _results(mixed, query, patient_id) == _results(delta_only, query, patient_id)
+
+
+def test_merge_after_every_record_matches_single_merge():
+    one_by_one = _build(merge_docs=1)
+    once = _build(merge_docs=1000)
+    once.flush()
+    for query in QUERIES:
+        assert _results(one_by_one, query) == _results(once, query)
+
+
+def test_saved_index_round_trips(tmp_path):
+    path = tmp_path / "index"
+    index = _build(str(path))
+    index.flush()
+    index.add_record(6, _segments("Blood tests ordered for next week."), patient_id="p3")
+
+    reloaded = RetrievalIndex(str(path))
+    # only merged records are saved; record 6 is still in the delta
+    assert reloaded.last_record_id == 5
+    assert reloaded.passages == len(DOCS)
+    assert reloaded.search("physiotherapy", k=1)[0]["text"] == DOCS[1][2]
+    index.flush()
+    reloaded = RetrievalIndex(str(path))
+    for query in QUERIES + ["blood tests"]:
+        assert _results(reloaded, query) == _results(index, query)
+    assert reloaded.search("tests", k=1)[0]["patient_id"] == "p3"
+
+
+def test_deleted_records_are_scrubbed_from_saved_index(tmp_path):
+    store = RecordStore(str(tmp_path / "records.sqlite3"))
+    kept = store.add({"transcript": "", "summary": "", "segments": _segments("blood pressure fine")}, {}, "p1")
+    gone = store.add({"transcript": "", "summary": "", "segments": _segments("blood secretword")}, {}, "p1")
+    path = tmp_path / "index"
+    index = RetrievalIndex(str(path), merge_docs=1)
+    index.refresh(store)
+    assert {hit["record_id"] for hit in index.search("blood", k=10)} == {kept, gone}
+
+    store.delete(gone, "p1")
+    index.refresh(store)
+    assert [hit["record_id"] for hit in index.search("blood", k=10)] == [kept]
+    assert index.search("secretword", k=10) == []
+    assert b"secretword" not in (path / "text.npy").read_bytes()
+
+    reloaded = RetrievalIndex(str(path))
+    assert reloaded.last_deletion_seq == index.last_deletion_seq
+    assert [hit["record_id"] for hit in reloaded.search("blood", k=10)] == [kept]
+    store.close()
+
+
+def test_deleting_a_record_still_in_the_delta():
+    store = RecordStore(":memory:")
+    record_id = store.add({"transcript": "", "summary": "", "segments": _segments("gamma ray")}, {}, "p1")
+    index = RetrievalIndex("", merge_docs=1000)
+    index.refresh(store)
+    assert index.search("gamma", k=1)
+    store.delete(record_id, "p1")
+    index.refresh(store)
+    assert index.search("gamma", k=1) == []
+    store.close()
+
+
+def test_retrieve_needs_a_patient(monkeypatch):
+    store = RecordStore(":memory:")
+    for _, patient_id, text in DOCS:
+        store.add({"transcript": "", "summary": "", "segments": _segments(text)}, {}, patient_id)
+    monkeypatch.setattr(retrieval, "retrieval_index", RetrievalIndex("", merge_docs=1000))
+
+    assert {hit["patient_id"] for hit in retrieve("blood pressure", 4, "p2", store)} == {"p2"}
+    with pytest.raises(ValueError):
+        retrieve("blood pressure", 4, None, store)
+    store.close()
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    async def main():
+        flights = SingleFlight("test")
+        runs = 0
+        release = asyncio.Event()
+
+        async def work():
+            nonlocal runs
+            runs += 1
+            await release.wait()
+            return "done"
+
+        callers = [asyncio.create_task(flights.do("key", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert "key" in flights and flights.in_flight == 1
+        release.set()
+        results = await asyncio.gather(*callers)
+        assert runs == 1
+        assert [result for result, _ in results] == ["done"] * 3
+        assert sorted(shared for _, shared in results) == [False, True, True]
+        # finished work is forgotten: the next call runs again
+        assert "key" not in flights
+        assert await flights.do("key", work) == ("done", False)
+        assert runs == 2
+
+    asyncio.run(main())
+
+
+def test_different_keys_run_separately():
+    async def main():
+        flights = SingleFlight("test")
+
+        async def work(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(flights.do("a", lambda: work(1)), flights.do("b", lambda: work(2)))
+        assert results == [(1, False), (2, False)]
+
+    asyncio.run(main())
+
+
+def test_every_caller_gets_the_exception():
+    async def main():
+        flights = SingleFlight("test")
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(
+            flights.do("key", fail), flights.do("key", fail), return_exceptions=True
+        )
+        assert [str(result) for result in results] == ["boom", "boom"]
+        assert "key" not in flights
+
+    asyncio.run(main())
+
+
+def test_cancelled_caller_does_not_cancel_the_work():
+    async def main():
+        flights = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return 42
+
+        first = asyncio.create_task(flights.do("key", work))
+        second = asyncio.create_task(flights.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        release.set()
+        assert await second == (42, True)
+
+    asyncio.run(main())
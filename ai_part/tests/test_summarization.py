@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import gemini_client
+import summarization
+from summarization import map_reduce_summarize, split_transcript
+
+
+class FakeGemini:
+    """Answers every prompt with a short summary; tracks the prompts and the peak concurrency."""
+
+    def __init__(self, delay=0.0):
+        self.prompts = []
+        self.delay = delay
+        self.in_flight = self.peak = 0
+
+    async def __call__(self, prompt):
+        self.prompts.append(prompt)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return f"summary {len(self.prompts)}"
+
+
+def _single(text):
+    return f"Summarize: {text}"
+
+
+def test_split_keeps_segments_whole():
+    segments = [{"text": f" Segment number {i}."} for i in range(10)]
+    chunks = split_transcript("", segments, max_chars=40)
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert " ".join(chunks) == "".join(s["text"] for s in segments).strip()
+    assert all(chunk.endswith(".") for chunk in chunks)
+
+
+def test_split_falls_back_to_sentences_and_cuts_oversized_ones():
+    text = "Short one. " + "x" * 50 + ". Last one."
+    chunks = split_transcript(text, max_chars=20)
+    assert chunks[0] == "Short one."
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    assert chunks[-1] == "Last one."
+
+
+def test_short_transcript_is_one_call_with_the_callers_prompt():
+    gemini = FakeGemini()
+    assert asyncio.run(map_reduce_summarize("Hello there.", gemini, _single)) == "summary 1"
+    assert gemini.prompts == ["Summarize: Hello there."]
+
+
+def test_long_transcript_is_mapped_then_reduced_in_order():
+    gemini = FakeGemini(delay=0.01)
+    text = " ".join(f"Sentence {i} is here." for i in range(40))
+    summary = asyncio.run(map_reduce_summarize(text, gemini, _single, max_chars=100, max_concurrency=2))
+
+    # condensing rounds reuse the chunk prompt on partial summaries; pick the transcript chunks
+    chunk_prompts = [p for p in gemini.prompts if "Transcript part:\n\nSentence" in p]
+    assert len(chunk_prompts) == len(split_transcript(text, max_chars=100))
+    assert gemini.peak == 2
+    # nothing is truncated: every sentence reached some chunk prompt
+    assert all(f"Sentence {i} is here." in "".join(chunk_prompts) for i in range(40))
+    assert summary == f"summary {len(gemini.prompts)}"
+    assert "Merge them into a single" in gemini.prompts[-1]
+
+
+def test_partials_longer_than_a_chunk_still_reduce():
+    # regression: packing cut such partials into more groups every round, forever
+    async def verbose(prompt):
+        return "a long partial summary " * 5
+
+    text = " ".join(f"Sentence {i} is here." for i in range(10))
+    summary = asyncio.run(asyncio.wait_for(map_reduce_summarize(text, verbose, _single, max_chars=50), 5))
+    assert summary.startswith("a long partial summary")
+
+
+def test_every_call_shares_the_summary_deadline(monkeypatch):
+    monkeypatch.setattr(summarization, "SUMMARY_DEADLINE_SECONDS", 30)
+    deadlines = []
+
+    async def generate(prompt):
+        deadlines.append(gemini_client._deadline.get())
+        return "summary"
+
+    started = time.monotonic()
+    asyncio.run(map_reduce_summarize("One. Two. Three.", generate, _single, max_chars=5))
+    # map, condense and reduce calls alike
+    assert len(deadlines) > 3 and len(set(deadlines)) == 1
+    assert started + 30 <= deadlines[0] <= time.monotonic() + 30
@@ -0,0 +1,202 @@
+import asyncio
+import sys
+import threading
+import time
+from functools import partial
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+import audio_ingest
+import records_store
+import transcribe_summarize
+import transcription_pool
+from audio_ingest import SAMPLE_RATE
+from jobs import JobManager
+from records_store import RecordStore
+from result_cache import ResultCache
+from transcription_pool import TranscriptionPool, TranscriptionPoolFull
+
+# stand-in for ffmpeg: the "upload" is already raw float32 samples
+ECHO = """
+import sys
+sys.stdout.buffer.write(sys.stdin.buffer.read())
+"""
+HANG = """
+import time
+time.sleep(30)
+"""
+
+
+def _upload(seconds):
+    return {"file": ("visit.raw", np.zeros(int(seconds * SAMPLE_RATE), dtype="<f4").tobytes())}
+
+
+@pytest.fixture
+def app(monkeypatch):
+    decodes = []
+
+    def ffmpeg_decode_args(input_args):
+        decodes.append(input_args)
+        return [sys.executable, "-c", ECHO]
+
+    def transcribe(audio, model, options):
+        return {"text": "hello", "segments": [], "language": "en", "audio_seconds": len(audio) / SAMPLE_RATE}
+
+    async def summarize(text, segments=None):
+        return "summary"
+
+    pool = TranscriptionPool(workers=0, queue_size=1, max_wait_seconds=100, max_per_client=1, preload=[])
+    monkeypatch.setattr(audio_ingest, "ffmpeg_decode_args", ffmpeg_decode_args)
+    monkeypatch.setattr(transcription_pool, "_transcribe", transcribe)
+    monkeypatch.setattr(transcribe_summarize, "transcription_pool", pool)
+    # job workers are tasks of the loop that started them; each test gets its own
+    monkeypatch.setattr(transcribe_summarize, "job_manager", JobManager())
+    monkeypatch.setattr(transcribe_summarize, "result_cache", ResultCache(path=""))
+    monkeypatch.setattr(transcribe_summarize, "summarize_with_gemini", summarize)
+    client = TestClient(transcribe_summarize.app)
+    client.pool, client.decodes = pool, decodes
+    yield client
+    pool.shutdown()
+
+
+def test_upload_is_transcribed_and_summarized(app):
+    response = app.post("/transcribe_summarize", files=_upload(2))
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["transcript"], body["summary"], body["coalesced"]) == ("hello", "summary", False)
+    assert {"receive", "decode", "transcribe", "summarize"} <= set(body["stages"])
+
+
+@pytest.mark.parametrize("path", ["/transcribe_summarize", "/jobs"])
+def test_client_over_its_share_is_refused_before_decoding(app, path):
+    with app.pool._admitted("testclient", 0.0, "base.en"):
+        response = app.post(path, files=_upload(2))
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert app.decodes == []
+
+
+@pytest.mark.parametrize("path", ["/transcribe_summarize", "/jobs"])
+def test_long_upload_behind_a_backlog_is_refused_after_decoding(app, path):
+    # regression: admission ran with audio_seconds=0, so the wait estimate never applied
+    with app.pool._admitted("other", 500.0, "base.en"):
+        assert app.post(path, files=_upload(1)).status_code in (200, 202)
+        response = app.post(path, files=_upload(600))
+    assert response.status_code == 503
+    assert "Estimated wait" in response.json()["detail"]
+    assert len(app.decodes) == 2
+
+
+def test_admitted_job_waits_for_a_busy_pool(app, monkeypatch):
+    # regression: a queued job that found the pool full failed instead of waiting
+    transcribe_in_pool = transcribe_summarize.transcribe_file_in_pool
+    refusals = [TranscriptionPoolFull("busy", retry_after=0)]
+
+    async def busy_once(audio, model="base.en", client=None):
+        assert client == "testclient"
+        if refusals:
+            raise refusals.pop()
+        return await transcribe_in_pool(audio, model=model, client=client)
+
+    monkeypatch.setattr(transcribe_summarize, "transcribe_file_in_pool", busy_once)
+    with app:
+        job_id = app.post("/jobs", files=_upload(2)).json()["job_id"]
+        for _ in range(100):
+            status = app.get(f"/jobs/{job_id}").json()
+            if status["status"] in ("done", "failed"):
+                break
+            time.sleep(0.05)
+        assert status["status"] == "done", status
+        assert app.get(f"/jobs/{job_id}/result").json()["transcript"] == "hello"
+
+
+def test_repeated_upload_is_served_from_the_cache(app, monkeypatch, tmp_path):
+    cache = ResultCache(path=str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(transcribe_summarize, "result_cache", cache)
+    first = app.post("/transcribe_summarize", files=_upload(2)).json()
+    second = app.post("/transcribe_summarize", files=_upload(2)).json()
+    assert first["cached"] == {"transcript": False, "summary": False}
+    assert second["cached"] == {"transcript": True, "summary": True}
+    assert second["transcript"] == first["transcript"]
+
+    # another backend or VAD configuration transcribes afresh
+    monkeypatch.setattr(transcribe_summarize, "TRANSCRIPT_SETTINGS", "[\"faster-whisper\"]")
+    third = app.post("/transcribe_summarize", files=_upload(2)).json()
+    assert third["cached"] == {"transcript": False, "summary": False}
+    cache.close()
+
+
+def test_records_are_only_served_to_their_patient(app, monkeypatch, tmp_path):
+    store = RecordStore(str(tmp_path / "records.sqlite3"))
+    monkeypatch.setattr(transcribe_summarize, "record_store", store)
+    for module in (records_store, transcribe_summarize):
+        monkeypatch.setattr(module, "RECORDS_API_TOKEN", "secret")
+    headers = {"X-Records-Token": "secret"}
+    record_id = app.post("/transcribe_summarize", files=_upload(2), params={"patient_id": "p1"}).json()["record_id"]
+
+    assert app.get(f"/records/{record_id}", params={"patient_id": "p1"}).status_code == 401
+    assert app.get(f"/records/{record_id}", params={"patient_id": "p2"}, headers=headers).status_code == 404
+    assert app.delete(f"/records/{record_id}", params={"patient_id": "p2"}, headers=headers).status_code == 404
+    record = app.get(f"/records/{record_id}", params={"patient_id": "p1"}, headers=headers).json()
+    assert record["transcript"] == "hello"
+    assert app.delete(f"/records/{record_id}", params={"patient_id": "p1"}, headers=headers).status_code == 204
+    store.close()
+
+
+def test_ready_flips_once_the_pool_is_warm(app):
+    assert app.get("/health").json()["state"] == "starting"
+    assert app.get("/ready").status_code == 503
+    with app:
+        for _ in range(100):
+            if app.get("/ready").status_code == 200:
+                break
+            time.sleep(0.05)
+        assert app.get("/ready").json() == {"ready": True, "state": "ready"}
+        assert app.get("/health").json()["transcription_pool"]["warmup_seconds"] is not None
+
+
+@pytest.mark.parametrize("path", ["/transcribe_summarize", "/jobs"])
+def test_stuck_decoder_is_a_503_not_a_bad_upload(app, monkeypatch, path):
+    # regression: AudioDecodeTimeout is an AudioDecodeError, so it came back as 400
+    monkeypatch.setattr(audio_ingest, "ffmpeg_decode_args", lambda input_args: [sys.executable, "-c", HANG])
+    monkeypatch.setattr(transcribe_summarize, "decode_stream", partial(audio_ingest.decode_stream, timeout=0.5))
+    response = app.post(path, files=_upload(1))
+    assert response.status_code == 503
+    assert "timed out" in response.json()["detail"]
+    assert "Retry-After" in response.headers
+
+
+def test_job_result_is_only_served_once_done(app, monkeypatch):
+    summarizing = threading.Event()
+
+    async def slow_summarize(text, segments=None):
+        while not summarizing.is_set():
+            await asyncio.sleep(0.01)
+        return "summary"
+
+    monkeypatch.setattr(transcribe_summarize, "summarize_with_gemini", slow_summarize)
+    assert app.get("/jobs/nope").status_code == 404
+    with app:
+        job_id = app.post("/jobs", files=_upload(2)).json()["job_id"]
+        assert app.get(f"/jobs/{job_id}/result").status_code == 409
+        summarizing.set()
+        for _ in range(100):
+            if app.get(f"/jobs/{job_id}").json()["status"] == "done":
+                break
+            time.sleep(0.05)
+        result = app.get(f"/jobs/{job_id}/result").json()
+    assert (result["filename"], result["summary"]) == ("visit.raw", "summary")
+    assert {"decode", "transcribe", "summarize"} <= set(result["stages"])
+
+
+def test_upload_stages_are_observed(app):
+    def count(stage):
+        return REGISTRY.get_sample_value("stage_seconds_count", {"stage": stage}) or 0.0
+
+    stages = ("receive", "decode", "transcribe", "summarize", "serialize")
+    before = {stage: count(stage) for stage in stages}
+    assert app.post("/transcribe_summarize", files=_upload(2)).status_code == 200
+    assert {stage: count(stage) - before[stage] for stage in stages} == dict.fromkeys(stages, 1.0)
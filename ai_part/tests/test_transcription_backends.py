@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import pytest
+
+from transcription_backends import BACKENDS, FasterWhisperBackend, OpenAIWhisperBackend, create_backend
+
+
+class FakeFasterModel:
+    def __init__(self):
+        self.options = None
+
+    def transcribe(self, audio, **options):
+        self.options = options
+        segments = (
+            SimpleNamespace(
+                id=i, seek=0, start=start, end=start + 1.23456, text=text, tokens=(1, 2),
+                temperature=0.0, avg_logprob=-0.2, compression_ratio=1.1, no_speech_prob=0.01,
+            )
+            for i, (start, text) in enumerate([(0.0, " Take it"), (1.5, " twice daily.")])
+        )
+        return segments, SimpleNamespace(language="en")
+
+
+def test_faster_whisper_results_match_the_openai_whisper_schema():
+    model = FakeFasterModel()
+    result = FasterWhisperBackend(beam_size=3).transcribe(model, "audio", fp16=False, verbose=None, language="en")
+    # openai-whisper-only options are dropped, the beam size defaults to the configured one
+    assert model.options == {"language": "en", "beam_size": 3}
+    assert result["text"] == " Take it twice daily."
+    assert result["language"] == "en"
+    assert result["segments"][1] == {
+        "id": 1, "seek": 0, "start": 1.5, "end": 2.735, "text": " twice daily.", "tokens": [1, 2],
+        "temperature": 0.0, "avg_logprob": -0.2, "compression_ratio": 1.1, "no_speech_prob": 0.01,
+    }
+
+
+def test_openai_whisper_runs_in_fp32_by_default():
+    calls = []
+
+    class Model:
+        def transcribe(self, audio, **options):
+            calls.append(options)
+            return {"text": " hi", "segments": [], "language": "en"}
+
+    assert OpenAIWhisperBackend().transcribe(Model(), "audio")["text"] == " hi"
+    assert calls == [{"fp16": False}]
+
+
+def test_backends_are_chosen_by_name():
+    assert set(BACKENDS) == {"openai-whisper", "faster-whisper"}
+    assert isinstance(create_backend("faster-whisper"), FasterWhisperBackend)
+    with pytest.raises(ValueError, match="Unknown TRANSCRIBE_BACKEND 'whisper.cpp'"):
+        create_backend("whisper.cpp")
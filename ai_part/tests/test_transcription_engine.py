@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import transcription_engine
+from audio_ingest import SAMPLE_RATE
+
+
+@pytest.fixture
+def inference(monkeypatch):
+    calls = []
+
+    def transcribe(model, audio, **options):
+        calls.append((model, len(audio) / SAMPLE_RATE, options))
+        return {
+            "text": " Take one tablet daily. ",
+            "segments": [{"id": 0, "start": 0.0, "end": 1.0, "text": " Take one tablet daily.", "words": []}],
+            "language": "en",
+        }
+
+    monkeypatch.setattr(transcription_engine, "get_model", lambda name: f"model:{name}")
+    monkeypatch.setattr(transcription_engine.backend, "transcribe", transcribe)
+    return calls
+
+
+def test_transcribes_samples_in_memory(inference):
+    audio = np.full(2 * SAMPLE_RATE, 0.1, dtype=np.float32)
+    result = transcription_engine.transcribe(audio, model="tiny.en", vad=False, language="en")
+    assert inference == [("model:tiny.en", 2.0, {"language": "en"})]
+    assert result["text"] == "Take one tablet daily."
+    # only the samplekedar.json keys are kept
+    assert result["segments"] == [{"id": 0, "start": 0.0, "end": 1.0, "text": " Take one tablet daily."}]
+    assert result["audio_seconds"] == 2.0
+    assert {"model_load", "inference"} <= set(result["timings"])
+
+
+def test_silence_skips_inference(inference):
+    result = transcription_engine.transcribe(np.zeros(5 * SAMPLE_RATE, dtype=np.float32), vad=True)
+    assert inference == []
+    assert (result["text"], result["segments"], result["speech_seconds"]) == ("", [], 0.0)
+    assert result["audio_seconds"] == 5.0
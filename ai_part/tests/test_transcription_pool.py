@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import transcription_pool
+from audio_ingest import SAMPLE_RATE
+from transcription_pool import ClientQuotaExceeded, TranscriptionPool, TranscriptionPoolFull
+
+
+def _seconds(n):
+    return np.zeros(int(n * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_in_process_jobs_run_one_at_a_time(monkeypatch):
+    # regression: workers=0 ran up to `capacity` jobs at once in the default
+    # thread pool, all decoding on the same Whisper model
+    lock = threading.Lock()
+    running = []
+    overlap = []
+
+    def transcribe(audio, model, options):
+        with lock:
+            running.append(model)
+            overlap.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(model)
+        return {"text": "", "segments": [], "audio_seconds": len(audio) / SAMPLE_RATE}
+
+    monkeypatch.setattr(transcription_pool, "_transcribe", transcribe)
+    pool = TranscriptionPool(workers=0, queue_size=4, max_per_client=0)
+
+    async def main():
+        return await asyncio.gather(*(pool.transcribe(_seconds(1)) for _ in range(4)))
+
+    try:
+        assert len(asyncio.run(main())) == 4
+    finally:
+        pool.shutdown()
+    assert max(overlap) == 1
+    assert pool.pending == 0
+
+
+def test_admission_refuses_a_full_queue_and_a_greedy_client():
+    pool = TranscriptionPool(workers=0, queue_size=1, max_per_client=1)
+    try:
+        with pool._admitted("alice", 0.0, "base.en"):
+            with pytest.raises(ClientQuotaExceeded):
+                pool.check_admission("alice")
+            pool.check_admission("bob")
+            with pool._admitted("bob", 0.0, "base.en"):
+                with pytest.raises(TranscriptionPoolFull) as raised:
+                    pool.check_admission("carol")
+                assert not isinstance(raised.value, ClientQuotaExceeded)
+        pool.check_admission("alice")
+    finally:
+        pool.shutdown()
+
+
+def test_admission_weighs_the_recording_against_the_backlog():
+    pool = TranscriptionPool(workers=0, queue_size=8, max_wait_seconds=100, max_per_client=0)
+    try:
+        # an idle pool takes any length
+        pool.check_admission(audio_seconds=10_000, model="base.en")
+        with pool._admitted(None, 400, "base.en"):
+            assert pool.estimated_wait() == 400 * pool.rtf("base.en")
+            pool.check_admission(audio_seconds=60, model="tiny.en")
+            with pytest.raises(TranscriptionPoolFull) as raised:
+                pool.check_admission(audio_seconds=600, model="base.en")
+            assert raised.value.retry_after == 60
+    finally:
+        pool.shutdown()
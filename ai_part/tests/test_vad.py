@@ -0,0 +1,48 @@
+import numpy as np
+
+from vad import JOIN_GAP_SECONDS, TimeMap, remap_segments, strip_silence
+
+SR = 16000
+
+
+def test_remap_moves_times_back_to_the_original_recording():
+    # speech at 2-4 s and 10-11 s, joined with a 0.5 s gap: 0-2 s, gap 2-2.5 s, 2.5-3.5 s
+    time_map = TimeMap([(2 * SR, 4 * SR), (10 * SR, 11 * SR)], gap_samples=SR // 2, sample_rate=SR)
+    segments = [
+        {"id": 0, "start": 0.0, "end": 1.5, "text": "first"},
+        {"id": 1, "start": 2.75, "end": 3.5, "text": "second"},
+    ]
+    assert remap_segments(segments, time_map) == [
+        {"id": 0, "start": 2.0, "end": 3.5, "text": "first"},
+        {"id": 1, "start": 10.25, "end": 11.0, "text": "second"},
+    ]
+    # the input is not modified
+    assert segments[1]["start"] == 2.75
+
+
+def test_times_in_the_inserted_gap_collapse_onto_the_region_before():
+    time_map = TimeMap([(2 * SR, 4 * SR), (10 * SR, 11 * SR)], gap_samples=SR // 2, sample_rate=SR)
+    assert time_map.to_original(2.2) == 4.0
+    assert time_map.to_original(2.5) == 10.0
+
+
+def test_strip_silence_round_trip():
+    rng = np.random.default_rng(0)
+    audio = np.zeros(12 * SR, dtype=np.float32)
+    audio += rng.uniform(-1e-4, 1e-4, len(audio)).astype(np.float32)
+    audio[3 * SR:5 * SR] = rng.uniform(-0.3, 0.3, 2 * SR)
+    audio[8 * SR:9 * SR] = rng.uniform(-0.3, 0.3, SR)
+
+    speech, time_map, speech_seconds = strip_silence(audio, SR)
+    assert 3.0 <= speech_seconds < 4.0
+    assert len(speech) == round(speech_seconds * SR) + int(JOIN_GAP_SECONDS * SR)
+
+    # a segment covering all speech spans the first onset to the last offset
+    whole = remap_segments([{"start": 0.0, "end": len(speech) / SR}], time_map)[0]
+    assert 2.5 <= whole["start"] <= 3.0
+    assert 9.0 <= whole["end"] <= 9.5
+
+
+def test_silence_only():
+    speech, time_map, speech_seconds = strip_silence(np.zeros(5 * SR, dtype=np.float32), SR)
+    assert len(speech) == 0 and speech_seconds == 0.0
@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import whisper_models
+from whisper_models import WhisperModelRegistry
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    loads = []
+
+    def load(name):
+        loads.append(name)
+        if name == "broken":
+            raise RuntimeError("no such model")
+        time.sleep(0.05)
+        return object()
+
+    monkeypatch.setattr(whisper_models.backend, "load", load)
+    return loads
+
+
+def test_model_is_loaded_once_and_reused(loads):
+    registry = WhisperModelRegistry(max_models=2)
+    assert registry.get("base.en") is registry.get("base.en")
+    assert loads == ["base.en"]
+
+
+def test_concurrent_requests_for_a_cold_model_share_one_load(loads):
+    registry = WhisperModelRegistry(max_models=2)
+    with ThreadPoolExecutor(8) as executor:
+        models = list(executor.map(registry.get, ["base.en"] * 8))
+    assert loads == ["base.en"]
+    assert all(model is models[0] for model in models)
+
+
+def test_least_recently_used_model_is_evicted(loads):
+    registry = WhisperModelRegistry(max_models=2)
+    registry.get("tiny.en")
+    registry.get("base.en")
+    registry.get("tiny.en")
+    registry.get("small.en")
+    assert registry.loaded_models() == ["tiny.en", "small.en"]
+    registry.get("base.en")
+    assert loads == ["tiny.en", "base.en", "small.en", "base.en"]
+
+
+def test_preload_grows_the_cache_and_survives_failures(loads):
+    registry = WhisperModelRegistry(max_models=1)
+    registry.preload(["small.en", "broken", "base.en", "tiny.en", "base.en"])
+    assert registry.max_models == 4
+    assert registry.loaded_models() == ["small.en", "base.en", "tiny.en"]
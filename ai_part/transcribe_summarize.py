@@ -1,23 +1,56 @@
-import os
-import subprocess
-import tempfile
+import asyncio
 import json
-from pathlib import Path
+import hashlib
+import sqlite3
+from functools import partial
+from typing import Optional
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import Depends, FastAPI, UploadFile, File, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-import requests
 import logging
 
+import transcription_engine
+from audio_ingest import (
+    SAMPLE_RATE,
+    AudioDecodeError,
+    AudioDecodeTimeout,
+    AudioTooLarge,
+    UPLOAD_CHUNK_BYTES,
+    FfmpegStreamDecoder,
+    decode_stream,
+    pcm16_to_float32,
+)
+from live_transcription import LIVE_STEP_SECONDS, LIVE_WINDOW_SECONDS, LiveTranscriber
+from result_cache import make_key, result_cache
+from gemini_client import GEMINI_API_KEY, GeminiError, GeminiOverloaded, gemini
+from summarization import SUMMARY_CHUNK_CHARS, map_reduce_summarize
+from jobs import DONE, FAILED, JobQueueFull, job_manager
+from metrics import QUEUE_DEPTH, metrics_response, observe_cache, observe_stages, stage_timer
+from transcription_pool import ClientQuotaExceeded, TranscriptionPoolFull, pool as transcription_pool
+from whisper_models import WHISPER_AVAILABLE
+from transcription_backends import WHISPER_BEAM_SIZE, WHISPER_COMPUTE_TYPE, backend
+from vad import VAD_ENABLED, VAD_MARGIN_DB, VAD_MIN_SILENCE_MS, VAD_MIN_SPEECH_MS, VAD_PAD_MS
+from model_policy import candidates, select_model
+from single_flight import SingleFlight
+from records_store import RECORDS_API_TOKEN, RECORDS_PAGE_SIZE, record_store, records_token_valid
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_MODEL = "gemini-2.5-flash"  # Updated to a valid model
-GEMINI_ENDPOINT = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+# Bump whenever the summary prompt changes so cached summaries are recomputed
+SUMMARY_PROMPT_VERSION = "2"
+# what besides the audio and the model shapes a transcript; part of its cache key
+TRANSCRIPT_SETTINGS = json.dumps([
+    backend.name, WHISPER_COMPUTE_TYPE, WHISPER_BEAM_SIZE,
+    VAD_ENABLED, VAD_MARGIN_DB, VAD_MIN_SPEECH_MS, VAD_MIN_SILENCE_MS, VAD_PAD_MS,
+])
+# devices behind one NAT share an address; the app can send a stable id instead
+CLIENT_ID_HEADER = "X-Client-Id"
+# identical uploads still being processed share one run
+upload_flights = SingleFlight("transcribe_summarize")
 
 app = FastAPI(title="Whisper + Gemini summarizer")
 app.add_middleware(
@@ -29,65 +62,124 @@ app.add_middleware(
 )
 
 
+QUEUE_DEPTH.labels("transcription").set_function(lambda: transcription_pool.pending)
+QUEUE_DEPTH.labels("jobs").set_function(lambda: job_manager.queue_depth)
+
+
+@app.on_event("startup")
+async def start_transcription_pool():
+    """
+    Starts warming the transcription workers in the background so the app
+    answers /health within milliseconds; /ready flips once models are loaded.
+    """
+    app.state.warmup = asyncio.create_task(transcription_pool.warm_up())
+
+
+@app.on_event("shutdown")
+async def stop_background_work():
+    # startup may not have run (e.g. it failed before creating the task)
+    warmup = getattr(app.state, "warmup", None)
+    if warmup is not None:
+        warmup.cancel()
+    await job_manager.stop()
+    transcription_pool.shutdown()
+    await gemini.aclose()
+    record_store.close()
+
+
+def parse_metadata(metadata: Optional[str]) -> dict:
+    """The upload's `metadata` parameter: a JSON object (HTTP 400 otherwise)."""
+    if not metadata:
+        return {}
+    try:
+        value = json.loads(metadata)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"metadata is not valid JSON: {e}")
+    if not isinstance(value, dict):
+        raise HTTPException(status_code=400, detail="metadata must be a JSON object")
+    return value
+
+
+async def store_record(result: dict, stages: dict, audio, audio_hash: str, filename: str, **patient) -> Optional[int]:
+    """Saves a finished result for /records; returns the record id (None if storing failed)."""
+    return await asyncio.to_thread(
+        record_store.add,
+        result,
+        stages,
+        filename=filename,
+        audio_hash=audio_hash,
+        audio_seconds=round(len(audio) / SAMPLE_RATE, 3),
+        **patient,
+    )
+
+
+def client_id(request: Request) -> str:
+    """Identity used for fair-share limits: the app's X-Client-Id header, else the peer address."""
+    return request.headers.get(CLIENT_ID_HEADER) or (request.client.host if request.client else "unknown")
+
+
 @app.get("/")
 def root():
     """Health check endpoint"""
     return {"status": "ok", "message": "Whisper + Gemini API is running"}
 
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: per-stage latency histograms, cache, queue and Gemini counters."""
+    return metrics_response()
+
+
 @app.get("/health")
 def health():
-    """Detailed health check"""
-    whisper_available = False
-    whisper_error = None
-    
-    # Check Whisper via Python import (more reliable than CLI)
-    try:
-        import whisper
-        whisper_available = True
-        logger.info("Whisper found via Python import")
-    except ImportError as e:
-        whisper_error = "Whisper not installed. Run: pip install openai-whisper"
-        logger.warning(f"Whisper import failed: {e}")
-    except Exception as e:
-        whisper_error = f"Whisper check error: {str(e)}"
-        logger.warning(f"Whisper check failed: {e}")
-    
+    """
+    Liveness and status from cached flags; never imports whisper/torch.
+    `state` is "warming" until the transcription workers have their models.
+    """
     response = {
         "status": "ok",
-        "whisper_available": whisper_available,
+        "state": transcription_pool.state,
+        "whisper_available": WHISPER_AVAILABLE,
+        "transcribe_backend": backend.name,
         "gemini_api_key_set": GEMINI_API_KEY is not None and len(GEMINI_API_KEY) > 0,
+        "gemini_circuit": gemini.breaker.state,
+        "transcription_pool": transcription_pool.stats(),
+        "jobs_waiting": job_manager.queue_depth,
     }
     
-    if whisper_error:
-        response["whisper_error"] = whisper_error
+    if not WHISPER_AVAILABLE:
+        response["whisper_error"] = f"{backend.name} not installed. Run: pip install {backend.name}"
+    elif transcription_pool.state_detail:
+        response["whisper_error"] = transcription_pool.state_detail
     
     return response
 
 
-def run_whisper_cli_on_file(path: str, model: str = "base.en") -> str:
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the Whisper models are loaded, 503 until then."""
+    body = {"ready": transcription_pool.ready, "state": transcription_pool.state}
+    if not transcription_pool.ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
+def transcribe_file(path: str, model: str = "base.en") -> dict:
     """
-    Transcribes audio using Whisper Python API (more reliable than CLI).
+    Transcribes audio using the shared in-process Whisper engine.
+    Returns {"text", "segments", "language"}.
     """
     logger.info(f"Starting Whisper transcription on {path} with model {model}")
     
-    # Use Whisper Python API directly (more reliable)
     try:
-        import whisper
-        logger.info(f"Loading Whisper model '{model}'...")
-        
-        # This will download the model on first use (~150MB for base.en)
-        model_obj = whisper.load_model(model)
-        logger.info(f"Model loaded. Transcribing audio...")
-        
-        # Transcribe the audio file
-        result = model_obj.transcribe(path, fp16=False)  # fp16=False for CPU compatibility
-        transcript = result["text"].strip()
+        # Model is loaded once per process and reused across requests
+        result = transcription_engine.transcribe(path, model=model)
+        transcript = result["text"]
         
         logger.info(f"Transcription complete! Length: {len(transcript)} characters")
         logger.info(f"Preview: {transcript[:200]}...")
         
-        return transcript
+        return result
         
     except ImportError:
         logger.error("Whisper module not found")
@@ -102,59 +194,212 @@ def run_whisper_cli_on_file(path: str, model: str = "base.en") -> str:
         raise RuntimeError(f"Whisper transcription failed: {str(e)}")
 
 
-def summarize_with_gemini(text: str, max_chars: int = 16000) -> str:
-    """Summarize text using Gemini API"""
+async def transcribe_file_in_pool(audio, model: str = "base.en", client: str = None) -> dict:
+    """
+    Same as transcribe_file, but runs on a transcription worker process
+    so the event loop stays free while Whisper is busy. `client` is counted
+    against the per-client fair-share limit.
+    """
+    logger.info(f"Queueing Whisper transcription with model {model} "
+                f"({transcription_pool.pending} jobs pending)")
+    try:
+        # long recordings are split at pauses and spread across the workers
+        result = await transcription_pool.transcribe_long(audio, model=model, client=client)
+    except (TranscriptionPoolFull, AudioDecodeError):
+        raise
+    except ImportError:
+        logger.error("Whisper module not found")
+        raise RuntimeError(
+            "Whisper not installed. Run: pip install openai-whisper\n"
+            "Then restart this server."
+        )
+    except Exception as e:
+        logger.error(f"Whisper transcription failed: {e}")
+        raise RuntimeError(f"Whisper transcription failed: {str(e)}")
+
+    logger.info(f"Transcription complete! Length: {len(result['text'])} characters")
+    return result
+
+
+def run_whisper_cli_on_file(path: str, model: str = "base.en") -> str:
+    """
+    Transcribes audio using Whisper Python API (more reliable than CLI).
+    """
+    return transcribe_file(path, model=model)["text"]
+
+
+async def generate_with_gemini(prompt: str) -> str:
+    """Sends a single prompt to Gemini over the shared pooled client."""
+    try:
+        text = await gemini.generate_text(prompt)
+        logger.info("Gemini API call successful")
+        return text
+    except GeminiError as e:
+        logger.error(f"Gemini API request failed: {e}")
+        raise
+
+
+def build_summary_prompt(text: str) -> str:
+    return (
+        "You are a concise assistant. Produce a clear, human-friendly summary of the following transcript.\n\n"
+        "Keep it concise (5-7 sentences) and preserve important names/facts.\n\n"
+        f"Transcript:\n\n{text}"
+    )
+
+
+async def summarize_with_gemini(
+    text: str, max_chars: int = SUMMARY_CHUNK_CHARS, segments: list = None
+) -> str:
+    """
+    Summarize text using Gemini API.
+    Transcripts longer than max_chars are summarized chunk by chunk
+    (split on Whisper segments when given) and the partial summaries merged.
+    """
     if not GEMINI_API_KEY:
         logger.error("GEMINI_API_KEY not set")
         raise RuntimeError("GEMINI_API_KEY missing in .env")
     
     logger.info(f"Starting Gemini summarization, input length: {len(text)} chars")
     
-    # simple truncation
-    if len(text) > max_chars:
-        logger.warning(f"Truncating text from {len(text)} to {max_chars} chars")
-        text = text[:max_chars]
-    
-    prompt = (
-        "You are a concise assistant. Produce a clear, human-friendly summary of the following transcript.\n\n"
-        "Keep it concise (5-7 sentences) and preserve important names/facts.\n\n"
-        f"Transcript:\n\n{text}"
+    summary = await map_reduce_summarize(
+        text,
+        generate=generate_with_gemini,
+        build_prompt=build_summary_prompt,
+        segments=segments,
+        max_chars=max_chars,
     )
-    
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
-    
-    try:
-        resp = requests.post(
-            GEMINI_ENDPOINT, 
-            params={"key": GEMINI_API_KEY}, 
-            json=payload, 
-            timeout=60
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        
-        logger.info("Gemini API call successful")
-        
+    logger.info(f"Summary generated, length: {len(summary)} chars")
+    return summary
+
+
+async def decode_upload(file: UploadFile, stages: dict) -> tuple:
+    """
+    Streams the upload through ffmpeg into memory, hashing it on the way.
+    Returns (16 kHz float32 samples, sha256 hex digest); receive and decode
+    seconds are recorded into `stages`.
+    """
+    digest = hashlib.sha256()
+
+    async def chunks():
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+    timings = {}
+    audio = await decode_stream(chunks(), on_chunk=digest.update, timings=timings)
+    observe_stages(timings)
+    stages.update(timings)
+    logger.info(f"Upload decoded: {len(audio) / SAMPLE_RATE:.1f}s of audio")
+    return audio, digest.hexdigest()
+
+
+async def transcribe_and_summarize_file(
+    audio,
+    whisper_model: str,
+    stages: dict,
+    audio_hash: str = None,
+    client: str = None,
+    latency_budget: float = None,
+) -> dict:
+    """
+    Runs the Whisper + Gemini pipeline on decoded audio (or a file path).
+    With `audio_hash`, cached transcripts and summaries are reused.
+    Per-stage wall-clock seconds are recorded into `stages`.
+    When Gemini fails (circuit open, overloaded, out of retries or past the
+    summary deadline) the transcript is still returned, with
+    "summary": None and the reason in "summary_error".
+    `whisper_model` may be "auto": the model is then chosen from the current
+    load and `latency_budget` (see model_policy).
+    """
+    audio_seconds = 0.0 if isinstance(audio, str) else len(audio) / SAMPLE_RATE
+    whisper_model, model_selection = select_model(
+        whisper_model, audio_seconds, transcription_pool, latency_budget
+    )
+
+    transcript_key = (
+        make_key("transcript", audio_hash, whisper_model, TRANSCRIPT_SETTINGS) if audio_hash else None
+    )
+    cached = {"transcript": False, "summary": False}
+
+    # the cache is SQLite on disk: keep its reads and writes off the event loop
+    result = await asyncio.to_thread(result_cache.get, transcript_key) if transcript_key else None
+    if transcript_key:
+        observe_cache("transcript", result is not None)
+    if result is not None:
+        logger.info("Step 1/3: Transcript served from cache")
+        cached["transcript"] = True
+    else:
+        logger.info("Step 1/3: Running Whisper transcription...")
+        timings = {}
+        with stage_timer(timings, "transcribe"):
+            # transcribe on a warm worker process (no CLI, no output files)
+            result = await transcribe_file_in_pool(audio, model=whisper_model, client=client)
+        # model_load/vad/inference were already observed by the pool
+        observe_stages(timings)
+        stages.update(result.pop("timings", {}), **timings)
+        if transcript_key:
+            await asyncio.to_thread(result_cache.put, transcript_key, "transcript", result)
+    transcript = result["text"]
+    logger.info("Transcription complete!")
+
+    summary_key = (
+        make_key("summary", transcript_key, SUMMARY_PROMPT_VERSION) if transcript_key else None
+    )
+    summary = await asyncio.to_thread(result_cache.get, summary_key) if summary_key else None
+    summary_error = None
+    if summary_key:
+        observe_cache("summary", summary is not None)
+    if summary is not None:
+        logger.info("Step 2/3: Summary served from cache")
+        cached["summary"] = True
+    else:
+        logger.info("Step 2/3: Summarizing with Gemini...")
+        timings = {}
         try:
-            parts = data["candidates"][0]["content"]["parts"]
-            summary = "".join(p.get("text", "") for p in parts).strip()
-            logger.info(f"Summary generated, length: {len(summary)} chars")
-            return summary
-        except (KeyError, IndexError) as e:
-            logger.error(f"Failed to parse Gemini response: {e}")
-            logger.error(f"Response data: {json.dumps(data)}")
-            return f"[Gemini parse error] {json.dumps(data)}"
-            
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Gemini API request failed: {e}")
-        raise
+            with stage_timer(timings, "summarize"):
+                # summarize with Gemini over the shared async client
+                summary = await summarize_with_gemini(transcript, segments=result["segments"])
+        except GeminiError as e:
+            # don't throw away the transcription; the client can summarize later
+            logger.warning(f"Returning transcript without summary: {e}")
+            summary_error = str(e)
+        observe_stages(timings)
+        stages.update(timings)
+        if summary_key and summary is not None and not summary.startswith("[Gemini parse error]"):
+            await asyncio.to_thread(result_cache.put, summary_key, "summary", summary)
+    logger.info("Summarization complete!")
+
+    return {
+        "transcript": transcript,
+        "segments": result["segments"],
+        "summary": summary,
+        **({"summary_error": summary_error} if summary_error else {}),
+        "whisper_model": whisper_model,
+        "model_selection": model_selection,
+        "cached": cached,
+    }
 
 
 @app.post("/transcribe_summarize")
-async def transcribe_summarize(file: UploadFile = File(...), whisper_model: str = "base.en"):
+async def transcribe_summarize(
+    request: Request,
+    file: UploadFile = File(...),
+    whisper_model: str = "base.en",
+    latency_budget: Optional[float] = None,
+    patient_id: Optional[str] = None,
+    metadata: Optional[str] = None,
+):
     """
-    Receives uploaded audio file, saves it temporarily, runs whisper CLI to transcribe,
-    summarizes using Gemini, returns JSON { transcript, summary }.
+    Receives uploaded audio file, decodes it in memory, transcribes it with Whisper,
+    summarizes using Gemini, returns JSON { transcript, segments, summary, whisper_model }.
+    whisper_model="auto" lets the server pick a model that finishes within
+    `latency_budget` seconds under the current load.
+    An identical upload that is still being processed (a client retry) is not
+    run again: the request waits for that run and reports "coalesced": true.
+    The result is stored with `patient_id` and `metadata` (a JSON object) and
+    can be found again under /records by the returned record_id.
     """
     logger.info(f"=== New transcription request ===")
     logger.info(f"Filename: {file.filename}")
@@ -166,58 +411,83 @@ async def transcribe_summarize(file: UploadFile = File(...), whisper_model: str
         logger.error("No filename provided")
         raise HTTPException(status_code=400, detail="No filename provided")
 
-    # Save upload to temp file
-    suffix = Path(file.filename).suffix or ".wav"
-    tmp_file = None
+    stages = {}
+    client = client_id(request)
+    patient = {"patient_id": patient_id, "metadata": parse_metadata(metadata)}
     
+    smallest_model = candidates(whisper_model)[-1]
     try:
-        # Create temp file
-        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-            tmp_name = tmp.name
-            tmp_file = tmp_name
-            logger.info(f"Saving to temp file: {tmp_name}")
-            
-            # stream write
-            total_bytes = 0
-            while True:
-                chunk = await file.read(8192)  # Increased chunk size
-                if not chunk:
-                    break
-                tmp.write(chunk)
-                total_bytes += len(chunk)
-            
-            logger.info(f"File saved, total size: {total_bytes} bytes")
-        
-        logger.info("Step 1/3: Running Whisper transcription...")
-        # run whisper CLI (will create <basename>.txt etc in same dir)
-        transcript = run_whisper_cli_on_file(tmp_name, model=whisper_model)
-        logger.info("Transcription complete!")
+        # cheap refusal before the upload is read: queue full or client over its share
+        transcription_pool.check_admission(client, model=smallest_model)
+        audio, audio_hash = await decode_upload(file, stages)
 
-        logger.info("Step 2/3: Summarizing with Gemini...")
-        # summarize with Gemini
-        summary = summarize_with_gemini(transcript)
-        logger.info("Summarization complete!")
+        async def run():
+            run_stages = {}
+            result = await transcribe_and_summarize_file(
+                audio, whisper_model, run_stages, audio_hash, client=client, latency_budget=latency_budget
+            )
+            result["record_id"] = await store_record(
+                result, {**stages, **run_stages}, audio, audio_hash, file.filename, **patient
+            )
+            return result, run_stages
+
+        flight_key = make_key(
+            "transcribe_summarize", audio_hash, whisper_model, str(latency_budget), json.dumps(patient)
+        )
+        if flight_key not in upload_flights:
+            # a retry of work already in flight attaches to it below whatever the load;
+            # new work is refused if the queue (or this client's share) is full, or if
+            # it would wait too long even on the smallest model it may run on
+            transcription_pool.check_admission(client, len(audio) / SAMPLE_RATE, smallest_model)
+        (result, run_stages), coalesced = await upload_flights.do(flight_key, run)
+        stages.update(run_stages)
 
         logger.info("Step 3/3: Sending response...")
-        return JSONResponse(content={
-            "filename": file.filename,
-            "transcript": transcript,
-            "summary": summary,
-            "status": "success"
-        })
+        with stage_timer(stages, "serialize"):
+            response = JSONResponse(content={
+                "filename": file.filename,
+                **result,
+                "coalesced": coalesced,
+                "stages": stages,
+                "status": "success"
+            })
+        observe_stages({"serialize": stages["serialize"]})
+        return response
+        
+    except ClientQuotaExceeded as e:
+        logger.warning(f"Rejecting upload from {client}: {e}")
+        raise HTTPException(
+            status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
         
-    except requests.HTTPError as e:
-        error_detail = (
-            e.response.text 
-            if hasattr(e, 'response') and e.response is not None 
-            else str(e)
+    except TranscriptionPoolFull as e:
+        logger.warning(f"Rejecting upload: {e}")
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)}
         )
-        logger.error(f"Gemini API error: {error_detail}")
-        raise HTTPException(status_code=502, detail=f"Gemini API error: {error_detail}")
         
-    except FileNotFoundError as e:
-        logger.error(f"Whisper output not found: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Whisper output not found: {str(e)}")
+    except AudioTooLarge as e:
+        logger.warning(f"Rejecting upload: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+        
+    except AudioDecodeTimeout as e:
+        # the decoder stalled or the host is overloaded; the upload itself may be fine
+        logger.error(f"Upload decode timed out: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+        
+    except AudioDecodeError as e:
+        logger.error(f"Could not decode upload: {e}")
+        raise HTTPException(status_code=400, detail=f"Could not decode audio: {e}")
+        
+    except GeminiOverloaded as e:
+        logger.warning(f"Gemini overloaded: {e}")
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
+        
+    except GeminiError as e:
+        logger.error(f"Gemini API error: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
         
     except RuntimeError as e:
         logger.error(f"Whisper error: {str(e)}")
@@ -228,26 +498,274 @@ async def transcribe_summarize(file: UploadFile = File(...), whisper_model: str
         error_detail = f"{str(e)}\n{traceback.format_exc()}"
         logger.error(f"Unexpected error: {error_detail}")
         raise HTTPException(status_code=500, detail=error_detail)
-        
-    finally:
-        # cleanup temp files: uploaded + whisper outputs (txt, srt, vtt, json)
-        if tmp_file:
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    file: UploadFile = File(...),
+    whisper_model: str = "base.en",
+    latency_budget: Optional[float] = None,
+    patient_id: Optional[str] = None,
+    metadata: Optional[str] = None,
+):
+    """
+    Queues a transcribe + summarize job and returns its id immediately.
+    Poll GET /jobs/{job_id} for status and GET /jobs/{job_id}/result for the output.
+    With whisper_model="auto" the model is picked when the job starts.
+    The finished result is stored under /records like /transcribe_summarize's.
+    Admission is decided here, as for /transcribe_summarize (429/503 with
+    Retry-After); an admitted job that finds the pool busy when it starts
+    waits for it instead of failing.
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No filename provided")
+
+    patient = {"patient_id": patient_id, "metadata": parse_metadata(metadata)}
+    client = client_id(request)
+    smallest_model = candidates(whisper_model)[-1]
+    stages = {}
+    try:
+        transcription_pool.check_admission(client, model=smallest_model)
+        audio, audio_hash = await decode_upload(file, stages)
+        transcription_pool.check_admission(client, len(audio) / SAMPLE_RATE, smallest_model)
+    except ClientQuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except TranscriptionPoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except AudioTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except AudioDecodeTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode audio: {e}")
+
+    async def run(job):
+        job.stages.update(stages)
+        while True:
             try:
-                p = Path(tmp_file)
-                base = p.stem
-                dirp = p.parent
-                logger.info("Cleaning up temp files...")
-                # list of possible outputs that whisper produced (basename.*)
-                for ext in ["", ".txt", ".srt", ".vtt", ".json", ".tsv"]:
-                    candidate = dirp / (base + ext)
-                    try:
-                        if candidate.exists():
-                            candidate.unlink()
-                            logger.info(f"Deleted: {candidate}")
-                    except Exception as cleanup_err:
-                        logger.warning(f"Failed to delete {candidate}: {cleanup_err}")
-            except Exception as cleanup_err:
-                logger.warning(f"Cleanup error: {cleanup_err}")
+                result = await transcribe_and_summarize_file(
+                    audio, whisper_model, job.stages, audio_hash, client=job.client, latency_budget=latency_budget
+                )
+                break
+            except TranscriptionPoolFull as e:
+                # synchronous uploads took the slots since this job was admitted
+                logger.info(f"Job {job.id} waiting {e.retry_after}s for the transcription pool: {e}")
+                await asyncio.sleep(e.retry_after)
+        result["record_id"] = await store_record(
+            result, job.stages, audio, audio_hash, file.filename, **patient
+        )
+        return result
+
+    try:
+        job = job_manager.submit(run, client=client, filename=file.filename, whisper_model=whisper_model)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Job status and per-stage timings."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_status()
+
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    """Transcript and summary of a finished job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job.status == FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != DONE:
+        raise HTTPException(status_code=409, detail=f"Job is still {job.status}")
+    return {
+        "job_id": job.id,
+        "filename": job.metadata.get("filename"),
+        **job.result,
+        "stages": job.stages,
+        "status": "success",
+    }
+
+
+def require_records_token(x_records_token: Optional[str] = Header(None)) -> None:
+    """Guards /records: the X-Records-Token header must match RECORDS_API_TOKEN."""
+    if not RECORDS_API_TOKEN:
+        raise HTTPException(status_code=503, detail="Records API is disabled (RECORDS_API_TOKEN not set)")
+    if not records_token_valid(x_records_token):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Records-Token")
+
+
+@app.get("/records", dependencies=[Depends(require_records_token)])
+def list_records(
+    patient_id: str,
+    q: Optional[str] = None,
+    limit: int = RECORDS_PAGE_SIZE,
+    cursor: Optional[int] = None,
+):
+    """
+    One patient's stored results, newest first: {"records": [...], "next_cursor": ...}.
+    `q` full-text searches transcripts and summaries (every word must match);
+    pass `next_cursor` back as `cursor` for the next page (null on the last).
+    """
+    try:
+        return record_store.search(q, patient_id=patient_id, limit=limit, before=cursor)
+    except sqlite3.Error as e:
+        logger.error(f"Records query failed: {e}")
+        raise HTTPException(status_code=503, detail="Records store unavailable")
+
+
+@app.get("/records/{record_id}", dependencies=[Depends(require_records_token)])
+def get_record(record_id: int, patient_id: str):
+    """
+    One of `patient_id`'s stored results with transcript, segments, summary,
+    metadata and stage timings (404 if the record belongs to someone else).
+    """
+    try:
+        record = record_store.get(record_id, patient_id)
+    except sqlite3.Error as e:
+        logger.error(f"Records query failed: {e}")
+        raise HTTPException(status_code=503, detail="Records store unavailable")
+    if record is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return record
+
+
+@app.delete("/records/{record_id}", status_code=204, dependencies=[Depends(require_records_token)])
+def delete_record(record_id: int, patient_id: str):
+    """Deletes one of `patient_id`'s stored results (404 if it belongs to someone else)."""
+    try:
+        deleted = record_store.delete(record_id, patient_id)
+    except sqlite3.Error as e:
+        logger.error(f"Records delete failed: {e}")
+        raise HTTPException(status_code=503, detail="Records store unavailable")
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Record not found")
+
+
+@app.websocket("/transcribe/live")
+async def transcribe_live(
+    websocket: WebSocket,
+    whisper_model: str = "base.en",
+    format: str = "pcm_s16le",
+    sample_rate: int = SAMPLE_RATE,
+    summarize: bool = True,
+):
+    """
+    Live transcription while recording.
+    The client sends binary audio frames: raw mono 16-bit PCM (format=pcm_s16le,
+    any sample_rate) or a container stream ffmpeg can read, e.g. Ogg/WebM Opus
+    (format=opus). It sends the text message "stop" when recording ends.
+    The server pushes:
+        {"type": "partial", "segments": [...], "tentative": "...", "duration": s}
+        {"type": "final", "transcript": "...", "segments": [...], "summary": "..."}
+    Transcription runs on the same warm worker pool as the file endpoint.
+    whisper_model="auto" picks, once per session, the largest model that can
+    re-transcribe a full window within one step under the current load.
+    """
+    await websocket.accept()
+    whisper_model, _ = select_model(
+        whisper_model, LIVE_WINDOW_SECONDS, transcription_pool, latency_budget=LIVE_STEP_SECONDS
+    )
+    logger.info(f"Live transcription started (model {whisper_model}, format {format})")
+
+    transcriber = LiveTranscriber(partial(transcription_pool.transcribe, model=whisper_model))
+    wake = asyncio.Event()
+    stopping = False
+
+    def feed(samples):
+        transcriber.feed(samples)
+        wake.set()
+
+    decoder = None
+    if format != "pcm_s16le" or sample_rate != SAMPLE_RATE:
+        input_args = ["-f", "s16le", "-ar", str(sample_rate), "-ac", "1"] if format == "pcm_s16le" else []
+        decoder = FfmpegStreamDecoder(input_args, on_samples=feed)
+
+    async def transcribe_loop():
+        # re-transcribe whenever enough new audio arrived, one pass at a time
+        while not stopping:
+            await wake.wait()
+            wake.clear()
+            if stopping or not transcriber.ready():
+                continue
+            segments, tentative = await transcriber.step()
+            await websocket.send_json({
+                "type": "partial",
+                "segments": segments,
+                "tentative": tentative,
+                "duration": round(transcriber.duration, 3),
+            })
+
+    loop_task = None
+    try:
+        if decoder:
+            await decoder.start()
+        loop_task = asyncio.create_task(transcribe_loop())
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                if decoder:
+                    # decoded samples reach feed() from the decoder's reader task
+                    await decoder.write(message["bytes"])
+                else:
+                    feed(pcm16_to_float32(message["bytes"]))
+            elif (message.get("text") or "").strip().lower() == "stop":
+                break
+            if loop_task.done():
+                # surface errors from the transcription loop
+                loop_task.result()
+
+        stopping = True
+        wake.set()
+        await loop_task
+        if decoder:
+            await decoder.close()
+
+        segments, _ = await transcriber.step(final=True)
+        final = {
+            "type": "final",
+            "transcript": transcriber.text,
+            "segments": transcriber.committed,
+            "duration": round(transcriber.duration, 3),
+            "whisper_model": whisper_model,
+        }
+        if summarize and transcriber.text:
+            try:
+                final["summary"] = await summarize_with_gemini(
+                    transcriber.text, segments=transcriber.committed
+                )
+            except GeminiError as e:
+                final["summary"], final["summary_error"] = None, str(e)
+        await websocket.send_json(final)
+        await websocket.close()
+        logger.info(f"Live transcription finished ({transcriber.duration:.1f}s of audio)")
+
+    except WebSocketDisconnect:
+        logger.info("Live transcription client disconnected")
+    except (TranscriptionPoolFull, AudioDecodeError, GeminiError, RuntimeError) as e:
+        logger.error(f"Live transcription failed: {e}")
+        # 1013 "try again later" for overload, 1011 for everything else
+        code = 1013 if isinstance(e, (TranscriptionPoolFull, AudioDecodeTimeout)) else 1011
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            await websocket.close(code=code)
+        except Exception:
+            pass
+    finally:
+        stopping = True
+        if loop_task and not loop_task.done():
+            loop_task.cancel()
+        if decoder:
+            await decoder.kill()
 
 
 if __name__ == "__main__":
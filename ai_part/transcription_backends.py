@@ -0,0 +1,129 @@
+"""
+Interchangeable Whisper implementations behind one interface.
+
+A backend loads a model by name and transcribes 16 kHz float32 audio (or a
+file path), returning {"text", "segments", "language"} with segments in the
+samplekedar.json schema. The deployment picks one with TRANSCRIBE_BACKEND:
+
+    openai-whisper  reference PyTorch implementation, fp32 on CPU
+    faster-whisper  CTranslate2 re-implementation; with int8 weights it is
+                    several times faster on CPU and holds each model in
+                    roughly a quarter of the memory
+
+Configuration (environment):
+    TRANSCRIBE_BACKEND     "openai-whisper" or "faster-whisper" (default "openai-whisper")
+    WHISPER_COMPUTE_TYPE   CTranslate2 compute type for faster-whisper (default "int8")
+    WHISPER_BEAM_SIZE      beam size for faster-whisper (default 5, as openai-whisper's CLI)
+"""
+import importlib.util
+import logging
+import os
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_BACKEND = os.getenv("TRANSCRIBE_BACKEND", "openai-whisper")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "5"))
+
+
+class OpenAIWhisperBackend:
+    name = "openai-whisper"
+    module = "whisper"
+
+    def __init__(self):
+        self.threads = 0
+
+    def set_threads(self, threads: int) -> None:
+        self.threads = threads
+        try:
+            import torch
+
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+    def load(self, model_name: str):
+        import whisper
+
+        return whisper.load_model(model_name)
+
+    def transcribe(self, model, audio, **options) -> Dict[str, Any]:
+        options.setdefault("fp16", False)  # fp16=False for CPU compatibility
+        result = model.transcribe(audio, **options)
+        return {
+            "text": result["text"],
+            "segments": result.get("segments", []),
+            "language": result.get("language"),
+        }
+
+
+class FasterWhisperBackend:
+    name = "faster-whisper"
+    module = "faster_whisper"
+    # openai-whisper options with no faster-whisper counterpart
+    IGNORED_OPTIONS = ("fp16", "verbose")
+
+    def __init__(self, compute_type: str = WHISPER_COMPUTE_TYPE, beam_size: int = WHISPER_BEAM_SIZE):
+        self.compute_type = compute_type
+        self.beam_size = beam_size
+        self.threads = 0
+
+    def set_threads(self, threads: int) -> None:
+        # CTranslate2 takes its thread count per model, at load time
+        self.threads = threads
+
+    def load(self, model_name: str):
+        from faster_whisper import WhisperModel
+
+        return WhisperModel(
+            model_name, device="cpu", compute_type=self.compute_type, cpu_threads=self.threads
+        )
+
+    def transcribe(self, model, audio, **options) -> Dict[str, Any]:
+        for key in self.IGNORED_OPTIONS:
+            options.pop(key, None)
+        options.setdefault("beam_size", self.beam_size)
+        segments, info = model.transcribe(audio, **options)
+        # segments is a generator; decoding happens while it is consumed
+        converted = [self._segment(s) for s in segments]
+        return {
+            "text": "".join(s["text"] for s in converted),
+            "segments": converted,
+            "language": info.language,
+        }
+
+    @staticmethod
+    def _segment(segment) -> Dict[str, Any]:
+        return {
+            "id": segment.id,
+            "seek": segment.seek,
+            "start": round(segment.start, 3),
+            "end": round(segment.end, 3),
+            "text": segment.text,
+            "tokens": list(segment.tokens),
+            "temperature": segment.temperature,
+            "avg_logprob": segment.avg_logprob,
+            "compression_ratio": segment.compression_ratio,
+            "no_speech_prob": segment.no_speech_prob,
+        }
+
+
+BACKENDS = {backend.name: backend for backend in (OpenAIWhisperBackend, FasterWhisperBackend)}
+
+
+def available_backends() -> List[str]:
+    """Backends whose package is installed (checked without importing it)."""
+    return [name for name, cls in BACKENDS.items() if importlib.util.find_spec(cls.module) is not None]
+
+
+def create_backend(name: str = TRANSCRIBE_BACKEND):
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown TRANSCRIBE_BACKEND '{name}' (expected one of: {', '.join(BACKENDS)})"
+        ) from None
+
+
+backend = create_backend()
@@ -0,0 +1,90 @@
+"""
+In-process Whisper transcription shared by both backends.
+
+Uses the warm models from `whisper_models`, runs them through the configured
+`transcription_backends` implementation and returns the transcript and its
+segments straight from memory, so no `whisper` CLI interpreter is spawned and
+no .txt/.srt/.vtt/.json/.tsv files are written and read back. Silence is
+stripped with the `vad` pre-pass first, so inference time follows the amount
+of speech rather than the length of the recording.
+"""
+import logging
+from typing import Any, Dict, List
+
+from audio_ingest import SAMPLE_RATE, load_audio
+from metrics import stage_timer
+from transcription_backends import backend
+from vad import VAD_ENABLED, remap_segments, strip_silence
+from whisper_models import get_model
+
+logger = logging.getLogger(__name__)
+
+# Keys kept from whisper's segment dicts (same schema as samplekedar.json)
+SEGMENT_KEYS = (
+    "id",
+    "seek",
+    "start",
+    "end",
+    "text",
+    "tokens",
+    "temperature",
+    "avg_logprob",
+    "compression_ratio",
+    "no_speech_prob",
+)
+
+
+def _clean_segment(segment: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: segment[key] for key in SEGMENT_KEYS if key in segment}
+
+
+def transcribe(audio, model: str = "base.en", vad: bool = VAD_ENABLED, **options) -> Dict[str, Any]:
+    """
+    Transcribes `audio` (a file path or a 16 kHz float32 array) with a cached model.
+    With `vad`, only detected speech is transcribed and segment times are
+    mapped back onto the original recording.
+    Returns {"text", "segments", "language", "audio_seconds", "speech_seconds",
+    "timings"}, where "timings" holds seconds spent per stage.
+    """
+    timings: Dict[str, float] = {}
+    with stage_timer(timings, "model_load"):
+        model_obj = get_model(model)
+
+    audio_seconds = speech_seconds = None
+    time_map = None
+    if vad:
+        if isinstance(audio, str):
+            with stage_timer(timings, "decode"):
+                audio = load_audio(audio)
+        audio_seconds = round(len(audio) / SAMPLE_RATE, 3)
+        with stage_timer(timings, "vad"):
+            audio, time_map, speech_seconds = strip_silence(audio)
+        speech_seconds = round(speech_seconds, 3)
+        logger.info(f"VAD kept {speech_seconds:.1f}s of speech out of {audio_seconds:.1f}s")
+        if len(audio) == 0:
+            return {
+                "text": "",
+                "segments": [],
+                "language": None,
+                "audio_seconds": audio_seconds,
+                "speech_seconds": 0.0,
+                "timings": timings,
+            }
+    elif not isinstance(audio, str):
+        audio_seconds = round(len(audio) / SAMPLE_RATE, 3)
+
+    with stage_timer(timings, "inference"):
+        result = backend.transcribe(model_obj, audio, **options)
+    logger.info(f"Whisper '{model}' ({backend.name}) inference took {timings['inference']:.2f}s")
+
+    segments: List[Dict[str, Any]] = [_clean_segment(s) for s in result.get("segments", [])]
+    if time_map is not None:
+        segments = remap_segments(segments, time_map)
+    return {
+        "text": result["text"].strip(),
+        "segments": segments,
+        "language": result.get("language"),
+        "audio_seconds": audio_seconds,
+        "speech_seconds": speech_seconds,
+        "timings": timings,
+    }
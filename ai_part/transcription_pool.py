@@ -0,0 +1,343 @@
+"""
+Bounded pool of transcription worker processes.
+
+Whisper inference is CPU heavy; running it inside an `async def` handler
+freezes the whole event loop (including /health). Uploads are handed to a
+pool of worker processes instead, each holding its own warm models and a
+fixed torch thread count, and the handler just awaits the result.
+
+The apps never import whisper/torch themselves: `warm_up()` runs as a
+background task at startup, spawns the workers and waits until every one
+has its models loaded, tracking "starting" -> "warming" -> "ready" (or
+"failed") in `state` for /health and /ready. Workers load
+WHISPER_PRELOAD_MODELS (default base.en); under WHISPER_MODEL_POLICY=auto
+they also load the WHISPER_AUTO_MODELS candidates, so adaptive selection
+never waits on a model load.
+
+Admission control rejects work up front instead of oversubscribing the CPU:
+a job is refused when the queue is full, when its estimated wait (the
+admitted jobs' audio seconds x their model's measured real-time factor,
+divided by the workers) exceeds
+TRANSCRIBE_MAX_WAIT_SECONDS, or when its client already has
+TRANSCRIBE_MAX_PER_CLIENT jobs in flight. The exception carries a
+`retry_after` estimate for the Retry-After header.
+
+Configuration (environment):
+    TRANSCRIBE_WORKERS          worker processes (default 2, 0 = run one job at a time in a thread of this process)
+    TRANSCRIBE_QUEUE_SIZE       jobs allowed to wait for a free worker (default 8)
+    TRANSCRIBE_TORCH_THREADS    inference threads per worker (default cpu_count // workers)
+    TRANSCRIBE_MAX_WAIT_SECONDS longest estimated wait accepted (default 600)
+    TRANSCRIBE_MAX_PER_CLIENT   jobs one client may have in flight (default 2, 0 = no limit)
+    TRANSCRIBE_INITIAL_RTF      real-time factor assumed for unmeasured models without a prior (default 0.5)
+"""
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+import transcription_engine
+from audio_ingest import SAMPLE_RATE, decode_file
+from long_audio import LONG_AUDIO_MIN_SECONDS, merge_results, plan_chunks
+from metrics import observe_stages, observe_transcription, stage_timer
+from model_policy import AUTO, WHISPER_AUTO_MODELS, WHISPER_MODEL_POLICY
+from transcription_backends import backend
+from whisper_models import RTF_PRIORS, WHISPER_PRELOAD_MODELS, registry
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "2"))
+TRANSCRIBE_QUEUE_SIZE = int(os.getenv("TRANSCRIBE_QUEUE_SIZE", "8"))
+TRANSCRIBE_TORCH_THREADS = int(os.getenv("TRANSCRIBE_TORCH_THREADS", "0"))
+TRANSCRIBE_MAX_WAIT_SECONDS = float(os.getenv("TRANSCRIBE_MAX_WAIT_SECONDS", "600"))
+TRANSCRIBE_MAX_PER_CLIENT = int(os.getenv("TRANSCRIBE_MAX_PER_CLIENT", "2"))
+TRANSCRIBE_INITIAL_RTF = float(os.getenv("TRANSCRIBE_INITIAL_RTF", "0.5"))
+DEFAULT_WORKER_MODELS = WHISPER_PRELOAD_MODELS or ["base.en"]
+if WHISPER_MODEL_POLICY == AUTO:
+    # the auto policy picks among its candidates per request; all must stay loaded
+    DEFAULT_WORKER_MODELS = list(dict.fromkeys(DEFAULT_WORKER_MODELS + WHISPER_AUTO_MODELS))
+# weight of the newest measurement in the real-time factor moving average
+RTF_SMOOTHING = 0.2
+# pause between asking the workers that haven't reported warm yet
+WARMUP_POLL_SECONDS = 0.5
+
+
+class TranscriptionPoolFull(RuntimeError):
+    """Raised when the pool can't take the job in reasonable time; `retry_after` is in seconds."""
+
+    def __init__(self, message: str, retry_after: float = 30.0):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class ClientQuotaExceeded(TranscriptionPoolFull):
+    """Raised when one client already has TRANSCRIBE_MAX_PER_CLIENT jobs in flight."""
+
+
+def _init_worker(torch_threads: int, preload: List[str]) -> None:
+    """Runs once in each worker process: pin the inference threads and warm the models."""
+    backend.set_threads(torch_threads)
+    logger.info(
+        f"Transcription worker {os.getpid()} starting {backend.name} with {torch_threads} threads"
+    )
+    registry.preload(preload)
+
+
+def _worker_status() -> Tuple[int, List[str]]:
+    """Runs in a worker once its initializer (model preload) has finished."""
+    return os.getpid(), registry.loaded_models()
+
+
+def _transcribe(audio, model: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    return transcription_engine.transcribe(audio, model=model, **options)
+
+
+class TranscriptionPool:
+    def __init__(
+        self,
+        workers: int = TRANSCRIBE_WORKERS,
+        queue_size: int = TRANSCRIBE_QUEUE_SIZE,
+        torch_threads: int = TRANSCRIBE_TORCH_THREADS,
+        preload: Optional[List[str]] = None,
+        max_wait_seconds: float = TRANSCRIBE_MAX_WAIT_SECONDS,
+        max_per_client: int = TRANSCRIBE_MAX_PER_CLIENT,
+    ):
+        self.workers = max(0, workers)
+        self.queue_size = max(0, queue_size)
+        self.max_wait_seconds = max_wait_seconds
+        self.max_per_client = max(0, max_per_client)
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // max(1, self.workers))
+        self.preload = DEFAULT_WORKER_MODELS if preload is None else preload
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._pending_work_seconds = 0.0
+        self._per_client: Counter = Counter()
+        self._rtf: Dict[str, float] = {}
+        self.state = "starting"
+        self.state_detail: Optional[str] = None
+        self.warmup_seconds: Optional[float] = None
+
+    @property
+    def capacity(self) -> int:
+        """Jobs that may be running or waiting at the same time."""
+        return max(1, self.workers) + self.queue_size
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+        if self.workers == 0:
+            # one thread, not the default pool: the models in this process are
+            # shared, and concurrent decodes on one Whisper model corrupt each
+            # other's kv-cache hooks
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcribe")
+            return
+        logger.info(
+            f"Starting {self.workers} transcription workers "
+            f"({self.torch_threads} torch threads each, queue size {self.queue_size})"
+        )
+        # spawn, not fork: forking a process that already imported torch is unsafe
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.torch_threads, self.preload),
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    async def warm_up(self) -> None:
+        """
+        Spawns the workers and loads the preload models off the event loop,
+        then marks the pool ready. Meant to run as a background startup task.
+        """
+        self.state = "warming"
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            if self.workers:
+                self.start()
+                # a worker only picks up work once its initializer has preloaded the models,
+                # but a warm worker can take several requests while another is still
+                # loading: ask again until every worker process has answered
+                reported: Dict[int, List[str]] = {}
+                while True:
+                    for pid, models in await asyncio.gather(
+                        *(
+                            loop.run_in_executor(self._executor, _worker_status)
+                            for _ in range(self.workers - len(reported))
+                        )
+                    ):
+                        reported[pid] = models
+                    if len(reported) >= self.workers:
+                        break
+                    await asyncio.sleep(WARMUP_POLL_SECONDS)
+                loaded = list(reported.values())
+            else:
+                self.start()
+                await loop.run_in_executor(self._executor, registry.preload, self.preload)
+                loaded = [registry.loaded_models()]
+        except Exception as e:
+            self.state, self.state_detail = "failed", f"Worker start failed: {e}"
+            logger.error(f"Transcription pool warm-up failed: {e}")
+            return
+
+        self.warmup_seconds = round(time.perf_counter() - started, 3)
+        missing = sorted({name for models in loaded for name in self.preload if name not in models})
+        if missing:
+            self.state, self.state_detail = "failed", f"Models failed to load: {', '.join(missing)}"
+            logger.error(f"Transcription pool warm-up failed after {self.warmup_seconds:.1f}s: {self.state_detail}")
+        else:
+            self.state, self.state_detail = "ready", None
+            logger.info(f"Transcription pool ready in {self.warmup_seconds:.1f}s")
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def rtf(self, model: str) -> float:
+        """
+        Measured seconds of processing per second of audio for `model` on one
+        worker; a prior (or TRANSCRIBE_INITIAL_RTF) until it has run.
+        """
+        return self._rtf.get(model) or RTF_PRIORS.get(model, TRANSCRIBE_INITIAL_RTF)
+
+    def estimated_wait(self) -> float:
+        """Seconds until the work already admitted is done."""
+        return self._pending_work_seconds / max(1, self.workers)
+
+    def _record_rtf(self, model: str, result: Dict[str, Any]) -> None:
+        timings = result.get("timings", {})
+        processing = timings.get("vad", 0.0) + timings.get("inference", 0.0)
+        if not result.get("audio_seconds") or not processing:
+            return
+        measured = processing / result["audio_seconds"]
+        self._rtf[model] = (1 - RTF_SMOOTHING) * self.rtf(model) + RTF_SMOOTHING * measured
+
+    def check_admission(
+        self, client: Optional[str] = None, audio_seconds: float = 0.0, model: str = "base.en"
+    ) -> None:
+        """
+        Raises TranscriptionPoolFull (or ClientQuotaExceeded) if a job of
+        `audio_seconds` from `client` would be refused right now. Cheap enough
+        to call before the upload is decoded.
+        """
+        wait = self.estimated_wait()
+        if client and self.max_per_client and self._per_client[client] >= self.max_per_client:
+            raise ClientQuotaExceeded(
+                f"Client already has {self._per_client[client]} transcriptions in progress",
+                retry_after=wait,
+            )
+        if self._pending >= self.capacity:
+            raise TranscriptionPoolFull(
+                f"Transcription queue is full ({self._pending} jobs pending)", retry_after=wait
+            )
+        # an idle pool always accepts, however long the recording
+        if self._pending and wait + audio_seconds * self.rtf(model) > self.max_wait_seconds:
+            raise TranscriptionPoolFull(
+                f"Estimated wait of {wait:.0f}s exceeds {self.max_wait_seconds:.0f}s",
+                retry_after=wait,
+            )
+
+    @contextmanager
+    def _admitted(self, client: Optional[str], audio_seconds: float, model: str):
+        """Holds a slot (and the job's share of the backlog) for the duration of the block."""
+        self.check_admission(client, audio_seconds, model)
+        if self._executor is None:
+            self.start()
+        work_seconds = audio_seconds * self.rtf(model)
+        self._pending += 1
+        self._pending_work_seconds += work_seconds
+        if client:
+            self._per_client[client] += 1
+        try:
+            yield
+        finally:
+            self._pending -= 1
+            self._pending_work_seconds -= work_seconds
+            if client:
+                self._per_client[client] -= 1
+                if not self._per_client[client]:
+                    del self._per_client[client]
+
+    async def _run(self, audio, model: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            self._executor, partial(_transcribe, audio, model, options)
+        )
+        # worker processes can't update this process's metrics; report on their behalf
+        observe_stages(result.get("timings", {}))
+        self._record_rtf(model, result)
+        observe_transcription(result.get("audio_seconds"), result.get("speech_seconds"))
+        return result
+
+    async def transcribe(
+        self, audio, model: str = "base.en", client: Optional[str] = None, **options
+    ) -> Dict[str, Any]:
+        """
+        Transcribes `audio` on a worker and returns {"text", "segments", "language"}.
+        Raises TranscriptionPoolFull instead of queueing beyond what admission allows.
+        """
+        audio_seconds = 0.0 if isinstance(audio, str) else len(audio) / SAMPLE_RATE
+        with self._admitted(client, audio_seconds, model):
+            return await self._run(audio, model, options)
+
+    async def transcribe_long(
+        self, audio, model: str = "base.en", client: Optional[str] = None, **options
+    ) -> Dict[str, Any]:
+        """
+        Like `transcribe`, but recordings of at least LONG_AUDIO_MIN_SECONDS are
+        cut at pauses and the chunks transcribed in parallel across the workers,
+        then merged back into one result. Counts as a single pending job.
+        """
+        timings: Dict[str, float] = {}
+        if isinstance(audio, str):
+            self.check_admission(client, 0.0, model)
+            with stage_timer(timings, "decode"):
+                audio = await decode_file(audio)
+            observe_stages(timings)
+
+        with self._admitted(client, len(audio) / SAMPLE_RATE, model):
+            if self.workers < 2 or len(audio) < LONG_AUDIO_MIN_SECONDS * SAMPLE_RATE:
+                result = await self._run(audio, model, options)
+                result["timings"] = {**timings, **result.get("timings", {})}
+                return result
+
+            chunks = plan_chunks(audio)
+            logger.info(
+                f"Splitting {len(audio) / SAMPLE_RATE:.0f}s recording into {len(chunks)} chunks"
+            )
+            results = await asyncio.gather(
+                *(self._run(audio[start:end], model, options) for start, end in chunks)
+            )
+            result = merge_results(results, chunks)
+            result["timings"] = {**timings, **result["timings"]}
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "warmup_seconds": self.warmup_seconds,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self._pending,
+            "pending_work_seconds": round(self._pending_work_seconds, 1),
+            "clients": len(self._per_client),
+            "rtf": {model: round(rtf, 4) for model, rtf in self._rtf.items()},
+            "torch_threads": self.torch_threads,
+        }
+
+
+pool = TranscriptionPool()
@@ -0,0 +1,147 @@
+"""
+Energy-based voice activity detection, vectorized with NumPy.
+
+Clinic recordings contain long pauses. Frames are scored by RMS energy against
+an adaptive noise floor, short gaps are bridged, short blips dropped and the
+speech regions padded. Only those regions are sent to Whisper (joined with a
+short silence so words don't run together), and segment timestamps are mapped
+back onto the original recording's timeline. Dropping silence also avoids
+Whisper's tendency to hallucinate text on it.
+
+Configuration (environment):
+    VAD_ENABLED         "1" to strip silence before transcription (default "1")
+    VAD_MARGIN_DB       dB above the noise floor counted as speech (default 10)
+    VAD_MIN_SPEECH_MS   shorter speech bursts are dropped (default 250)
+    VAD_MIN_SILENCE_MS  shorter pauses are kept inside speech (default 600)
+    VAD_PAD_MS          padding kept around each speech region (default 200)
+"""
+import os
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from audio_ingest import SAMPLE_RATE
+
+FRAME_MS = 30
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "10"))
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "250"))
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "600"))
+VAD_PAD_MS = int(os.getenv("VAD_PAD_MS", "200"))
+
+# frames quieter than this are silence whatever the noise floor (digital silence, fades)
+ABSOLUTE_FLOOR_DB = -60.0
+# silence inserted between speech regions when they are joined for Whisper
+JOIN_GAP_SECONDS = 0.3
+
+
+def frame_energy_db(audio: np.ndarray, frame_samples: int) -> np.ndarray:
+    """RMS energy in dBFS of consecutive non-overlapping frames."""
+    n_frames = len(audio) // frame_samples
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[: n_frames * frame_samples].reshape(n_frames, frame_samples)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Start (inclusive) and end (exclusive) indices of the True runs in `mask`."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _bridge(starts: np.ndarray, ends: np.ndarray, min_gap: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Merges runs separated by fewer than `min_gap` units."""
+    if len(starts) <= 1:
+        return starts, ends
+    keep_gap = (starts[1:] - ends[:-1]) >= min_gap
+    return starts[np.concatenate(([True], keep_gap))], ends[np.concatenate((keep_gap, [True]))]
+
+
+def detect_speech(
+    audio: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    margin_db: float = VAD_MARGIN_DB,
+    min_speech_ms: int = VAD_MIN_SPEECH_MS,
+    min_silence_ms: int = VAD_MIN_SILENCE_MS,
+    pad_ms: int = VAD_PAD_MS,
+) -> List[Tuple[int, int]]:
+    """Speech regions of `audio` as (start_sample, end_sample) pairs."""
+    frame_samples = sample_rate * FRAME_MS // 1000
+    energy = frame_energy_db(audio, frame_samples)
+    if len(energy) == 0:
+        return []
+
+    noise_floor = np.percentile(energy, 10)
+    if np.percentile(energy, 90) - noise_floor < margin_db:
+        # no quiet stretches to learn a noise floor from: all speech or all silence
+        return [(0, len(audio))] if np.median(energy) > ABSOLUTE_FLOOR_DB else []
+    threshold = max(noise_floor + margin_db, ABSOLUTE_FLOOR_DB)
+    starts, ends = _runs(energy > threshold)
+
+    starts, ends = _bridge(starts, ends, max(1, min_silence_ms // FRAME_MS))
+    long_enough = (ends - starts) >= max(1, min_speech_ms // FRAME_MS)
+    starts, ends = starts[long_enough], ends[long_enough]
+    if len(starts) == 0:
+        return []
+
+    pad = pad_ms // FRAME_MS
+    starts = np.maximum(starts - pad, 0) * frame_samples
+    ends = np.minimum((ends + pad) * frame_samples, len(audio))
+    # padding can make neighbours touch
+    starts, ends = _bridge(starts, ends, 1)
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+class TimeMap:
+    """Maps times in the joined speech-only audio back to the original recording."""
+
+    def __init__(self, regions: List[Tuple[int, int]], gap_samples: int, sample_rate: int):
+        self.sample_rate = sample_rate
+        compact_starts = []
+        position = 0
+        for start, end in regions:
+            compact_starts.append(position)
+            position += (end - start) + gap_samples
+        self._compact_starts = np.array(compact_starts, dtype=np.int64)
+        self._original_starts = np.array([start for start, _ in regions], dtype=np.int64)
+        self._lengths = np.array([end - start for start, end in regions], dtype=np.int64)
+
+    def to_original(self, seconds: float) -> float:
+        sample = int(round(seconds * self.sample_rate))
+        i = max(0, int(np.searchsorted(self._compact_starts, sample, side="right")) - 1)
+        # times inside the inserted gap collapse onto the end of the region before it
+        offset = min(sample - self._compact_starts[i], self._lengths[i])
+        return round(float(self._original_starts[i] + offset) / self.sample_rate, 3)
+
+
+def strip_silence(
+    audio: np.ndarray, sample_rate: int = SAMPLE_RATE
+) -> Tuple[np.ndarray, TimeMap, float]:
+    """
+    Returns (speech-only audio, TimeMap back to `audio`, seconds of speech).
+    The speech audio is empty when no speech was found.
+    """
+    regions = detect_speech(audio, sample_rate)
+    gap_samples = int(JOIN_GAP_SECONDS * sample_rate)
+    time_map = TimeMap(regions, gap_samples, sample_rate)
+    if not regions:
+        return np.zeros(0, dtype=np.float32), time_map, 0.0
+
+    gap = np.zeros(gap_samples, dtype=audio.dtype)
+    pieces = []
+    for start, end in regions:
+        pieces.append(audio[start:end])
+        pieces.append(gap)
+    speech_samples = sum(end - start for start, end in regions)
+    return np.concatenate(pieces[:-1]), time_map, speech_samples / sample_rate
+
+
+def remap_segments(segments: List[Dict[str, Any]], time_map: TimeMap) -> List[Dict[str, Any]]:
+    """Copies `segments` with start/end moved onto the original timeline."""
+    return [
+        {**segment, "start": time_map.to_original(segment["start"]), "end": time_map.to_original(segment["end"])}
+        for segment in segments
+    ]
@@ -0,0 +1,127 @@
+"""
+Process-wide cache of loaded Whisper models.
+
+Models are loaded by the deployment's transcription backend (see
+`transcription_backends`), so the cache holds whatever that backend returns.
+
+Loading a Whisper checkpoint takes seconds and hundreds of MB, so each model
+name is loaded once per worker process and kept around. The number of models
+held at the same time is capped; the least recently used one is dropped when
+a client asks for yet another size. The cap is raised to hold every preloaded
+model, so the models a worker warms at startup never evict each other.
+
+Configuration (environment):
+    WHISPER_MODEL_CACHE_SIZE  max models kept in memory (default 2)
+    WHISPER_PRELOAD_MODELS    comma separated names to load at startup, e.g. "base.en,tiny.en"
+"""
+import importlib.util
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+from transcription_backends import backend
+
+logger = logging.getLogger(__name__)
+
+WHISPER_MODEL_CACHE_SIZE = int(os.getenv("WHISPER_MODEL_CACHE_SIZE", "2"))
+WHISPER_PRELOAD_MODELS = [
+    name.strip()
+    for name in os.getenv("WHISPER_PRELOAD_MODELS", "").split(",")
+    if name.strip()
+]
+# whether the backend's package is installed, found without importing it (that pulls in torch)
+WHISPER_AVAILABLE = importlib.util.find_spec(backend.module) is not None
+
+# CPU real-time factors (processing seconds per audio second) assumed for a
+# model until its speed has been measured; rough figures, relative to each other
+RTF_PRIORS = {
+    "tiny.en": 0.08,
+    "tiny": 0.08,
+    "base.en": 0.15,
+    "base": 0.15,
+    "small.en": 0.45,
+    "small": 0.45,
+    "medium.en": 1.3,
+    "medium": 1.3,
+}
+
+
+class WhisperModelRegistry:
+    """Thread-safe LRU cache of `whisper.load_model()` results keyed by model name."""
+
+    def __init__(self, max_models: int = WHISPER_MODEL_CACHE_SIZE):
+        self.max_models = max(1, max_models)
+        self._models: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        # one lock per model name so two requests for the same cold model
+        # load it once, while different models can still load in parallel
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, name: str):
+        """
+        Returns the loaded model for `name`, loading it on first use.
+        Raises ImportError if whisper is not installed.
+        """
+        with self._lock:
+            model = self._models.get(name)
+            if model is not None:
+                self._models.move_to_end(name)
+                return model
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        with load_lock:
+            # another thread may have finished loading while we waited
+            with self._lock:
+                model = self._models.get(name)
+                if model is not None:
+                    self._models.move_to_end(name)
+                    return model
+
+            model = self._load(name)
+
+            with self._lock:
+                self._models[name] = model
+                self._models.move_to_end(name)
+                while len(self._models) > self.max_models:
+                    evicted, _ = self._models.popitem(last=False)
+                    logger.info(f"Evicted Whisper model '{evicted}' from cache")
+            return model
+
+    def preload(self, names: Iterable[str]) -> None:
+        """Loads each model in `names`, growing the cache to hold them all; failures are logged, not raised."""
+        names = list(dict.fromkeys(names))
+        self.max_models = max(self.max_models, len(names))
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.warning(f"Failed to preload Whisper model '{name}': {e}")
+
+    def loaded_models(self) -> List[str]:
+        """Names of the models currently held, least recently used first."""
+        with self._lock:
+            return list(self._models.keys())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+    @staticmethod
+    def _load(name: str):
+        logger.info(f"Loading Whisper model '{name}' with {backend.name}...")
+        started = time.perf_counter()
+        # This will download the model on first use (~150MB for base.en)
+        model = backend.load(name)
+        logger.info(f"Whisper model '{name}' loaded in {time.perf_counter() - started:.2f}s")
+        return model
+
+
+registry = WhisperModelRegistry()
+
+
+def get_model(name: str):
+    """Returns the cached Whisper model for `name` from the process-wide registry."""
+    return registry.get(name)